@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import statistics
+
+from main import BibliotecaApp, convertir_instantaneas
+
+# Generador de datos sintéticos y medición de tiempos de BibliotecaApp.
+#
+# Uso:
+#   python benchmark.py --escalas 10000 100000 1000000 --salida resultados.json
+#   python benchmark.py --escalas 10000 --comparar resultados.json
+#
+# Cada escala N genera N libros, N préstamos y N/10 usuarios (se puede
+# cambiar con --usuarios, --libros y --prestamos).
+
+NOMBRES = ["Ana", "Luis", "María", "José", "Carmen", "Javier", "Lucía", "Pablo", "Elena", "Andrés"]
+APELLIDOS = ["García", "Fernández", "López", "Martínez", "Sánchez", "Pérez", "Gómez", "Ruiz", "Díaz", "Moreno"]
+PALABRAS = ["sombra", "viento", "ciudad", "memoria", "camino", "noche", "mar", "jardín", "silencio",
+            "fuego", "río", "tiempo", "casa", "luz", "libro", "invierno", "isla", "puerta", "espejo", "sueño"]
+
+def generar_datos(directorio, usuarios, libros, prestamos, activos=0.1, semilla=42):
+    # Escribe en `directorio` los archivos de datos en el formato de la
+    # aplicación. Con la misma semilla se obtienen siempre los mismos datos.
+    rnd = random.Random(semilla)
+    os.makedirs(directorio, exist_ok=True)
+    
+    with open(os.path.join(directorio, "usuarios.json"), "w", encoding="utf-8") as f:
+        json.dump([{
+            "id": i,
+            "nombre": f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+            "email": f"usuario{i}@biblioteca.test",
+            "telefono": f"6{rnd.randrange(10 ** 8):08d}"
+        } for i in range(1, usuarios + 1)], f, ensure_ascii=False)
+    
+    # Los préstamos activos usan libros distintos, que quedan no disponibles
+    num_activos = min(int(prestamos * activos), libros)
+    prestados = rnd.sample(range(1, libros + 1), num_activos)
+    no_disponibles = set(prestados)
+    
+    autores = [f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}" for _ in range(max(1, libros // 20))]
+    with open(os.path.join(directorio, "libros.json"), "w", encoding="utf-8") as f:
+        json.dump([{
+            "id": i,
+            "titulo": " ".join(rnd.choice(PALABRAS) for _ in range(rnd.randint(2, 5))).capitalize(),
+            "autor": rnd.choice(autores),
+            # Las últimas cifras son el ID para que los ISBN no se repitan
+            "isbn": f"978{rnd.randrange(10 ** 10) // 10 ** 7 * 10 ** 7 + i:010d}",
+            "descripcion": " ".join(rnd.choice(PALABRAS) for _ in range(30)),
+            "disponible": i not in no_disponibles
+        } for i in range(1, libros + 1)], f, ensure_ascii=False)
+    
+    # Los préstamos activos empezaron en el último mes: con el plazo de 14
+    # días, aproximadamente la mitad están vencidos
+    hoy = datetime.date.today().toordinal()
+    with open(os.path.join(directorio, "prestamos.jsonl"), "w", encoding="utf-8") as f:
+        for i in range(1, prestamos + 1):
+            devuelto = i > num_activos
+            inicio = hoy - rnd.randrange(5 * 365 if devuelto else 30)
+            f.write(json.dumps({
+                "id": i,
+                "usuario_id": rnd.randint(1, usuarios),
+                "libro_id": rnd.randint(1, libros) if devuelto else prestados[i - 1],
+                "fecha_prestamo": datetime.date.fromordinal(inicio).strftime("%Y-%m-%d"),
+                "fecha_devolucion": datetime.date.fromordinal(inicio + rnd.randint(1, 60)).strftime("%Y-%m-%d") if devuelto else None,
+                "devuelto": devuelto,
+                "fecha_vencimiento": datetime.date.fromordinal(inicio + 14).strftime("%Y-%m-%d")
+            }, separators=(",", ":")) + "\n")
+    
+    with open(os.path.join(directorio, "contadores.json"), "w") as f:
+        json.dump({"usuario_id": usuarios, "libro_id": libros, "prestamo_id": prestamos}, f)
+
+# Valor que devuelve una operación medida cuando no pudo hacer nada en esa
+# repetición (por ejemplo, no quedan libros disponibles que prestar)
+OMITIDA = object()
+
+def medir(funcion, repeticiones):
+    # Ejecuta la función varias veces y devuelve los tiempos en milisegundos.
+    # Las repeticiones omitidas no cuentan; si lo son todas, no hay tiempos.
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        if funcion() is not OMITIDA:
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    if not tiempos:
+        return {"repeticiones": 0}
+    return {
+        "min_ms": min(tiempos),
+        "media_ms": statistics.mean(tiempos),
+        "max_ms": max(tiempos),
+        "repeticiones": len(tiempos)
+    }
+
+def ejecutar_escala(usuarios, libros, prestamos, args):
+    directorio = tempfile.mkdtemp(prefix="biblioteca_bench_")
+    datos = os.path.join(directorio, "data")
+    try:
+        print(f"Generando {usuarios} usuarios, {libros} libros y {prestamos} préstamos...", file=sys.stderr)
+        generar_datos(datos, usuarios, libros, prestamos, args.activos, args.semilla)
+        if args.formato != "json" or args.descripciones_en_disco:
+            convertir_instantaneas(datos, args.formato, args.descripciones_en_disco)
+        
+        resultados = {}
+        app = None
+        
+        def arrancar():
+            nonlocal app
+            if app is not None:
+                app.cerrar()
+            app = BibliotecaApp(directorio=datos, almacenamiento=args.almacenamiento,
+                                historial_en_disco=args.historial_en_disco,
+                                descripciones_en_disco=args.descripciones_en_disco,
+                                ventana_guardado=args.ventana_guardado,
+                                operaciones_guardado=args.operaciones_guardado,
+                                formato=args.formato, procesos_carga=args.procesos_carga)
+        
+        print("Midiendo arranque...", file=sys.stderr)
+        resultados["arranque"] = medir(arrancar, args.repeticiones)
+        
+        rnd = random.Random(args.semilla)
+        
+        def buscador(metodo, palabras):
+            consultas = iter([rnd.choice(palabras)[:4].lower() for _ in range(args.repeticiones)])
+            return lambda: metodo(next(consultas))
+        
+        print("Midiendo búsquedas y listados...", file=sys.stderr)
+        # La primera búsqueda de libros construye el índice de trigramas
+        resultados["primera_busqueda_libro"] = medir(lambda: app.buscar_libro("sombra"), 1)
+        resultados["buscar_usuario"] = medir(buscador(app.buscar_usuario, APELLIDOS), args.repeticiones)
+        resultados["buscar_libro"] = medir(buscador(app.buscar_libro, PALABRAS), args.repeticiones)
+        resultados["buscar_prestamo"] = medir(buscador(app.buscar_prestamo, PALABRAS + NOMBRES), args.repeticiones)
+        isbns = iter([app.obtener_libro_por_id(rnd.randint(1, libros)).isbn for _ in range(args.repeticiones)])
+        resultados["obtener_libro_por_isbn"] = medir(lambda: app.obtener_libro_por_isbn(next(isbns)), args.repeticiones)
+        resultados["listar_prestamos_activos"] = medir(app.listar_prestamos_activos, args.repeticiones)
+        resultados["prestamos_vencidos"] = medir(app.prestamos_vencidos, args.repeticiones)
+        
+        # Informes de circulación desde cero (columnas incluidas)
+        def informes():
+            app.informes.invalidar()
+            app.prestamos_por_mes()
+            app.libros_mas_prestados()
+            app.autores_mas_prestados()
+            app.usuarios_mas_activos()
+            app.duracion_media_prestamos()
+        
+        print("Midiendo informes de circulación...", file=sys.stderr)
+        resultados["informes"] = medir(informes, args.repeticiones)
+        
+        # Préstamo y devolución alternados sobre libros disponibles para que
+        # el tamaño de los datos no cambie durante la medición
+        print("Midiendo préstamos y devoluciones...", file=sys.stderr)
+        # Los usuarios con préstamos vencidos no pueden pedir más
+        disponibles = iter(app.libros.filtrar(disponible=True))
+        al_dia = [id for id in range(1, usuarios + 1) if not app.tiene_vencidos(id)]
+        nuevos = []
+        
+        def prestar():
+            # Con pocos datos puede no haber usuarios al día (y entonces no
+            # se gasta ningún libro) o pueden acabarse los libros disponibles
+            if not al_dia:
+                return OMITIDA
+            libro = next(disponibles, None)
+            if libro is None:
+                return OMITIDA
+            prestamo = app.registrar_prestamo(rnd.choice(al_dia), libro.id)
+            if prestamo is None:
+                return OMITIDA
+            nuevos.append(prestamo)
+        
+        def devolver():
+            if not nuevos:
+                return OMITIDA
+            app.devolver_libro(nuevos.pop().id)
+        
+        resultados["registrar_prestamo"] = medir(prestar, args.repeticiones)
+        resultados["devolver_libro"] = medir(devolver, args.repeticiones)
+        
+        print("Midiendo guardado completo...", file=sys.stderr)
+        resultados["guardar_datos"] = medir(app.guardar_datos, args.repeticiones)
+        
+        app.cerrar()
+        return resultados
+    finally:
+        if not args.conservar:
+            shutil.rmtree(directorio, ignore_errors=True)
+        else:
+            print(f"Datos conservados en {datos}", file=sys.stderr)
+
+def comparar(actual, anterior):
+    # Muestra la variación de la media de cada operación respecto a una ejecución anterior
+    previas = {e["escala"]: e["operaciones"] for e in anterior["escalas"]}
+    for escala in actual["escalas"]:
+        base = previas.get(escala["escala"])
+        if base is None:
+            continue
+        print(f"\nEscala {escala['escala']}:")
+        for operacion, medida in escala["operaciones"].items():
+            if "media_ms" in medida and "media_ms" in base.get(operacion, {}):
+                antes = base[operacion]["media_ms"]
+                ahora = medida["media_ms"]
+                cambio = (ahora / antes - 1) * 100 if antes else 0
+                print(f"  {operacion:<26} {antes:10.2f} ms -> {ahora:10.2f} ms ({cambio:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del Sistema de Gestión de Biblioteca")
+    parser.add_argument("--escalas", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="tamaños a medir (número de libros y de préstamos)")
+    parser.add_argument("--usuarios", type=int, help="número de usuarios (por defecto escala/10)")
+    parser.add_argument("--libros", type=int, help="número de libros (por defecto la escala)")
+    parser.add_argument("--prestamos", type=int, help="número de préstamos (por defecto la escala)")
+    parser.add_argument("--activos", type=float, default=0.1, help="proporción de préstamos sin devolver")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--almacenamiento", choices=BibliotecaApp.ALMACENAMIENTOS, default="json")
+    parser.add_argument("--historial-en-disco", action="store_true")
+    parser.add_argument("--descripciones-en-disco", action="store_true")
+    parser.add_argument("--formato", choices=["json", "binario"], default="json",
+                        help="formato de las instantáneas (los datos generados se convierten)")
+    parser.add_argument("--procesos-carga", type=int, metavar="N",
+                        help="procesos que decodifican las instantáneas JSON al arrancar")
+    parser.add_argument("--ventana-guardado", type=float, help="segundos del guardado agrupado")
+    parser.add_argument("--operaciones-guardado", type=int, default=1,
+                        help="operaciones por escritura del guardado agrupado (1 = sin agrupar)")
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="resultados JSON de una ejecución anterior")
+    parser.add_argument("--conservar", action="store_true", help="no borrar los datos generados")
+    args = parser.parse_args()
+    
+    resultado = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "almacenamiento": args.almacenamiento,
+        "historial_en_disco": args.historial_en_disco,
+        "descripciones_en_disco": args.descripciones_en_disco,
+        "formato": args.formato,
+        "procesos_carga": args.procesos_carga,
+        "ventana_guardado": args.ventana_guardado,
+        "operaciones_guardado": args.operaciones_guardado,
+        "activos": args.activos,
+        "semilla": args.semilla,
+        "escalas": []
+    }
+    
+    for escala in args.escalas:
+        usuarios = args.usuarios or max(1, escala // 10)
+        libros = args.libros or escala
+        prestamos = args.prestamos or escala
+        resultado["escalas"].append({
+            "escala": escala,
+            "usuarios": usuarios,
+            "libros": libros,
+            "prestamos": prestamos,
+            "operaciones": ejecutar_escala(usuarios, libros, prestamos, args)
+        })
+    
+    texto = json.dumps(resultado, indent=4, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+    
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            comparar(resultado, json.load(f))
+
+if __name__ == "__main__":
+    main()
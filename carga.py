@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import datetime
+import tempfile
+import subprocess
+import statistics
+
+import benchmark
+
+# Generador de carga para servidor.py: varios clientes concurrentes con
+# conexiones persistentes lanzan una mezcla de búsquedas, consultas,
+# préstamos y devoluciones, y se mide la latencia de cada tipo de petición.
+# Al final, muchos clientes intentan prestar a la vez los mismos libros para
+# comprobar que ninguno se presta dos veces.
+#
+# Uso:
+#   python carga.py --escala 10000 --clientes 16 --peticiones 5000
+#   python carga.py --url http://127.0.0.1:8080 --peticiones 20000
+#
+# Sin --url se generan datos sintéticos en un directorio temporal y se
+# arranca servidor.py sobre ellos.
+
+class Cliente:
+    # Cliente HTTP/1.1 mínimo sobre una conexión persistente
+    def __init__(self, host, puerto):
+        self.host = host
+        self.puerto = puerto
+        self.lector = None
+        self.escritor = None
+    
+    async def conectar(self):
+        self.lector, self.escritor = await asyncio.open_connection(self.host, self.puerto)
+    
+    async def pedir(self, metodo, ruta, datos=None):
+        cuerpo = json.dumps(datos).encode("utf-8") if datos is not None else b""
+        self.escritor.write(
+            f"{metodo} {ruta} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n\r\n".encode("latin-1") + cuerpo
+        )
+        await self.escritor.drain()
+        
+        estado = int((await self.lector.readline()).split()[1])
+        longitud = 0
+        while True:
+            linea = await self.lector.readline()
+            if linea in (b"\r\n", b""):
+                break
+            nombre, _, valor = linea.decode("latin-1").partition(":")
+            if nombre.lower() == "content-length":
+                longitud = int(valor)
+        respuesta = json.loads(await self.lector.readexactly(longitud)) if longitud else None
+        return estado, respuesta
+    
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+
+def resumir(latencias):
+    # Estadísticas de una lista de latencias en milisegundos
+    ordenadas = sorted(latencias)
+    def percentil(p):
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))]
+    return {
+        "peticiones": len(ordenadas),
+        "media_ms": statistics.mean(ordenadas),
+        "p50_ms": percentil(50),
+        "p95_ms": percentil(95),
+        "p99_ms": percentil(99),
+        "max_ms": ordenadas[-1]
+    }
+
+async def trabajador(cliente, restantes, estado, rnd, latencias, codigos):
+    # Cada cliente devuelve solo los préstamos que él mismo registró
+    propios = []
+    while restantes[0] > 0:
+        restantes[0] -= 1
+        tirada = rnd.random()
+        if tirada < 0.3:
+            tipo, metodo, ruta, datos = "buscar_libro", "GET", f"/libros?q={rnd.choice(benchmark.PALABRAS)[:4]}&limite=20", None
+        elif tirada < 0.45:
+            tipo, metodo, ruta, datos = "buscar_usuario", "GET", f"/usuarios?q={rnd.choice(benchmark.APELLIDOS)[:4]}&limite=20", None
+        elif tirada < 0.6:
+            tipo, metodo, ruta, datos = "obtener_libro", "GET", f"/libros/{rnd.randint(1, estado['libros'])}", None
+        elif tirada < 0.7:
+            tipo, metodo, ruta, datos = "prestamos_usuario", "GET", f"/usuarios/{rnd.randint(1, estado['usuarios'])}/prestamos", None
+        elif tirada < 0.85 or not propios:
+            tipo, metodo, ruta = "prestar", "POST", "/prestamos"
+            datos = {"usuario_id": rnd.randint(1, estado["usuarios"]), "libro_id": rnd.randint(1, estado["libros"])}
+        else:
+            tipo, metodo, ruta, datos = "devolver", "POST", f"/prestamos/{propios.pop()}/devolucion", None
+        
+        inicio = time.perf_counter()
+        codigo, respuesta = await cliente.pedir(metodo, ruta, datos)
+        latencias.setdefault(tipo, []).append((time.perf_counter() - inicio) * 1000)
+        codigos[codigo] = codigos.get(codigo, 0) + 1
+        if tipo == "prestar" and codigo == 201:
+            propios.append(respuesta["id"])
+
+async def competir(host, puerto, libros, clientes):
+    # Todos los clientes piden a la vez el mismo libro; solo uno debe lograrlo
+    conexiones = [Cliente(host, puerto) for _ in range(clientes)]
+    await asyncio.gather(*(cliente.conectar() for cliente in conexiones))
+    dobles = 0
+    for libro_id in libros:
+        resultados = await asyncio.gather(*(
+            cliente.pedir("POST", "/prestamos", {"usuario_id": 1 + i, "libro_id": libro_id})
+            for i, cliente in enumerate(conexiones)
+        ))
+        aceptados = sum(1 for codigo, _ in resultados if codigo == 201)
+        if aceptados > 1:
+            dobles += 1
+    for cliente in conexiones:
+        cliente.cerrar()
+    return dobles
+
+async def ejecutar(host, puerto, args):
+    cliente = Cliente(host, puerto)
+    await cliente.conectar()
+    _, estado = await cliente.pedir("GET", "/estado")
+    
+    # Libros libres para la prueba de concurrencia, elegidos antes de la carga
+    _, libros = await cliente.pedir("GET", f"/libros?limite={estado['libros']}")
+    libres = [libro["id"] for libro in libros if libro["disponible"]]
+    competidos = random.Random(args.semilla).sample(libres, min(args.libros_competidos, len(libres)))
+    cliente.cerrar()
+    
+    clientes = [Cliente(host, puerto) for _ in range(args.clientes)]
+    await asyncio.gather(*(c.conectar() for c in clientes))
+    restantes = [args.peticiones]
+    latencias = {}
+    codigos = {}
+    
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        trabajador(c, restantes, estado, random.Random(args.semilla + i), latencias, codigos)
+        for i, c in enumerate(clientes)
+    ))
+    segundos = time.perf_counter() - inicio
+    for c in clientes:
+        c.cerrar()
+    
+    # Los préstamos de la fase anterior pueden haber ocupado algún libro
+    # elegido; eso no afecta a la comprobación (ninguno debe aceptarse dos veces)
+    dobles = await competir(host, puerto, competidos, args.clientes)
+    
+    todas = [ms for lista in latencias.values() for ms in lista]
+    return {
+        "clientes": args.clientes,
+        "peticiones": args.peticiones,
+        "segundos": segundos,
+        "peticiones_por_segundo": args.peticiones / segundos if segundos > 0 else 0,
+        "codigos": {str(codigo): cantidad for codigo, cantidad in sorted(codigos.items())},
+        "latencia": resumir(todas),
+        "latencia_por_tipo": {tipo: resumir(lista) for tipo, lista in sorted(latencias.items())},
+        "libros_competidos": len(competidos),
+        "libros_prestados_dos_veces": dobles
+    }
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def esperar_puerto(host, puerto, proceso, segundos=300):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("el servidor terminó antes de aceptar conexiones")
+        try:
+            with socket.create_connection((host, puerto), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("el servidor no respondió a tiempo")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga para servidor.py")
+    parser.add_argument("--url", help="servidor ya en marcha (por defecto se arranca uno con datos sintéticos)")
+    parser.add_argument("--escala", type=int, default=10000, help="libros y préstamos de los datos sintéticos")
+    parser.add_argument("--almacenamiento", default="json", help="almacenamiento del servidor arrancado")
+    parser.add_argument("--clientes", type=int, default=16, help="conexiones concurrentes")
+    parser.add_argument("--peticiones", type=int, default=5000)
+    parser.add_argument("--libros-competidos", type=int, default=20,
+                        help="libros que todos los clientes intentan prestar a la vez")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+    
+    proceso = None
+    directorio = None
+    if args.url:
+        direccion = args.url.split("://", 1)[-1].rstrip("/")
+        host, _, puerto = direccion.partition(":")
+        puerto = int(puerto or 80)
+    else:
+        directorio = tempfile.mkdtemp(prefix="biblioteca_carga_")
+        datos = os.path.join(directorio, "data")
+        print(f"Generando datos de escala {args.escala}...", file=sys.stderr)
+        benchmark.generar_datos(datos, max(1, args.escala // 10), args.escala, args.escala, semilla=args.semilla)
+        host, puerto = "127.0.0.1", puerto_libre()
+        servidor = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor.py")
+        proceso = subprocess.Popen([sys.executable, servidor, "--datos", datos, "--puerto", str(puerto),
+                                    "--almacenamiento", args.almacenamiento], stdout=subprocess.DEVNULL)
+    
+    try:
+        if proceso is not None:
+            print("Esperando al servidor...", file=sys.stderr)
+            esperar_puerto(host, puerto, proceso)
+        print(f"Lanzando {args.peticiones} peticiones con {args.clientes} clientes...", file=sys.stderr)
+        resultado = asyncio.run(ejecutar(host, puerto, args))
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+        if directorio is not None:
+            shutil.rmtree(directorio, ignore_errors=True)
+    
+    resultado["fecha"] = datetime.datetime.now().isoformat(timespec="seconds")
+    texto = json.dumps(resultado, indent=4, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+    if resultado["libros_prestados_dos_veces"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
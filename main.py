@@ -1,12 +1,106 @@
+import io
 import os
+import array
+import sys
+import csv
 import json
+import re
+import shlex
+import time
+import types
+import bisect
+import heapq
+import marshal
+import mmap
+import operator
+import inspect
+import functools
+import contextlib
+import collections
+import sqlite3
+import argparse
+import itertools
+import concurrent.futures
 import datetime
+import unicodedata
 
-# Clases para representar las entidades
+# Bloqueo de archivos entre procesos: fcntl en POSIX, msvcrt en Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Conversión entre fechas "%Y-%m-%d" y ordinales de día. Las cachés hacen
+# que todos los préstamos de un mismo día compartan el mismo objeto int.
+@functools.lru_cache(maxsize=None)
+def ordinal_de_fecha(fecha):
+    return datetime.datetime.strptime(fecha, "%Y-%m-%d").toordinal()
+
+@functools.lru_cache(maxsize=None)
+def fecha_de_ordinal(ordinal):
+    return datetime.date.fromordinal(ordinal).strftime("%Y-%m-%d")
+
+def convertir_fecha(fecha, estricta=False):
+    # Las fechas válidas se guardan como ordinal; cualquier otro valor
+    # (None o texto con otro formato en datos antiguos) se conserva tal cual.
+    # estricta: para las fechas que introduce el usuario; lanza ValueError
+    # si no son una fecha YYYY-MM-DD.
+    if isinstance(fecha, str):
+        try:
+            return ordinal_de_fecha(fecha)
+        except ValueError:
+            if estricta:
+                raise ValueError(f"Fecha no válida: {fecha} (YYYY-MM-DD).") from None
+    elif estricta and fecha is not None:
+        raise ValueError(f"Fecha no válida: {fecha} (YYYY-MM-DD).")
+    return fecha
+
+# Normalización de los textos de búsqueda: minúsculas (casefold) y sin
+# diacríticos, para que "garcia" encuentre "García". Los textos ASCII solo
+# necesitan lower(); las letras latinas acentuadas se sustituyen con una
+# tabla precalculada y solo lo que quede fuera de ASCII pasa por unicodedata.
+def quitar_diacriticos(texto):
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(caracter for caracter in descompuesto if not unicodedata.combining(caracter))
+
+DIACRITICOS = {codigo: quitar_diacriticos(chr(codigo)) for codigo in range(0x80, 0x250)
+               if quitar_diacriticos(chr(codigo)) != chr(codigo)}
+
+def normalizar_texto(texto):
+    if not texto:
+        return ""
+    if texto.isascii():
+        return texto.lower()
+    texto = texto.casefold().translate(DIACRITICOS)
+    return texto if texto.isascii() else quitar_diacriticos(texto)
+
+def texto_busqueda(campos):
+    # Clave de búsqueda de una entidad: sus campos normalizados, cada uno
+    # entre saltos de línea ("\ncampo1\ncampo2\n"), de modo que una
+    # coincidencia de campo completo o de principio de campo es una subcadena
+    return "\n" + "\n".join(normalizar_texto(campo) for campo in campos) + "\n"
+
+# Claves de los índices únicos: dos ISBN o dos emails que solo se
+# diferencian en guiones, espacios o mayúsculas son el mismo. None si el
+# campo está vacío (no se indexa).
+def normalizar_isbn(isbn):
+    isbn = re.sub(r"[\s-]", "", str(isbn or "")).upper()
+    return isbn or None
+
+def normalizar_email(email):
+    email = str(email or "").strip().lower()
+    return email or None
+
+# Clases para representar las entidades. Usan __slots__ para no crear un
+# __dict__ por instancia, lo que reduce mucho la memoria con millones de registros.
 class Usuario:
+    # baja: el usuario se dio de baja pero se conserva para que sus
+    # préstamos sigan teniendo a quién referirse (ver BibliotecaApp.eliminar_usuario)
+    __slots__ = ("id", "nombre", "email", "telefono", "baja")
     ultimo_id = 0
     
-    def __init__(self, id=None, nombre="", email="", telefono=""):
+    def __init__(self, id=None, nombre="", email="", telefono="", baja=False):
         if id is None:
             Usuario.ultimo_id += 1
             self.id = Usuario.ultimo_id
@@ -19,16 +113,31 @@ class Usuario:
         self.nombre = nombre
         self.email = email
         self.telefono = telefono
+        self.baja = baja
+    
+    def completar(self):
+        # Instantáneas binarias anteriores a las bajas
+        self.baja = False
     
     def __str__(self):
-        return f"ID: {self.id} | Nombre: {self.nombre} | Email: {self.email} | Teléfono: {self.telefono}"
+        baja = " | Dado de baja" if self.baja else ""
+        return f"ID: {self.id} | Nombre: {self.nombre} | Email: {self.email} | Teléfono: {self.telefono}{baja}"
+    
+    def campos_busqueda(self):
+        # Los usuarios dados de baja no aparecen en las búsquedas
+        return [] if self.baja else [self.nombre, self.email, str(self.id), self.telefono]
+    
+    def clave_email(self):
+        # Clave del índice único de emails; el de un usuario dado de baja queda libre
+        return None if self.baja else normalizar_email(self.email)
     
     def to_dict(self):
         return {
             "id": self.id,
             "nombre": self.nombre,
             "email": self.email,
-            "telefono": self.telefono
+            "telefono": self.telefono,
+            "baja": self.baja
         }
     
     @classmethod
@@ -37,13 +146,30 @@ class Usuario:
             id=data.get("id"),
             nombre=data.get("nombre"),
             email=data.get("email"),
-            telefono=data.get("telefono")
+            telefono=data.get("telefono"),
+            baja=data.get("baja", False)
         )
 
+# Texto guardado en un ArchivoTextos (por ejemplo, la descripción de un
+# libro). Solo ocupa una referencia y una posición; el texto se lee del
+# archivo cada vez que se pide.
+class TextoDiferido:
+    __slots__ = ("archivo", "posicion")
+    
+    def __init__(self, archivo, posicion):
+        self.archivo = archivo
+        self.posicion = posicion
+    
+    def leer(self):
+        return self.archivo.leer(self.posicion)
+
 class Libro:
+    # La descripción puede ser un texto o un TextoDiferido (ver
+    # AlmacenamientoJSON con descripciones_en_disco). baja: como en Usuario.
+    __slots__ = ("id", "titulo", "_autor", "isbn", "_descripcion", "disponible", "baja")
     ultimo_id = 0
     
-    def __init__(self, id=None, titulo="", autor="", isbn="", descripcion="", disponible=True):
+    def __init__(self, id=None, titulo="", autor="", isbn="", descripcion="", disponible=True, baja=False):
         if id is None:
             Libro.ultimo_id += 1
             self.id = Libro.ultimo_id
@@ -58,19 +184,61 @@ class Libro:
         self.isbn = isbn
         self.descripcion = descripcion
         self.disponible = disponible
+        self.baja = baja
+    
+    def completar(self):
+        # Instantáneas binarias anteriores a las bajas
+        self.baja = False
+    
+    @property
+    def autor(self):
+        return self._autor
+    
+    @autor.setter
+    def autor(self, autor):
+        # Muchos libros comparten autor: se guarda una única copia del texto
+        self._autor = sys.intern(autor) if isinstance(autor, str) else autor
+    
+    @property
+    def descripcion(self):
+        descripcion = self._descripcion
+        return descripcion.leer() if isinstance(descripcion, TextoDiferido) else descripcion
+    
+    @descripcion.setter
+    def descripcion(self, descripcion):
+        # Si el texto no cambia, la descripción sigue en disco
+        actual = getattr(self, "_descripcion", None)
+        if isinstance(actual, TextoDiferido) and actual.leer() == descripcion:
+            return
+        self._descripcion = descripcion
     
     def __str__(self):
-        estado = "Disponible" if self.disponible else "Prestado"
+        estado = "Dado de baja" if self.baja else "Disponible" if self.disponible else "Prestado"
         return f"ID: {self.id} | Título: {self.titulo} | Autor: {self.autor} | ISBN: {self.isbn} | Estado: {estado}"
     
-    def to_dict(self):
+    def campos_busqueda(self):
+        # Los libros dados de baja no aparecen en las búsquedas
+        return [] if self.baja else [self.titulo, self.autor, str(self.id), self.isbn]
+    
+    def clave_isbn(self):
+        # Clave del índice único de ISBN; el de un libro dado de baja queda libre
+        return None if self.baja else normalizar_isbn(self.isbn)
+    
+    def to_dict(self, posiciones=False):
+        # posiciones: una descripción en disco se representa por su posición
+        # ("descripcion_pos") en lugar de leerla
+        if posiciones and isinstance(self._descripcion, TextoDiferido):
+            descripcion = ("descripcion_pos", self._descripcion.posicion)
+        else:
+            descripcion = ("descripcion", self.descripcion)
         return {
             "id": self.id,
             "titulo": self.titulo,
             "autor": self.autor,
             "isbn": self.isbn,
-            "descripcion": self.descripcion,
-            "disponible": self.disponible
+            descripcion[0]: descripcion[1],
+            "disponible": self.disponible,
+            "baja": self.baja
         }
     
     @classmethod
@@ -81,13 +249,22 @@ class Libro:
             autor=data.get("autor"),
             isbn=data.get("isbn"),
             descripcion=data.get("descripcion"),
-            disponible=data.get("disponible", True)
+            disponible=data.get("disponible", True),
+            baja=data.get("baja", False)
         )
 
 class Prestamo:
+    # Las fechas se guardan como ordinales de día (int) y se exponen como
+    # texto "%Y-%m-%d" a través de las propiedades fecha_prestamo,
+    # fecha_devolucion y fecha_vencimiento
+    __slots__ = ("id", "usuario_id", "libro_id", "dia_prestamo", "dia_devolucion", "devuelto", "dia_vencimiento")
     ultimo_id = 0
+    # Plazo de préstamo en días. Se usa para los préstamos nuevos y para
+    # los de datos antiguos que no tienen fecha de vencimiento.
+    dias_prestamo = 14
     
-    def __init__(self, id=None, usuario_id=None, libro_id=None, fecha_prestamo=None, fecha_devolucion=None, devuelto=False):
+    def __init__(self, id=None, usuario_id=None, libro_id=None, fecha_prestamo=None, fecha_devolucion=None, devuelto=False,
+                 fecha_vencimiento=None):
         if id is None:
             Prestamo.ultimo_id += 1
             self.id = Prestamo.ultimo_id
@@ -99,14 +276,56 @@ class Prestamo:
         
         self.usuario_id = usuario_id
         self.libro_id = libro_id
-        self.fecha_prestamo = fecha_prestamo if fecha_prestamo else datetime.datetime.now().strftime("%Y-%m-%d")
-        self.fecha_devolucion = fecha_devolucion
+        self.dia_prestamo = convertir_fecha(fecha_prestamo) if fecha_prestamo else datetime.date.today().toordinal()
+        self.dia_devolucion = convertir_fecha(fecha_devolucion)
         self.devuelto = devuelto
+        if fecha_vencimiento:
+            self.dia_vencimiento = convertir_fecha(fecha_vencimiento)
+        else:
+            self.completar()
+    
+    def completar(self):
+        # Vencimiento por defecto: fecha de préstamo más el plazo. También
+        # se usa al leer instantáneas binarias anteriores a las fechas de vencimiento.
+        dia = self.dia_prestamo
+        self.dia_vencimiento = dia + Prestamo.dias_prestamo if isinstance(dia, int) else None
+    
+    @property
+    def fecha_prestamo(self):
+        dia = self.dia_prestamo
+        return fecha_de_ordinal(dia) if isinstance(dia, int) else dia
+    
+    @fecha_prestamo.setter
+    def fecha_prestamo(self, fecha):
+        self.dia_prestamo = convertir_fecha(fecha)
+    
+    @property
+    def fecha_devolucion(self):
+        dia = self.dia_devolucion
+        return fecha_de_ordinal(dia) if isinstance(dia, int) else dia
+    
+    @fecha_devolucion.setter
+    def fecha_devolucion(self, fecha):
+        self.dia_devolucion = convertir_fecha(fecha)
+    
+    @property
+    def fecha_vencimiento(self):
+        dia = self.dia_vencimiento
+        return fecha_de_ordinal(dia) if isinstance(dia, int) else dia
+    
+    @fecha_vencimiento.setter
+    def fecha_vencimiento(self, fecha):
+        self.dia_vencimiento = convertir_fecha(fecha)
+    
+    def vencido(self, hoy=None):
+        # Préstamo sin devolver cuya fecha de vencimiento ya pasó
+        hoy = hoy or datetime.date.today().toordinal()
+        return not self.devuelto and isinstance(self.dia_vencimiento, int) and self.dia_vencimiento < hoy
     
     def __str__(self):
         estado = "Devuelto" if self.devuelto else "Prestado"
         fecha_dev = self.fecha_devolucion if self.fecha_devolucion else "Pendiente"
-        return f"ID: {self.id} | Usuario ID: {self.usuario_id} | Libro ID: {self.libro_id} | Fecha préstamo: {self.fecha_prestamo} | Fecha devolución: {fecha_dev} | Estado: {estado}"
+        return f"ID: {self.id} | Usuario ID: {self.usuario_id} | Libro ID: {self.libro_id} | Fecha préstamo: {self.fecha_prestamo} | Vence: {self.fecha_vencimiento} | Fecha devolución: {fecha_dev} | Estado: {estado}"
     
     def to_dict(self):
         return {
@@ -115,7 +334,8 @@ class Prestamo:
             "libro_id": self.libro_id,
             "fecha_prestamo": self.fecha_prestamo,
             "fecha_devolucion": self.fecha_devolucion,
-            "devuelto": self.devuelto
+            "devuelto": self.devuelto,
+            "fecha_vencimiento": self.fecha_vencimiento
         }
     
     @classmethod
@@ -126,193 +346,2761 @@ class Prestamo:
             libro_id=data.get("libro_id"),
             fecha_prestamo=data.get("fecha_prestamo"),
             fecha_devolucion=data.get("fecha_devolucion"),
-            devuelto=data.get("devuelto", False)
+            devuelto=data.get("devuelto", False),
+            fecha_vencimiento=data.get("fecha_vencimiento")
         )
 
-# Clase principal de la aplicación
-class BibliotecaApp:
+# Índice secundario: agrupa las entidades por una clave calculada.
+# Si la función de clave devuelve None la entidad no se indexa.
+# atributos: campos de la entidad de los que depende la clave; al
+# actualizar otros campos el repositorio no toca el índice (None: se
+# actualiza siempre).
+class IndiceHash:
+    def __init__(self, clave, atributos=None):
+        self.clave = clave
+        self.atributos = atributos
+        self.grupos = {}
+    
+    def agregar(self, entidad):
+        clave = self.clave(entidad)
+        if clave is not None:
+            self.grupos.setdefault(clave, {})[entidad.id] = entidad
+    
+    def quitar(self, entidad):
+        clave = self.clave(entidad)
+        grupo = self.grupos.get(clave)
+        if grupo is not None:
+            grupo.pop(entidad.id, None)
+            if not grupo:
+                del self.grupos[clave]
+    
+    def reconstruir(self, entidades):
+        self.grupos = {}
+        for entidad in entidades:
+            self.agregar(entidad)
+    
+    def obtener(self, clave):
+        return list(self.grupos.get(clave, {}).values())
+    
+    def contiene(self, clave):
+        return clave in self.grupos
+
+# Variante de IndiceHash para claves que casi nunca se repiten (ISBN,
+# email): guarda directamente la entidad de cada clave en lugar de un
+# grupo, que solo se crea si varias la comparten (datos anteriores a la
+# comprobación de duplicados o con duplicados permitidos)
+class IndiceClave(IndiceHash):
+    def agregar(self, entidad):
+        clave = self.clave(entidad)
+        if clave is None:
+            return
+        actual = self.grupos.get(clave)
+        if actual is None or (not isinstance(actual, dict) and actual.id == entidad.id):
+            self.grupos[clave] = entidad
+        elif isinstance(actual, dict):
+            actual[entidad.id] = entidad
+        else:
+            self.grupos[clave] = {actual.id: actual, entidad.id: entidad}
+    
+    def quitar(self, entidad):
+        clave = self.clave(entidad)
+        actual = self.grupos.get(clave)
+        if isinstance(actual, dict):
+            actual.pop(entidad.id, None)
+            if len(actual) == 1:
+                self.grupos[clave] = next(iter(actual.values()))
+        elif actual is not None and actual.id == entidad.id:
+            del self.grupos[clave]
+    
+    def obtener(self, clave):
+        actual = self.grupos.get(clave)
+        if actual is None:
+            return []
+        return list(actual.values()) if isinstance(actual, dict) else [actual]
+
+# Variante de IndiceHash que solo guarda los IDs de cada grupo y obtiene
+# las entidades del repositorio al consultarlo. La usa RepositorioHistorial
+# para indexar también los préstamos archivados sin cargarlos en memoria.
+class IndiceIds(IndiceHash):
+    def __init__(self, clave, repositorio, atributos=None):
+        super().__init__(clave, atributos)
+        self.repositorio = repositorio
+    
+    def agregar(self, entidad):
+        clave = self.clave(entidad)
+        if clave is not None:
+            self.grupos.setdefault(clave, []).append(entidad.id)
+    
+    def quitar(self, entidad):
+        clave = self.clave(entidad)
+        grupo = self.grupos.get(clave)
+        if grupo is not None and entidad.id in grupo:
+            grupo.remove(entidad.id)
+            if not grupo:
+                del self.grupos[clave]
+    
+    def obtener(self, clave):
+        return [self.repositorio.obtener(id) for id in sorted(self.grupos.get(clave, ()))]
+
+# Índice de trigramas para búsquedas por subcadena. Devuelve exactamente
+# las mismas entidades que comprobar `termino in campo` en cada campo
+# normalizado, pero sin recorrer todo el repositorio en cada consulta.
+# Se construye en la primera búsqueda (hasta entonces no cuesta nada al
+# arrancar ni al modificar el repositorio) y cada trigrama guarda sus IDs
+# en un array de enteros de 32 bits. Los textos normalizados no se
+# guardan: se recalculan solo para los candidatos de cada búsqueda.
+# Quitar una entidad no recorre los arrays: sus IDs se quedan como entradas
+# obsoletas que la búsqueda descarta, y el índice se reconstruye cuando
+# llegan a ser tantas como las entidades.
+class IndiceTrigramas:
+    def __init__(self, campos, atributos=None):
+        # campos: función que devuelve la lista de textos buscables de una entidad
+        self.campos = campos
+        self.atributos = atributos
+        # Entidades del repositorio (una vista que refleja sus cambios) y
+        # trigramas construidos a partir de ellas (None: todavía no)
+        self.fuente = ()
+        self.trigramas = None
+        self.entidades = {}
+        self.obsoletas = 0
+    
+    @staticmethod
+    def trigramas_de(texto):
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+    
+    def trigramas_entidad(self, entidad):
+        # Los trigramas se sacan de cada campo por separado: los que cruzan
+        # de un campo a otro no pueden coincidir con un término
+        trigramas = set()
+        for campo in self.campos(entidad):
+            campo = normalizar_texto(campo)
+            trigramas.update(campo[i:i + 3] for i in range(len(campo) - 2))
+        return trigramas
+    
+    def construir(self):
+        # Las listas se llenan como listas de Python, más rápidas de ampliar,
+        # y se convierten a array al terminar
+        grupos = {}
+        entidades = {}
+        for entidad in self.fuente:
+            id = entidad.id
+            entidades[id] = entidad
+            for trigrama in self.trigramas_entidad(entidad):
+                grupo = grupos.get(trigrama)
+                if grupo is None:
+                    grupos[trigrama] = [id]
+                else:
+                    grupo.append(id)
+        self.trigramas = {trigrama: array.array("I", ids) for trigrama, ids in grupos.items()}
+        self.entidades = entidades
+        self.obsoletas = 0
+    
+    def agregar(self, entidad):
+        if self.trigramas is None:
+            return
+        self.entidades[entidad.id] = entidad
+        for trigrama in self.trigramas_entidad(entidad):
+            grupo = self.trigramas.get(trigrama)
+            if grupo is None:
+                self.trigramas[trigrama] = array.array("I", (entidad.id,))
+            else:
+                grupo.append(entidad.id)
+    
+    def quitar(self, entidad):
+        # Solo sale de las entidades; sus IDs en los arrays quedan obsoletos
+        if self.trigramas is None or self.entidades.pop(entidad.id, None) is None:
+            return
+        self.obsoletas += 1
+        if self.obsoletas > len(self.entidades) + 1000:
+            # Se construye de nuevo en la siguiente búsqueda
+            self.trigramas = None
+            self.entidades = {}
+    
+    def reconstruir(self, entidades):
+        # Se construye de nuevo en la siguiente búsqueda
+        self.fuente = entidades
+        self.trigramas = None
+        self.entidades = {}
+    
+    def buscar(self, termino, limite=None):
+        if self.trigramas is None:
+            self.construir()
+        termino = normalizar_texto(termino)
+        if len(termino) < 3:
+            # Términos demasiado cortos para el índice: se recorren todas las entidades
+            candidatos = self.entidades.keys()
+        else:
+            # Intersección de las listas de cada trigrama, empezando por la más corta
+            listas = []
+            for trigrama in self.trigramas_de(termino):
+                ids = self.trigramas.get(trigrama)
+                if not ids:
+                    return []
+                listas.append(ids)
+            listas.sort(key=len)
+            candidatos = set(listas[0]).intersection(*listas[1:])
+            if self.obsoletas:
+                # IDs de entidades quitadas (las que se actualizaron vuelven
+                # a estar en self.entidades con sus campos actuales)
+                candidatos.intersection_update(self.entidades.keys())
+        
+        # Los trigramas solo descartan candidatos: la clasificación confirma la subcadena
+        entidades = self.entidades
+        campos = self.campos
+        ids = clasificar(((id, texto_busqueda(campos(entidades[id]))) for id in candidatos), termino, limite)
+        return [entidades[id] for id in ids]
+
+# Niveles de coincidencia de una búsqueda, de mejor a peor: el término es
+# un campo completo (un ID, un ISBN, un email...), es el principio de un
+# campo, es el principio de una palabra o está en medio de una palabra
+EXACTA, PREFIJO, PALABRA, SUBCADENA = 4, 3, 2, 1
+
+def clasificar(candidatos, termino, limite=None):
+    # candidatos: pares (id, texto) con texto de texto_busqueda() y termino
+    # ya normalizado. Devuelve los IDs que contienen el término de mejor a
+    # peor nivel y, a igual nivel, por ID. Con limite solo se conservan los
+    # mejores con heapq en lugar de ordenar todos.
+    exacto, prefijo = f"\n{termino}\n", f"\n{termino}"
+    palabra = re.compile(r"\W" + re.escape(termino))
+    def puntuados():
+        for id, texto in candidatos:
+            if termino not in texto:
+                continue
+            if exacto in texto:
+                yield -EXACTA, id
+            elif prefijo in texto:
+                yield -PREFIJO, id
+            elif palabra.search(texto):
+                yield -PALABRA, id
+            else:
+                yield -SUBCADENA, id
+    ordenados = sorted(puntuados()) if limite is None else heapq.nsmallest(limite, puntuados())
+    return [id for _, id in ordenados]
+
+# Índice de los préstamos activos por fecha de vencimiento. Un montículo
+# ordena todos los vencimientos y otro por usuario da en O(log n) su
+# préstamo que vence antes. Las entradas que dejan de ser válidas (préstamo
+# devuelto, eliminado o con otra fecha) no se buscan dentro del montículo:
+# se descartan al llegar a la cima o al compactarlo.
+class IndiceVencimientos:
+    atributos = {"devuelto", "dia_vencimiento", "fecha_vencimiento", "usuario_id"}
+    
     def __init__(self):
-        self.usuarios = []
-        self.libros = []
-        self.prestamos = []
-        self.cargar_datos()
-        self.cargar_contadores()
+        # ID del préstamo -> (día de vencimiento, usuario, préstamo)
+        self.vencimientos = {}
+        self.monticulo = []
+        self.por_usuario = {}
     
-    # Métodos para cargar y guardar datos
-    def cargar_datos(self):
-        # Crear directorio de datos si no existe
-        if not os.path.exists("data"):
-            os.makedirs("data")
+    @staticmethod
+    def clave(prestamo):
+        dia = prestamo.dia_vencimiento
+        return dia if not prestamo.devuelto and isinstance(dia, int) else None
+    
+    def agregar(self, prestamo):
+        dia = self.clave(prestamo)
+        if dia is None:
+            return
+        self.vencimientos[prestamo.id] = (dia, prestamo.usuario_id, prestamo)
+        heapq.heappush(self.monticulo, (dia, prestamo.id))
+        heapq.heappush(self.por_usuario.setdefault(prestamo.usuario_id, []), (dia, prestamo.id))
+        # Demasiadas entradas obsoletas: se reconstruyen los montículos
+        if len(self.monticulo) > 2 * len(self.vencimientos) + 1000:
+            self.compactar()
+    
+    def quitar(self, prestamo):
+        self.vencimientos.pop(prestamo.id, None)
+    
+    def reconstruir(self, entidades):
+        self.vencimientos = {}
+        for prestamo in entidades:
+            dia = self.clave(prestamo)
+            if dia is not None:
+                self.vencimientos[prestamo.id] = (dia, prestamo.usuario_id, prestamo)
+        self.compactar()
+    
+    def compactar(self):
+        self.monticulo = []
+        self.por_usuario = {}
+        for id, (dia, usuario_id, _) in self.vencimientos.items():
+            self.monticulo.append((dia, id))
+            self.por_usuario.setdefault(usuario_id, []).append((dia, id))
+        heapq.heapify(self.monticulo)
+        for monticulo in self.por_usuario.values():
+            heapq.heapify(monticulo)
+    
+    def valida(self, entrada, usuario_id=None):
+        datos = self.vencimientos.get(entrada[1])
+        return datos is not None and datos[0] == entrada[0] and (usuario_id is None or datos[1] == usuario_id)
+    
+    def primer_vencimiento(self, usuario_id):
+        # Día de vencimiento más próximo de los préstamos activos del usuario
+        monticulo = self.por_usuario.get(usuario_id)
+        while monticulo and not self.valida(monticulo[0], usuario_id):
+            heapq.heappop(monticulo)
+        if not monticulo:
+            self.por_usuario.pop(usuario_id, None)
+            return None
+        return monticulo[0][0]
+    
+    def vencidos(self, hoy):
+        # Préstamos con vencimiento anterior a `hoy`, del más antiguo al más
+        # reciente. Solo se visitan las ramas del montículo que empiezan
+        # antes de `hoy`, así que el coste depende de los vencidos y no del total.
+        encontrados = {}
+        pendientes = [0]
+        while pendientes:
+            i = pendientes.pop()
+            if i < len(self.monticulo) and self.monticulo[i][0] < hoy:
+                if self.valida(self.monticulo[i]):
+                    encontrados[self.monticulo[i][1]] = self.monticulo[i][0]
+                pendientes += (2 * i + 1, 2 * i + 2)
+        return [self.vencimientos[id][2] for id in sorted(encontrados, key=lambda id: (encontrados[id], id))]
+
+# Índices de un repositorio cuya clave depende de alguno de los campos
+# que cambian en una actualización
+def indices_afectados(indices, campos):
+    return [indice for indice in indices.values()
+            if indice.atributos is None or not indice.atributos.isdisjoint(campos)]
+
+# Repositorio en memoria: mantiene las entidades indexadas por ID
+class Repositorio:
+    def __init__(self, entidades=None):
+        # Los diccionarios conservan el orden de inserción, así que el
+        # recorrido del repositorio sigue el mismo orden que la lista original
+        self.entidades = {}
+        self.indices = {}
+        self.maximo_id = 0
+        # IDs ordenados para recorrer por orden de ID (None: se calculan al pedirlos)
+        self.orden = None
+        if entidades is not None:
+            self.reemplazar(entidades)
+    
+    def __iter__(self):
+        return iter(self.entidades.values())
+    
+    def __len__(self):
+        return len(self.entidades)
+    
+    def __contains__(self, id):
+        return id in self.entidades
+    
+    def ids(self):
+        return iter(self.entidades)
+    
+    def ids_ordenados(self):
+        if self.orden is None:
+            self.orden = sorted(self.ids())
+        return self.orden
+    
+    def anotar_id(self, id):
+        # Mantiene la lista ordenada cuando aparece un ID. Los nuevos
+        # suelen ser el mayor, así que casi siempre basta con añadirlo.
+        orden = self.orden
+        if orden is None:
+            return
+        if not orden or id > orden[-1]:
+            orden.append(id)
+        else:
+            posicion = bisect.bisect_left(orden, id)
+            if posicion == len(orden) or orden[posicion] != id:
+                orden.insert(posicion, id)
+    
+    def olvidar_id(self, id):
+        # Quita de la lista ordenada un ID que ya no está en el repositorio
+        orden = self.orden
+        if orden is None or id in self:
+            return
+        posicion = bisect.bisect_left(orden, id)
+        if posicion < len(orden) and orden[posicion] == id:
+            del orden[posicion]
+    
+    def obtener(self, id):
+        return self.entidades.get(id)
+    
+    def agregar(self, entidad):
+        anterior = self.entidades.get(entidad.id)
+        if anterior is not None:
+            for indice in self.indices.values():
+                indice.quitar(anterior)
+        else:
+            self.anotar_id(entidad.id)
+        self.entidades[entidad.id] = entidad
+        if entidad.id > self.maximo_id:
+            self.maximo_id = entidad.id
+        for indice in self.indices.values():
+            indice.agregar(entidad)
+        return entidad
+    
+    def agregar_lote(self, entidades):
+        for entidad in entidades:
+            self.agregar(entidad)
+    
+    def actualizar(self, entidad, **campos):
+        # Los campos deben cambiarse a través del repositorio para que
+        # los índices secundarios se mantengan sincronizados
+        indices = indices_afectados(self.indices, campos)
+        for indice in indices:
+            indice.quitar(entidad)
+        for campo, valor in campos.items():
+            setattr(entidad, campo, valor)
+        for indice in indices:
+            indice.agregar(entidad)
+        return entidad
+    
+    def eliminar(self, id):
+        entidad = self.entidades.pop(id, None)
+        if entidad is not None:
+            self.olvidar_id(id)
+            for indice in self.indices.values():
+                indice.quitar(entidad)
+        return entidad
+    
+    def reemplazar(self, entidades):
+        self.entidades = {entidad.id: entidad for entidad in entidades}
+        self.maximo_id = max(self.entidades, default=0)
+        self.orden = None
+        for indice in self.indices.values():
+            indice.reconstruir(self.entidades.values())
+    
+    def iterar_desde(self, desde=1):
+        # Recorre las entidades con ID >= desde por orden de ID sin ordenar
+        # el repositorio: cada paso busca con bisect el siguiente ID en la
+        # lista ordenada, así que admite cambios entre un paso y otro
+        while True:
+            orden = self.ids_ordenados()
+            posicion = bisect.bisect_left(orden, desde)
+            if posicion == len(orden):
+                return
+            id = orden[posicion]
+            desde = id + 1
+            entidad = self.obtener(id)
+            if entidad is not None:
+                yield entidad
+    
+    def agregar_indice(self, nombre, indice):
+        indice.reconstruir(self.entidades.values())
+        self.indices[nombre] = indice
+        return indice
+    
+    def indice(self, nombre):
+        return self.indices[nombre]
+    
+    def buscar(self, termino, limite=None):
+        # Búsqueda por subcadena sobre los campos del índice "texto",
+        # clasificada por relevancia
+        return self.indices["texto"].buscar(termino, limite)
+    
+    def filtrar(self, **campos):
+        # Entidades cuyos campos tienen exactamente los valores indicados
+        return [entidad for entidad in self.entidades.values()
+                if all(getattr(entidad, campo) == valor for campo, valor in campos.items())]
+
+# Lectura de un archivo de solo añadir a través de mmap: el sistema
+# operativo solo lee del disco las páginas a las que se accede. El mapa se
+# rehace cuando se pide una posición más allá de su tamaño porque el
+# archivo ha crecido.
+class ArchivoMapeado:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.mapa = None
+    
+    def hasta(self, fin):
+        # Devuelve un mapa que cubre al menos los bytes [0, fin)
+        if self.mapa is None or len(self.mapa) < fin:
+            self.cerrar_mapa()
+            with open(self.ruta, "rb") as f:
+                if os.fstat(f.fileno()).st_size < fin:
+                    raise ValueError(f"{self.ruta}: posición {fin} fuera del archivo")
+                self.mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mapa
+    
+    def cerrar_mapa(self):
+        if self.mapa is not None:
+            self.mapa.close()
+            self.mapa = None
+
+# Archivo de textos (descripciones.dat): registros con la longitud en 4
+# bytes seguida del texto en UTF-8. Los textos se añaden al final y se leen
+# por su posición; una descripción editada deja la versión anterior en el
+# archivo hasta que se reescribe con convertir_instantaneas.
+class ArchivoTextos(ArchivoMapeado):
+    def __init__(self, ruta):
+        super().__init__(ruta)
+        self.archivo = None
+        self.bytes_escritos = 0
+    
+    def escribir(self, texto):
+        if self.archivo is None:
+            self.archivo = open(self.ruta, "ab")
+        posicion = self.archivo.tell()
+        datos = texto.encode("utf-8")
+        self.archivo.write(len(datos).to_bytes(4, "little") + datos)
+        self.bytes_escritos += 4 + len(datos)
+        return posicion
+    
+    def sincronizar(self):
+        # Los textos deben estar en disco antes que la instantánea que los referencia
+        if self.archivo is not None:
+            self.archivo.flush()
+            os.fsync(self.archivo.fileno())
+    
+    def leer(self, posicion):
+        if self.archivo is not None:
+            self.archivo.flush()
+        longitud = int.from_bytes(self.hasta(posicion + 4)[posicion:posicion + 4], "little")
+        return self.hasta(posicion + 4 + longitud)[posicion + 4:posicion + 4 + longitud].decode("utf-8")
+    
+    def cerrar(self):
+        self.cerrar_mapa()
+        if self.archivo is not None:
+            self.archivo.close()
+            self.archivo = None
+
+# Repositorio de préstamos que solo mantiene en memoria los préstamos
+# activos. Los devueltos se añaden a un archivo JSONL (historial.jsonl) y
+# se leen bajo demanda, a través de mmap, a partir de su posición en el archivo.
+class RepositorioHistorial(Repositorio):
+    def __init__(self, ruta):
+        super().__init__()
+        self.ruta = ruta
+        self.posiciones = {}
+        self.archivo = None
+        self.mapeado = ArchivoMapeado(ruta)
+        self.bytes_escritos = 0
+        # Hasta dónde se ha leído el archivo: otro proceso puede añadir líneas
+        self.leido = 0
+        # Tras self.leido queda una línea dañada (escrita a medias)
+        self.cola_danada = False
+        # La última instantánea cargada tenía préstamos devueltos
+        self.instantanea_obsoleta = False
+    
+    def abrir(self):
+        if self.archivo is None:
+            self.archivo = open(self.ruta, "a+b")
+        return self.archivo
+    
+    def cargar_historial(self):
+        # Solo se recuerda la posición de cada préstamo devuelto. Una línea
+        # {"id": ..., "eliminado": true} anula las anteriores del mismo ID.
+        # Las llamadas siguientes solo leen las líneas añadidas desde la anterior.
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, "rb") as f:
+            f.seek(self.leido)
+            posicion = self.leido
+            for linea in f:
+                # Las escrituras se hacen bajo el cerrojo, así que una línea
+                # sin terminar o ilegible es de una escritura interrumpida
+                try:
+                    if not linea.endswith(b"\n"):
+                        raise ValueError("línea incompleta")
+                    datos = json.loads(linea)
+                except ValueError:
+                    self.cola_danada = True
+                    break
+                # Una versión anterior del mismo préstamo deja de estar indexada
+                if self.indices and datos["id"] in self.posiciones:
+                    self.indexar_archivado(self.leer(self.posiciones[datos["id"]]), quitar=True)
+                if datos.get("eliminado"):
+                    self.posiciones.pop(datos["id"], None)
+                else:
+                    self.posiciones[datos["id"]] = posicion
+                    self.maximo_id = max(self.maximo_id, datos["id"])
+                    if self.indices:
+                        self.indexar_archivado(Prestamo.from_dict(datos))
+                posicion += len(linea)
+                self.leido = posicion
+        # Las líneas leídas pueden añadir o quitar préstamos archivados
+        self.orden = None
+    
+    def leer(self, posicion):
+        # archivar() vacía el búfer tras cada línea, así que el mapa ve todo lo escrito
+        mapa = self.mapeado.hasta(posicion + 1)
+        fin = mapa.find(b"\n", posicion)
+        return Prestamo.from_dict(json.loads(mapa[posicion:fin if fin >= 0 else len(mapa)]))
+    
+    def archivar(self, datos):
+        archivo = self.abrir()
+        if self.cola_danada:
+            # La línea dañada se corta antes de añadir nada: si no, el
+            # préstamo archivado quedaría pegado a ella y sería ilegible,
+            # igual que todos los posteriores
+            self.mapeado.cerrar_mapa()
+            archivo.truncate(self.leido)
+            self.cola_danada = False
+        archivo.seek(0, os.SEEK_END)
+        posicion = archivo.tell()
+        linea = json.dumps(datos, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+        archivo.write(linea)
+        archivo.flush()
+        self.bytes_escritos += len(linea)
+        if posicion == self.leido:
+            self.leido += len(linea)
+        return posicion
+    
+    def residentes(self):
+        return self.entidades.values()
+    
+    def agregar_indice(self, nombre, indice):
+        # Los índices por clave solo guardan IDs para poder incluir los
+        # préstamos archivados sin mantenerlos en memoria
+        if isinstance(indice, IndiceHash):
+            indice = IndiceIds(indice.clave, self, indice.atributos)
+        return super().agregar_indice(nombre, indice)
+    
+    def indexar_archivado(self, entidad, quitar=False):
+        for indice in self.indices.values():
+            if isinstance(indice, IndiceIds):
+                if quitar:
+                    indice.quitar(entidad)
+                else:
+                    indice.agregar(entidad)
+    
+    def __iter__(self):
+        # Recorrido por orden de ID mezclando memoria y archivo
+        for id in sorted(list(self.entidades) + list(self.posiciones)):
+            yield self.obtener(id)
+    
+    def __len__(self):
+        return len(self.entidades) + len(self.posiciones)
+    
+    def __contains__(self, id):
+        return id in self.entidades or id in self.posiciones
+    
+    def ids(self):
+        return itertools.chain(self.entidades, self.posiciones)
+    
+    def obtener(self, id):
+        entidad = self.entidades.get(id)
+        if entidad is None and id in self.posiciones:
+            entidad = self.leer(self.posiciones[id])
+        return entidad
+    
+    def agregar(self, entidad):
+        if not entidad.devuelto:
+            return super().agregar(entidad)
+        # Un préstamo devuelto sale de memoria y pasa al historial
+        super().eliminar(entidad.id)
+        self.maximo_id = max(self.maximo_id, entidad.id)
+        anterior = self.leer(self.posiciones[entidad.id]) if entidad.id in self.posiciones else None
+        if anterior is None or anterior.to_dict() != entidad.to_dict():
+            if anterior is not None:
+                self.indexar_archivado(anterior, quitar=True)
+            self.posiciones[entidad.id] = self.archivar(entidad.to_dict())
+            self.indexar_archivado(entidad)
+        self.anotar_id(entidad.id)
+        return entidad
+    
+    def actualizar(self, entidad, **campos):
+        super().actualizar(entidad, **campos)
+        if entidad.devuelto:
+            self.agregar(entidad)
+        return entidad
+    
+    def eliminar(self, id):
+        entidad = super().eliminar(id)
+        if entidad is None and id in self.posiciones:
+            entidad = self.leer(self.posiciones.pop(id))
+            self.archivar({"id": id, "eliminado": True})
+            self.indexar_archivado(entidad, quitar=True)
+            self.olvidar_id(id)
+        return entidad
+    
+    def reemplazar(self, entidades):
+        # Los préstamos ya archivados tienen prioridad sobre los de la
+        # instantánea: se archivan antes de reescribir prestamos.jsonl
+        activos = []
+        for entidad in entidades:
+            if entidad.id in self.posiciones:
+                self.instantanea_obsoleta = True
+                continue
+            if entidad.devuelto:
+                self.instantanea_obsoleta = True
+                self.posiciones[entidad.id] = self.archivar(entidad.to_dict())
+                self.indexar_archivado(entidad)
+            else:
+                activos.append(entidad)
+        # Se sustituyen solo los préstamos en memoria: reconstruir los
+        # índices haría perder las entradas de los archivados
+        for id in list(self.entidades):
+            super().eliminar(id)
+        self.maximo_id = 0
+        for entidad in activos:
+            super().agregar(entidad)
+        self.maximo_id = max(self.maximo_id, max(self.posiciones, default=0))
+        self.orden = None
+    
+    def filtrar(self, **campos):
+        if campos == {"devuelto": False}:
+            return list(self.entidades.values())
+        return [entidad for entidad in self
+                if all(getattr(entidad, campo) == valor for campo, valor in campos.items())]
+    
+    def cerrar(self):
+        self.mapeado.cerrar_mapa()
+        if self.archivo is not None:
+            self.archivo.close()
+            self.archivo = None
+
+# Diario de cambios (write-ahead log): cada modificación se añade como
+# una línea JSON compacta en lugar de reescribir todos los archivos
+class Diario:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.archivo = None
+        self.registros = 0
+        self.bytes_escritos = 0
+        # Bytes del diario ya leídos o escritos por este proceso
+        self.posicion = 0
+        # Tras self.posicion queda una línea dañada (escrita a medias)
+        self.cola_danada = False
+    
+    def leer(self):
+        # Devuelve los registros válidos del diario. Una última línea
+        # incompleta (por ejemplo, tras un corte de luz) se descarta.
+        self.posicion = 0
+        self.registros = 0
+        return self.leer_desde()
+    
+    def leer_desde(self):
+        # Registros añadidos desde la última lectura o escritura (por
+        # ejemplo, por otro proceso que comparte el directorio de datos)
+        registros = []
+        if not os.path.exists(self.ruta):
+            self.posicion = 0
+            return registros
+        with open(self.ruta, "rb") as f:
+            f.seek(self.posicion)
+            for linea in f:
+                try:
+                    if not linea.endswith(b"\n"):
+                        raise ValueError("línea incompleta")
+                    registros.append(json.loads(linea))
+                except ValueError:
+                    self.cola_danada = True
+                    break
+                self.posicion += len(linea)
+        self.registros += len(registros)
+        return registros
+    
+    def escribir(self, registros):
+        if self.archivo is None:
+            self.archivo = open(self.ruta, "a", encoding="utf-8")
+        if self.cola_danada:
+            # La línea dañada se corta antes de añadir nada: si no, el primer
+            # registro nuevo quedaría pegado a ella y la reproducción se
+            # detendría allí, perdiendo todos los posteriores
+            self.archivo.truncate(self.posicion)
+            self.cola_danada = False
+        self.archivo.seek(0, os.SEEK_END)
+        inicio = self.archivo.tell()
+        for registro in registros:
+            self.archivo.write(json.dumps(registro, separators=(",", ":"), ensure_ascii=False) + "\n")
+        self.archivo.flush()
+        os.fsync(self.archivo.fileno())
+        self.registros += len(registros)
+        self.bytes_escritos += self.archivo.tell() - inicio
+        self.posicion = os.fstat(self.archivo.fileno()).st_size
+    
+    def vaciar(self):
+        self.cerrar()
+        open(self.ruta, "w").close()
+        self.registros = 0
+        self.posicion = 0
+        self.cola_danada = False
+    
+    def cerrar(self):
+        if self.archivo is not None:
+            self.archivo.close()
+            self.archivo = None
+
+# Índice resuelto por una consulta SQL sobre una columna indexada.
+# La base de datos mantiene el índice, así que agregar/quitar no hacen nada.
+class IndiceSQL:
+    atributos = None
+    
+    def __init__(self, repositorio, condicion):
+        self.repositorio = repositorio
+        self.condicion = condicion
+    
+    def agregar(self, entidad):
+        pass
+    
+    def quitar(self, entidad):
+        pass
+    
+    def reconstruir(self, entidades):
+        pass
+    
+    def obtener(self, clave):
+        return self.repositorio.consultar(self.condicion, (clave,))
+    
+    def contiene(self, clave):
+        return self.repositorio.existe(self.condicion, (clave,))
+
+# Búsqueda por subcadena en SQLite. Cada fila guarda en la columna "texto"
+# sus campos buscables ya normalizados (ver texto_busqueda); si
+# SQLite incluye FTS5 se usa una tabla de trigramas para no recorrer la
+# tabla completa. La clasificación se hace sobre (id, texto) y solo se
+# leen las entidades de los resultados que se devuelven.
+class IndiceTextoSQL(IndiceSQL):
+    def __init__(self, repositorio):
+        super().__init__(repositorio, None)
+    
+    def buscar(self, termino, limite=None):
+        termino = normalizar_texto(termino)
+        tabla = self.repositorio.tabla
+        if self.repositorio.fts and len(termino) >= 3:
+            frase = '"' + termino.replace('"', '""') + '"'
+            condicion = f"id IN (SELECT rowid FROM {tabla}_fts WHERE texto MATCH ?) AND instr(texto, ?) > 0"
+            parametros = (frase, termino)
+        else:
+            condicion, parametros = "instr(texto, ?) > 0", (termino,)
+        filas = self.repositorio.conexion.execute(f"SELECT id, texto FROM {tabla} WHERE {condicion}", parametros)
+        ids = clasificar(filas, termino, limite)
         
-        # Cargar usuarios
-        if os.path.exists("data/usuarios.json"):
+        # Lectura por bloques para no superar el límite de parámetros de SQLite
+        entidades = {}
+        for i in range(0, len(ids), 500):
+            bloque = ids[i:i + 500]
+            for entidad in self.repositorio.consultar(f"id IN ({', '.join('?' * len(bloque))})", bloque):
+                entidades[entidad.id] = entidad
+        return [entidades[id] for id in ids]
+
+# Vencimientos en SQLite: las consultas usan los índices de la tabla sobre
+# (usuario_id, devuelto, fecha_vencimiento) y (devuelto, fecha_vencimiento).
+# Las fechas se guardan como texto "%Y-%m-%d", que se ordena igual que la fecha.
+class IndiceVencimientosSQL(IndiceSQL):
+    def __init__(self, repositorio):
+        super().__init__(repositorio, None)
+    
+    def primer_vencimiento(self, usuario_id):
+        fecha = self.repositorio.conexion.execute(
+            f"SELECT MIN(fecha_vencimiento) FROM {self.repositorio.tabla} WHERE usuario_id = ? AND devuelto = 0",
+            (usuario_id,)
+        ).fetchone()[0]
+        return ordinal_de_fecha(fecha) if fecha else None
+    
+    def vencidos(self, hoy):
+        prestamos = self.repositorio.consultar("devuelto = 0 AND fecha_vencimiento < ?", (fecha_de_ordinal(hoy),))
+        return sorted(prestamos, key=lambda p: (p.dia_vencimiento, p.id))
+
+# Repositorio respaldado por una tabla SQLite. Ofrece la misma interfaz que
+# Repositorio, pero las entidades se leen de la base de datos bajo demanda.
+# Las escrituras quedan en la transacción abierta hasta que el
+# almacenamiento confirma la operación completa.
+class RepositorioSQLite:
+    def __init__(self, conexion, tabla, clase, columnas, booleanos=(), consultas=None, buscable=False, calculadas=None):
+        self.conexion = conexion
+        self.tabla = tabla
+        self.clase = clase
+        self.columnas = columnas
+        self.booleanos = booleanos
+        # consultas: nombre de índice -> condición SQL equivalente
+        self.consultas = consultas or {}
+        # calculadas: columna -> función de la entidad. Se guardan para
+        # consultarlas e indexarlas en SQL (por ejemplo, una clave
+        # normalizada), pero no se leen de vuelta a la entidad.
+        self.calculadas = calculadas or {}
+        self.buscable = buscable
+        self.fts = False
+        self.indices = {}
+        self.bytes_escritos = 0
+        self.select = f"SELECT {', '.join(columnas)} FROM {tabla}"
+    
+    def crear_tabla(self, indices_sql):
+        definiciones = ["id INTEGER PRIMARY KEY"] + [c for c in self.columnas if c != "id"] + list(self.calculadas)
+        if self.buscable:
+            definiciones.append("texto TEXT")
+        self.conexion.execute(f"CREATE TABLE IF NOT EXISTS {self.tabla} ({', '.join(definiciones)})")
+        # Columnas añadidas en versiones posteriores a la creación de la tabla
+        existentes = {fila[1] for fila in self.conexion.execute(f"PRAGMA table_info({self.tabla})")}
+        nuevas = [columna for columna in self.columnas + list(self.calculadas) if columna not in existentes]
+        for columna in nuevas:
+            self.conexion.execute(f"ALTER TABLE {self.tabla} ADD COLUMN {columna}")
+        # Cada índice es una columna o varias separadas por comas
+        for columnas in indices_sql:
+            nombre = "_".join(columna.strip() for columna in columnas.split(","))
+            self.conexion.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_{nombre} ON {self.tabla}({columnas})")
+        if self.buscable:
             try:
-                with open("data/usuarios.json", "r") as f:
-                    usuarios_data = json.load(f)
-                    self.usuarios = [Usuario.from_dict(u) for u in usuarios_data]
-            except:
-                print("Error al cargar usuarios. Se iniciará con una lista vacía.")
+                self.conexion.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.tabla}_fts USING fts5(texto, tokenize='trigram case_sensitive 1')"
+                )
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite sin FTS5 o sin el tokenizador de trigramas
+                self.fts = False
+        return nuevas
+    
+    def entidad(self, fila):
+        datos = dict(zip(self.columnas, fila))
+        for columna in self.booleanos:
+            datos[columna] = bool(datos[columna])
+        return self.clase.from_dict(datos)
+    
+    def consultar(self, condicion, parametros=()):
+        cursor = self.conexion.execute(f"{self.select} WHERE {condicion} ORDER BY id", parametros)
+        return [self.entidad(fila) for fila in cursor]
+    
+    def existe(self, condicion, parametros=()):
+        cursor = self.conexion.execute(f"SELECT 1 FROM {self.tabla} WHERE {condicion} LIMIT 1", parametros)
+        return cursor.fetchone() is not None
+    
+    def __iter__(self):
+        for fila in self.conexion.execute(f"{self.select} ORDER BY id"):
+            yield self.entidad(fila)
+    
+    def iterar_desde(self, desde=1):
+        for fila in self.conexion.execute(f"{self.select} WHERE id >= ? ORDER BY id", (desde,)):
+            yield self.entidad(fila)
+    
+    def __len__(self):
+        return self.conexion.execute(f"SELECT COUNT(*) FROM {self.tabla}").fetchone()[0]
+    
+    def __contains__(self, id):
+        return self.existe("id = ?", (id,))
+    
+    def ids(self):
+        return (fila[0] for fila in self.conexion.execute(f"SELECT id FROM {self.tabla} ORDER BY id"))
+    
+    def obtener(self, id):
+        fila = self.conexion.execute(f"{self.select} WHERE id = ?", (id,)).fetchone()
+        return self.entidad(fila) if fila else None
+    
+    def texto(self, entidad):
+        return texto_busqueda(entidad.campos_busqueda())
+    
+    def fila(self, entidad):
+        datos = entidad.to_dict()
+        fila = [datos[columna] for columna in self.columnas]
+        fila.extend(calcular(entidad) for calcular in self.calculadas.values())
+        if self.buscable:
+            fila.append(self.texto(entidad))
+        return fila
+    
+    def actualizar_textos(self):
+        # Recalcula la columna "texto" de todas las filas (por ejemplo, en
+        # bases de datos creadas con otra normalización)
+        filas = [(self.texto(entidad), entidad.id) for entidad in self]
+        self.conexion.executemany(f"UPDATE {self.tabla} SET texto = ? WHERE id = ?", filas)
+        if self.fts:
+            self.conexion.execute(f"DELETE FROM {self.tabla}_fts")
+            self.conexion.execute(f"INSERT INTO {self.tabla}_fts (rowid, texto) SELECT id, texto FROM {self.tabla}")
+    
+    def actualizar_calculadas(self, columnas):
+        # Rellena columnas calculadas recién añadidas a una tabla con datos
+        asignaciones = ", ".join(f"{columna} = ?" for columna in columnas)
+        filas = [[self.calculadas[columna](entidad) for columna in columnas] + [entidad.id] for entidad in self]
+        self.conexion.executemany(f"UPDATE {self.tabla} SET {asignaciones} WHERE id = ?", filas)
+    
+    def escribir(self, entidades):
+        columnas = list(self.columnas) + list(self.calculadas) + (["texto"] if self.buscable else [])
+        filas = [self.fila(entidad) for entidad in entidades]
+        # Estimación del volumen enviado a la base de datos (texto de los valores)
+        self.bytes_escritos += sum(len(str(valor).encode("utf-8")) for fila in filas for valor in fila)
+        self.conexion.executemany(
+            f"INSERT OR REPLACE INTO {self.tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+            filas
+        )
+        if self.fts:
+            self.conexion.executemany(f"DELETE FROM {self.tabla}_fts WHERE rowid = ?", [(fila[0],) for fila in filas])
+            self.conexion.executemany(
+                f"INSERT INTO {self.tabla}_fts (rowid, texto) VALUES (?, ?)",
+                [(fila[0], fila[-1]) for fila in filas]
+            )
+    
+    def agregar(self, entidad):
+        # Solo los índices en memoria necesitan la versión anterior de la fila
+        en_memoria = any(not isinstance(indice, IndiceSQL) for indice in self.indices.values())
+        anterior = self.obtener(entidad.id) if en_memoria else None
+        if anterior is not None:
+            for indice in self.indices.values():
+                indice.quitar(anterior)
+        self.escribir([entidad])
+        for indice in self.indices.values():
+            indice.agregar(entidad)
+        return entidad
+    
+    def agregar_lote(self, entidades):
+        # Entidades nuevas: una sola sentencia para todo el lote
+        self.escribir(entidades)
+        for indice in self.indices.values():
+            for entidad in entidades:
+                indice.agregar(entidad)
+    
+    def actualizar(self, entidad, **campos):
+        indices = indices_afectados(self.indices, campos)
+        for indice in indices:
+            indice.quitar(entidad)
+        for campo, valor in campos.items():
+            setattr(entidad, campo, valor)
+        self.escribir([entidad])
+        for indice in indices:
+            indice.agregar(entidad)
+        return entidad
+    
+    def eliminar(self, id):
+        entidad = self.obtener(id)
+        if entidad is not None:
+            self.conexion.execute(f"DELETE FROM {self.tabla} WHERE id = ?", (id,))
+            if self.fts:
+                self.conexion.execute(f"DELETE FROM {self.tabla}_fts WHERE rowid = ?", (id,))
+            for indice in self.indices.values():
+                indice.quitar(entidad)
+        return entidad
+    
+    def reemplazar(self, entidades):
+        self.conexion.execute(f"DELETE FROM {self.tabla}")
+        if self.fts:
+            self.conexion.execute(f"DELETE FROM {self.tabla}_fts")
+        lote = []
+        for entidad in entidades:
+            lote.append(entidad)
+            if len(lote) >= 10000:
+                self.escribir(lote)
+                lote = []
+        self.escribir(lote)
+        for indice in self.indices.values():
+            indice.reconstruir(self)
+    
+    def agregar_indice(self, nombre, indice):
+        # Los índices con equivalente en SQL se resuelven en la base de datos;
+        # el resto se construyen en memoria como en Repositorio
+        if nombre == "texto" and self.buscable:
+            indice = IndiceTextoSQL(self)
+        elif nombre == "vencimientos":
+            indice = IndiceVencimientosSQL(self)
+        elif nombre in self.consultas:
+            indice = IndiceSQL(self, self.consultas[nombre])
+        else:
+            indice.reconstruir(self)
+        self.indices[nombre] = indice
+        return indice
+    
+    def indice(self, nombre):
+        return self.indices[nombre]
+    
+    def buscar(self, termino, limite=None):
+        return self.indices["texto"].buscar(termino, limite)
+    
+    def filtrar(self, **campos):
+        condicion = " AND ".join(f"{campo} = ?" for campo in campos) or "1"
+        return self.consultar(condicion, tuple(campos.values()))
+
+# Escritura atómica: el contenido va a un archivo temporal que, una vez
+# sincronizado con el disco, sustituye al original. Si el proceso se
+# interrumpe a mitad de escritura, el archivo anterior queda intacto.
+@contextlib.contextmanager
+def escritura_atomica(ruta, modo="w", **opciones):
+    temporal = ruta + ".tmp"
+    try:
+        with open(temporal, modo, **opciones) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+# Instantáneas binarias (archivos .bin): cada colección se guarda por
+# columnas con marshal, una lista por atributo de __slots__ con los valores
+# tal como están en memoria (en los préstamos, las fechas ya son ordinales).
+# Al leerlas no hay que analizar JSON ni pasar por from_dict.
+CABECERA_BINARIA = b"BIBLIOTECA-BIN 1\n"
+
+def escribir_binario(f, clase, entidades, conversiones=None):
+    # conversiones: atributo -> función que transforma sus valores antes de
+    # guardarlos (por ejemplo, un TextoDiferido en su posición)
+    conversiones = conversiones or {}
+    entidades = list(entidades)
+    columnas = [[getattr(entidad, campo) for entidad in entidades] for campo in clase.__slots__]
+    for i, campo in enumerate(clase.__slots__):
+        if campo in conversiones:
+            columnas[i] = list(map(conversiones[campo], columnas[i]))
+    f.write(CABECERA_BINARIA)
+    marshal.dump((clase.__slots__, columnas), f)
+
+def leer_binario(ruta, clase):
+    # marshal.load sobre el archivo lee valor a valor; es mucho más rápido
+    # leerlo entero y decodificarlo de una vez
+    with open(ruta, "rb") as f:
+        contenido = f.read()
+    if not contenido.startswith(CABECERA_BINARIA):
+        raise ValueError(f"{ruta} no es una instantánea binaria")
+    campos, columnas = marshal.loads(memoryview(contenido)[len(CABECERA_BINARIA):])
+    return entidades_de_columnas(clase, campos, columnas, ruta)
+
+def entidades_de_columnas(clase, campos, columnas, origen):
+    # origen: archivo del que vienen las columnas, para los mensajes de error
+    # Una instantánea de una versión anterior puede tener atributos que
+    # ahora son propiedades (se asignan a través de ellas) y no tener los
+    # añadidos después, que la clase completa con su método completar()
+    faltan = [campo for campo in clase.__slots__ if campo not in campos and campo.lstrip("_") not in campos]
+    desconocidos = [campo for campo in campos if not hasattr(getattr(clase, campo, None), "__set__")]
+    if desconocidos or (faltan and not hasattr(clase, "completar")):
+        raise ValueError(f"{origen} no corresponde a esta versión de {clase.__name__}")
+    
+    # Las entidades se crean sin __init__ y se rellenan columna a columna
+    # con el descriptor de cada atributo; map y deque hacen los bucles en C
+    entidades = list(map(clase.__new__, itertools.repeat(clase, len(columnas[0]))))
+    for campo, columna in zip(campos, columnas):
+        collections.deque(map(getattr(clase, campo).__set__, entidades, columna), maxlen=0)
+    if faltan:
+        for entidad in entidades:
+            entidad.completar()
+    if entidades:
+        clase.ultimo_id = max(clase.ultimo_id, max(columnas[0]))
+    return entidades
+
+def leer_json(ruta, tipo):
+    # Generador de las entidades de una instantánea JSON (una lista) o JSONL
+    # (una por línea; nunca tiene en memoria todos los diccionarios)
+    clase = AlmacenamientoJSON.ENTIDADES[tipo]
+    with open(ruta, "r", encoding="utf-8") as f:
+        if ruta.endswith(".jsonl"):
+            datos = (json.loads(linea) for linea in f if linea.strip())
+        else:
+            datos = json.load(f)
+        if tipo == "libros":
+            # Las descripciones en disco llegan como posición
+            datos = (dict(d, descripcion=d["descripcion_pos"]) if "descripcion_pos" in d else d for d in datos)
+        for d in datos:
+            yield clase.from_dict(d)
+
+def decodificar_json(ruta, tipo):
+    # Se ejecuta en un proceso aparte durante la carga en paralelo. Los
+    # objetos no se pueden pasar entre procesos, así que las entidades se
+    # devuelven por columnas serializadas con marshal, que el proceso
+    # principal decodifica mucho más rápido que el JSON (igual que una
+    # instantánea binaria). Devuelve también los segundos empleados.
+    inicio = time.perf_counter()
+    clase = AlmacenamientoJSON.ENTIDADES[tipo]
+    entidades = list(leer_json(ruta, tipo))
+    columnas = [list(map(operator.attrgetter(campo), entidades)) for campo in clase.__slots__]
+    return marshal.dumps((list(clase.__slots__), columnas)), time.perf_counter() - inicio
+
+# Suma a tiempos[nombre] los segundos que tarda el bloque (desglose del arranque)
+@contextlib.contextmanager
+def cronometro(tiempos, nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos[nombre] = tiempos.get(nombre, 0) + time.perf_counter() - inicio
+
+# Cerrojo consultivo entre procesos sobre un archivo. En Windows no hay
+# cerrojos compartidos, así que las lecturas también son exclusivas.
+class CerrojoArchivo:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.archivo = None
+    
+    def adquirir(self, exclusivo=True):
+        if self.archivo is None:
+            # El cerrojo se toma antes de cargar, cuando el directorio
+            # de datos puede no existir todavía
+            os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+            self.archivo = open(self.ruta, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self.archivo.fileno(), fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        else:
+            self.archivo.seek(0)
+            msvcrt.locking(self.archivo.fileno(), msvcrt.LK_LOCK, 1)
+    
+    def liberar(self):
+        if fcntl is not None:
+            fcntl.flock(self.archivo.fileno(), fcntl.LOCK_UN)
+        else:
+            self.archivo.seek(0)
+            msvcrt.locking(self.archivo.fileno(), msvcrt.LK_UNLCK, 1)
+    
+    def cerrar(self):
+        if self.archivo is not None:
+            self.archivo.close()
+            self.archivo = None
+
+# Almacenamiento en archivos JSON (o binarios, ver formato): cada cambio
+# reescribe solo los archivos de las colecciones modificadas y, con
+# historial_en_disco, los préstamos devueltos se añaden a historial.jsonl
+class AlmacenamientoJSON:
+    # Tipos de entidad persistidos: nombre del archivo/colección y su clase
+    ENTIDADES = {"usuarios": Usuario, "libros": Libro, "prestamos": Prestamo}
+    
+    usa_diario = False
+    
+    # Sello de generación (generacion.json) de un directorio compartido:
+    # "generacion" aumenta con cada escritura, cada colección guarda la
+    # generación en que se reescribió su archivo y "compactaciones" cuenta
+    # las veces que se vació el diario
+    SELLO_INICIAL = {"generacion": 0, "usuarios": 0, "libros": 0, "prestamos": 0, "compactaciones": 0}
+    
+    # Tamaño total de los JSON a partir del cual se decodifican en paralelo
+    # (por debajo, crear los procesos cuesta más de lo que se gana)
+    CARGA_PARALELA_MINIMA = 8 * 1024 * 1024
+    
+    def __init__(self, directorio, historial_en_disco=False, formato="json", descripciones_en_disco=False):
+        # historial_en_disco: mantener en memoria solo los préstamos activos
+        # formato: "json" o "binario", formato en que se escriben las
+        # instantáneas. Al cargar se detecta el de cada archivo.
+        # descripciones_en_disco: las descripciones de los libros se guardan
+        # en descripciones.dat y las instantáneas solo guardan su posición
+        self.directorio = directorio
+        self.historial_en_disco = historial_en_disco
+        self.binario = formato == "binario"
+        self.descripciones_en_disco = descripciones_en_disco
+        self.textos = ArchivoTextos(self.ruta("descripciones.dat"))
+        # Hay descripciones cargadas en memoria que deben pasar a descripciones.dat
+        self.descripciones_pendientes = False
+        self.diario = Diario(self.ruta("diario.jsonl"))
+        self.contadores_diario = None
+        self.escritos = 0
+        
+        # procesos_carga: procesos para decodificar los JSON al arrancar
+        # (None: uno por núcleo si hay varios y los archivos son grandes; 1: sin paralelismo)
+        self.procesos_carga = None
+        # Decodificaciones lanzadas en otros procesos, por tipo de entidad
+        self.decodificados = {}
+        # Desglose en segundos de la carga, por fase
+        self.tiempos = {}
+        
+        # Acceso compartido por varios procesos (ver BibliotecaApp.acceso)
+        self.cerrojo = CerrojoArchivo(self.ruta("biblioteca.lock"))
+        self.bloqueos = 0
+        self.sello = dict(self.SELLO_INICIAL)
+        self.colecciones_escritas = set()
+        self.diario_escrito = False
+        self.diario_compactado = False
+    
+    @property
+    def bytes_escritos(self):
+        # Total escrito en disco por este almacenamiento (para las métricas)
+        total = self.escritos + self.diario.bytes_escritos + self.textos.bytes_escritos
+        if self.historial_en_disco:
+            total += self.prestamos.bytes_escritos
+        return total
+    
+    def ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+    
+    def crear_repositorios(self):
+        prestamos = RepositorioHistorial(self.ruta("historial.jsonl")) if self.historial_en_disco else Repositorio()
+        self.prestamos = prestamos
+        return Repositorio(), Repositorio(), prestamos
+    
+    def cargar(self, app):
+        # Crear directorio de datos si no existe
+        if not os.path.exists(self.directorio):
+            os.makedirs(self.directorio)
+        
+        self.sello = self.leer_sello()
         
-        # Cargar libros
-        if os.path.exists("data/libros.json"):
+        # Con varios núcleos, las instantáneas JSON se decodifican a la vez
+        # en otros procesos mientras este crea e indexa las que ya llegaron
+        archivos = {tipo: self.archivo_json(tipo) for tipo in self.ENTIDADES}
+        archivos = {tipo: ruta for tipo, ruta in archivos.items() if ruta}
+        procesos = self.procesos_para(archivos)
+        if procesos > 1:
+            with concurrent.futures.ProcessPoolExecutor(procesos) as ejecutor:
+                self.decodificados = {tipo: ejecutor.submit(decodificar_json, ruta, tipo)
+                                      for tipo, ruta in archivos.items()}
+                try:
+                    for tipo in self.ENTIDADES:
+                        self.cargar_coleccion(app, tipo)
+                finally:
+                    self.decodificados = {}
+        else:
+            for tipo in self.ENTIDADES:
+                self.cargar_coleccion(app, tipo)
+        
+        # Aplicar sobre la instantánea los cambios registrados en el diario
+        if os.path.exists(self.diario.ruta):
             try:
-                with open("data/libros.json", "r") as f:
-                    libros_data = json.load(f)
-                    self.libros = [Libro.from_dict(l) for l in libros_data]
+                with cronometro(self.tiempos, "diario"):
+                    self.reproducir_diario(app, self.diario.leer())
             except:
-                print("Error al cargar libros. Se iniciará con una lista vacía.")
+                print("Error al leer el diario de cambios. Se usará la última instantánea.")
+    
+    def archivo_json(self, tipo):
+        # Ruta de la instantánea JSON que se cargará para el tipo (None si se
+        # usa la binaria o no hay ninguna). Los préstamos están en
+        # prestamos.jsonl o, con datos de una versión anterior, en prestamos.json.
+        nombres = ["prestamos.jsonl", "prestamos.json"] if tipo == "prestamos" else [f"{tipo}.json"]
+        if self.es_binario(tipo, nombres[0]):
+            return None
+        for nombre in nombres:
+            if os.path.exists(self.ruta(nombre)):
+                return self.ruta(nombre)
+        return None
+    
+    def procesos_para(self, archivos):
+        # Por defecto, la carga en paralelo solo se usa si hay más de un
+        # núcleo disponible y los archivos son grandes: con un núcleo, los
+        # procesos solo añaden trabajo (crearlos y pasar los datos)
+        if self.procesos_carga is not None:
+            procesos = self.procesos_carga
+        else:
+            nucleos = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+            grandes = sum(os.path.getsize(ruta) for ruta in archivos.values()) >= self.CARGA_PARALELA_MINIMA
+            procesos = nucleos if nucleos > 1 and grandes else 1
+        # Con un solo archivo no hay nada que hacer a la vez
+        return min(procesos, len(archivos)) if len(archivos) > 1 else 1
+    
+    def leer_entidades(self, tipo, ruta):
+        # Entidades de una instantánea JSON: las ya decodificadas en otro
+        # proceso o, si no se lanzó ninguno, un generador que las lee aquí
+        # a medida que se indexan (sin una lista intermedia)
+        futuro = self.decodificados.pop(tipo, None)
+        if futuro is None:
+            return leer_json(ruta, tipo)
+        contenido, segundos = futuro.result()
+        self.tiempos[f"decodificar {tipo} (otro proceso)"] = segundos
+        campos, columnas = marshal.loads(contenido)
+        return entidades_de_columnas(self.ENTIDADES[tipo], campos, columnas, ruta)
+    
+    def es_binario(self, tipo, archivo_json):
+        # Se usa la instantánea binaria si existe y no hay un JSON más reciente
+        binario = self.ruta(f"{tipo}.bin")
+        if not os.path.exists(binario):
+            return False
+        return not os.path.exists(self.ruta(archivo_json)) or os.path.getmtime(binario) >= os.path.getmtime(self.ruta(archivo_json))
+    
+    def quitar_archivo(self, nombre):
+        if os.path.exists(self.ruta(nombre)):
+            os.remove(self.ruta(nombre))
+    
+    def cargar_coleccion(self, app, tipo):
+        if tipo == "prestamos":
+            self.cargar_prestamos(app)
+            return
+        
+        # Cargar usuarios o libros
+        clase = self.ENTIDADES[tipo]
+        try:
+            with cronometro(self.tiempos, f"leer {tipo}"):
+                if self.es_binario(tipo, f"{tipo}.json"):
+                    entidades = leer_binario(self.ruta(f"{tipo}.bin"), clase)
+                elif os.path.exists(self.ruta(f"{tipo}.json")):
+                    entidades = self.leer_entidades(tipo, self.ruta(f"{tipo}.json"))
+                else:
+                    return
+                if tipo == "libros":
+                    entidades = self.resolver_descripciones(entidades)
+            with cronometro(self.tiempos, self.fase_indexar(tipo, entidades)):
+                getattr(app, tipo).reemplazar(entidades)
+        except:
+            print(f"Error al cargar {tipo}. Se iniciará con una lista vacía.")
+    
+    def fase_indexar(self, tipo, entidades):
+        # Nombre de la fase de indexado para --profile-startup: si las
+        # entidades llegan como generador, se leen durante el indexado
+        return f"indexar {tipo}" if isinstance(entidades, list) else f"leer e indexar {tipo}"
+    
+    def resolver_descripciones(self, libros):
+        # Una descripción cargada como posición (int) en descripciones.dat
+        # se deja en disco como TextoDiferido o, sin descripciones_en_disco,
+        # se lee ya. Las que llegan como texto se pasarán a disco al guardar.
+        for libro in libros:
+            descripcion = libro._descripcion
+            if isinstance(descripcion, int):
+                if self.descripciones_en_disco:
+                    libro._descripcion = TextoDiferido(self.textos, descripcion)
+                else:
+                    libro._descripcion = self.textos.leer(descripcion)
+            elif descripcion and self.descripciones_en_disco:
+                self.descripciones_pendientes = True
+            yield libro
+    
+    def enfriar_descripciones(self, libros):
+        # Pasa a descripciones.dat las descripciones que están en memoria
+        for libro in libros:
+            descripcion = libro._descripcion
+            if descripcion and isinstance(descripcion, str):
+                libro._descripcion = TextoDiferido(self.textos, self.textos.escribir(descripcion))
+        self.textos.sincronizar()
+        self.descripciones_pendientes = False
+    
+    def cargar_prestamos(self, app):
+        # Cargar préstamos (prestamos.bin, prestamos.jsonl, o prestamos.json
+        # si los datos son de una versión anterior)
+        if self.historial_en_disco:
+            with cronometro(self.tiempos, "leer historial"):
+                app.prestamos.cargar_historial()
+        
+        ruta = self.archivo_json("prestamos")
+        try:
+            with cronometro(self.tiempos, "leer prestamos"):
+                if ruta:
+                    entidades = self.leer_entidades("prestamos", ruta)
+                elif self.es_binario("prestamos", "prestamos.jsonl"):
+                    entidades = leer_binario(self.ruta("prestamos.bin"), Prestamo)
+                else:
+                    entidades = None
+            if entidades is not None:
+                with cronometro(self.tiempos, self.fase_indexar("prestamos", entidades)):
+                    app.prestamos.reemplazar(entidades)
+        except:
+            print("Error al cargar préstamos. Se iniciará con una lista vacía.")
         
-        # Cargar préstamos
-        if os.path.exists("data/prestamos.json"):
+        # Historial de una sesión con historial_en_disco: se carga en memoria.
+        # Sus préstamos devueltos prevalecen sobre los de prestamos.jsonl.
+        if not self.historial_en_disco and os.path.exists(self.ruta("historial.jsonl")):
             try:
-                with open("data/prestamos.json", "r") as f:
-                    prestamos_data = json.load(f)
-                    self.prestamos = [Prestamo.from_dict(p) for p in prestamos_data]
+                historial = RepositorioHistorial(self.ruta("historial.jsonl"))
+                historial.cargar_historial()
+                app.prestamos.agregar_lote(historial)
+                app.prestamos.reemplazar(sorted(app.prestamos, key=lambda p: p.id))
+                historial.cerrar()
             except:
-                print("Error al cargar préstamos. Se iniciará con una lista vacía.")
+                print("Error al cargar el historial de préstamos.")
     
-    def cargar_contadores(self):
-        # Cargar contadores de IDs
-        if os.path.exists("data/contadores.json"):
+    def reproducir_diario(self, app, registros):
+        # Devuelve los IDs guardados o eliminados de cada colección
+        cambios = {}
+        for registro in registros:
+            repositorio = getattr(app, registro["tipo"])
+            if registro["op"] == "guardar":
+                clase = self.ENTIDADES[registro["tipo"]]
+                id = repositorio.agregar(clase.from_dict(registro["datos"])).id
+            else:
+                id = registro["id"]
+                repositorio.eliminar(id)
+            cambios.setdefault(registro["tipo"], set()).add(id)
+            self.contadores_diario = registro["contadores"]
+        return cambios
+    
+    def leer_contadores(self):
+        with open(self.ruta("contadores.json"), "r") as f:
+            return json.load(f)
+    
+    def cargar_contadores(self, app):
+        # Los repositorios ya conocen el mayor ID cargado (lo calculan al
+        # reemplazar sus entidades), así que no hace falta recorrerlos
+        Usuario.ultimo_id = app.usuarios.maximo_id
+        Libro.ultimo_id = app.libros.maximo_id
+        Prestamo.ultimo_id = app.prestamos.maximo_id
+        
+        # Cargar contadores de IDs. Pueden ir por delante de los datos si se
+        # eliminaron las últimas entidades, nunca por detrás.
+        if os.path.exists(self.ruta("contadores.json")):
             try:
-                with open("data/contadores.json", "r") as f:
-                    contadores = json.load(f)
-                    Usuario.ultimo_id = contadores.get("usuario_id", 0)
-                    Libro.ultimo_id = contadores.get("libro_id", 0)
-                    Prestamo.ultimo_id = contadores.get("prestamo_id", 0)
+                contadores = self.leer_contadores()
+                Usuario.ultimo_id = max(Usuario.ultimo_id, contadores.get("usuario_id", 0))
+                Libro.ultimo_id = max(Libro.ultimo_id, contadores.get("libro_id", 0))
+                Prestamo.ultimo_id = max(Prestamo.ultimo_id, contadores.get("prestamo_id", 0))
             except:
                 print("Error al cargar contadores. Se usarán los valores por defecto.")
-        else:
-            # Si no existe el archivo, actualizar los contadores basados en los datos cargados
-            if self.usuarios:
-                Usuario.ultimo_id = max(u.id for u in self.usuarios)
-            if self.libros:
-                Libro.ultimo_id = max(l.id for l in self.libros)
-            if self.prestamos:
-                Prestamo.ultimo_id = max(p.id for p in self.prestamos)
+        
+        # Los contadores del diario son más recientes que los de la instantánea
+        if self.contadores_diario:
+            Usuario.ultimo_id = max(Usuario.ultimo_id, self.contadores_diario[0])
+            Libro.ultimo_id = max(Libro.ultimo_id, self.contadores_diario[1])
+            Prestamo.ultimo_id = max(Prestamo.ultimo_id, self.contadores_diario[2])
+        
+        # Si quedó un diario de una sesión en modo "diario" pero ahora se
+        # usa otro modo, se integra en la instantánea para no perderlo
+        if self.diario.registros and not self.usa_diario:
+            self.compactar_diario(app)
+        
+        # Datos guardados sin descripciones_en_disco: las descripciones pasan
+        # a descripciones.dat para no mantenerlas en memoria. Las de los
+        # libros que vienen del diario pasan en la siguiente compactación.
+        if self.descripciones_pendientes:
+            self.guardar(app, {"libros"})
+        
+        # Con historial_en_disco, los préstamos devueltos de prestamos.jsonl
+        # ya pasaron a historial.jsonl: la instantánea se reescribe sin ellos
+        if self.historial_en_disco and app.prestamos.instantanea_obsoleta:
+            self.guardar(app, {"prestamos"})
+            app.prestamos.instantanea_obsoleta = False
     
-    def guardar_datos(self):
-        # Guardar usuarios
-        with open("data/usuarios.json", "w") as f:
-            json.dump([u.to_dict() for u in self.usuarios], f, indent=4)
+    def guardar(self, app, tipos=None):
+        # tipos: colecciones que se reescriben (por defecto, todas)
+        tipos = self.ENTIDADES if tipos is None else tipos
+        
+        # Guardar usuarios y libros. La instantánea en el otro formato queda obsoleta.
+        for tipo in ("usuarios", "libros"):
+            if tipo not in tipos:
+                continue
+            # Con descripciones_en_disco, los libros guardan la posición de su descripción
+            en_disco = tipo == "libros" and self.descripciones_en_disco
+            if en_disco:
+                self.enfriar_descripciones(app.libros)
+            if self.binario:
+                conversiones = {"_descripcion": lambda d: d.posicion if isinstance(d, TextoDiferido) else d} if en_disco else None
+                with escritura_atomica(self.ruta(f"{tipo}.bin"), "wb") as f:
+                    escribir_binario(f, self.ENTIDADES[tipo], getattr(app, tipo), conversiones)
+                    self.escritos += f.tell()
+                self.quitar_archivo(f"{tipo}.json")
+            else:
+                with escritura_atomica(self.ruta(f"{tipo}.json")) as f:
+                    if en_disco:
+                        json.dump([libro.to_dict(posiciones=True) for libro in app.libros], f, indent=4)
+                    else:
+                        json.dump([entidad.to_dict() for entidad in getattr(app, tipo)], f, indent=4)
+                    self.escritos += f.tell()
+                self.quitar_archivo(f"{tipo}.bin")
+            if tipo == "libros" and not en_disco:
+                # Las descripciones ya están completas en la instantánea
+                self.textos.cerrar()
+                self.quitar_archivo("descripciones.dat")
         
-        # Guardar libros
-        with open("data/libros.json", "w") as f:
-            json.dump([l.to_dict() for l in self.libros], f, indent=4)
+        # Guardar préstamos, uno por línea. Con historial_en_disco solo se
+        # escriben los activos: los devueltos ya están en historial.jsonl
+        if "prestamos" in tipos:
+            prestamos = app.prestamos.residentes() if self.historial_en_disco else app.prestamos
+            if self.binario:
+                with escritura_atomica(self.ruta("prestamos.bin"), "wb") as f:
+                    escribir_binario(f, Prestamo, prestamos)
+                    self.escritos += f.tell()
+                self.quitar_archivo("prestamos.jsonl")
+            else:
+                with escritura_atomica(self.ruta("prestamos.jsonl"), encoding="utf-8") as f:
+                    for p in prestamos:
+                        f.write(json.dumps(p.to_dict(), separators=(",", ":"), ensure_ascii=False) + "\n")
+                    self.escritos += f.tell()
+                self.quitar_archivo("prestamos.bin")
+            
+            # El formato anterior y un historial ya integrado quedan obsoletos
+            self.quitar_archivo("prestamos.json")
+            if not self.historial_en_disco:
+                self.quitar_archivo("historial.jsonl")
         
-        # Guardar préstamos
-        with open("data/prestamos.json", "w") as f:
-            json.dump([p.to_dict() for p in self.prestamos], f, indent=4)
+        self.colecciones_escritas.update(tipos)
         
         # Guardar contadores
-        with open("data/contadores.json", "w") as f:
+        with escritura_atomica(self.ruta("contadores.json")) as f:
             contadores = {
                 "usuario_id": Usuario.ultimo_id,
                 "libro_id": Libro.ultimo_id,
                 "prestamo_id": Prestamo.ultimo_id
             }
             json.dump(contadores, f, indent=4)
+            self.escritos += f.tell()
+    
+    def registrar(self, app, cambios):
+        # Solo se reescriben los archivos de las colecciones modificadas. Si
+        # otro proceso dejó registros en el diario, se integran primero.
+        if self.diario.registros:
+            self.compactar_diario(app)
+        else:
+            self.guardar(app, {tipo for _, tipo, _ in cambios})
+    
+    def compactar_diario(self, app):
+        # Primero se escribe la instantánea y después se vacía el diario:
+        # si el proceso se interrumpe entre ambos pasos, reproducir el
+        # diario de nuevo sobre la instantánea da el mismo resultado
+        self.guardar(app)
+        self.diario.vaciar()
+        self.diario_compactado = True
+    
+    # Acceso compartido: cerrojo del directorio y sello de generación
+    def leer_sello(self):
+        # Un sello ilegible cuenta como distinto de cualquier otro, así que
+        # provoca una recarga completa
+        try:
+            with open(self.ruta("generacion.json"), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return dict(self.SELLO_INICIAL)
+        except ValueError:
+            return {}
+    
+    def bloquear(self, exclusivo=True):
+        # Admite llamadas anidadas: solo la más externa toma el cerrojo
+        if not self.bloqueos:
+            self.cerrojo.adquirir(exclusivo)
+        self.bloqueos += 1
+    
+    def desbloquear(self):
+        self.bloqueos -= 1
+        if not self.bloqueos:
+            try:
+                if self.colecciones_escritas or self.diario_escrito or self.diario_compactado:
+                    self.sellar()
+            finally:
+                self.cerrojo.liberar()
+    
+    def sellar(self):
+        # Anota en generacion.json lo que este proceso ha escrito
+        sello = dict(self.SELLO_INICIAL, **self.sello)
+        sello["generacion"] += 1
+        for tipo in self.colecciones_escritas:
+            sello[tipo] = sello["generacion"]
+        if self.diario_compactado:
+            sello["compactaciones"] += 1
+        with escritura_atomica(self.ruta("generacion.json")) as f:
+            json.dump(sello, f)
+        self.sello = sello
+        self.colecciones_escritas = set()
+        self.diario_escrito = False
+        self.diario_compactado = False
+    
+    def ponerse_al_dia(self, app):
+        # Incorpora lo que otros procesos escribieron desde la última vez:
+        # solo se recargan los archivos de las colecciones reescritas y se
+        # aplican los registros nuevos del diario. Devuelve los cambios
+        # externos de cada colección: los IDs afectados o None si se
+        # recargó entera (vacío si no hubo cambios).
+        # Con el almacenamiento "json" cada escritura reescribe su colección,
+        # así que cualquier cambio de otro proceso obliga a recargar y
+        # reindexar la colección entera; con "diario" solo se leen los
+        # registros nuevos y con "sqlite" no se recarga nada.
+        sello = self.leer_sello()
+        if sello == self.sello:
+            return {}
+        
+        if sello.get("compactaciones") != self.sello.get("compactaciones"):
+            # El diario se vació y volvió a empezar
+            self.diario.posicion = 0
+            self.diario.registros = 0
+        cambios = {}
+        for tipo in self.ENTIDADES:
+            if sello.get(tipo) != self.sello.get(tipo):
+                self.cargar_coleccion(app, tipo)
+                cambios[tipo] = None
+        for tipo, ids in self.reproducir_diario(app, self.diario.leer_desde()).items():
+            if cambios.get(tipo, ()) is not None:
+                cambios[tipo] = ids
+        
+        # Los contadores solo avanzan
+        try:
+            contadores = self.leer_contadores()
+            Usuario.ultimo_id = max(Usuario.ultimo_id, contadores.get("usuario_id", 0))
+            Libro.ultimo_id = max(Libro.ultimo_id, contadores.get("libro_id", 0))
+            Prestamo.ultimo_id = max(Prestamo.ultimo_id, contadores.get("prestamo_id", 0))
+        except (OSError, ValueError):
+            pass
+        if self.contadores_diario:
+            Usuario.ultimo_id = max(Usuario.ultimo_id, self.contadores_diario[0])
+            Libro.ultimo_id = max(Libro.ultimo_id, self.contadores_diario[1])
+            Prestamo.ultimo_id = max(Prestamo.ultimo_id, self.contadores_diario[2])
+        
+        self.sello = sello
+        return cambios
+    
+    def filas_activas(self, app):
+        # Préstamos activos por orden de ID con su usuario y su libro (para
+        # la vista de préstamos activos); aquí todo está en memoria
+        for prestamo in sorted(app.prestamos.filtrar(devuelto=False), key=lambda p: p.id):
+            yield prestamo, app.usuarios.obtener(prestamo.usuario_id), app.libros.obtener(prestamo.libro_id)
+    
+    def cerrar(self):
+        self.diario.cerrar()
+        self.textos.cerrar()
+        self.cerrojo.cerrar()
+        if self.historial_en_disco:
+            self.prestamos.cerrar()
+
+# Almacenamiento con diario de cambios: cada modificación se añade al diario
+# y periódicamente se escribe una instantánea JSON completa
+class AlmacenamientoDiario(AlmacenamientoJSON):
+    # Número de registros en el diario a partir del cual se genera una
+    # instantánea completa y se compacta el diario
+    LIMITE_DIARIO = 1000
+    
+    usa_diario = True
+    
+    def guardar(self, app, tipos=None):
+        # Una instantánea completa hace innecesarios los registros anteriores
+        super().guardar(app)
+        self.diario.vaciar()
+        self.diario_compactado = True
+    
+    def registrar(self, app, cambios):
+        # Cada cambio es una tupla (operación, tipo, valor): para "guardar"
+        # el valor es la entidad y para "eliminar" su ID
+        contadores = [Usuario.ultimo_id, Libro.ultimo_id, Prestamo.ultimo_id]
+        registros = []
+        for operacion, tipo, valor in cambios:
+            if operacion == "guardar":
+                registros.append({"op": operacion, "tipo": tipo, "datos": valor.to_dict(), "contadores": contadores})
+            else:
+                registros.append({"op": operacion, "tipo": tipo, "id": valor, "contadores": contadores})
+        self.diario.escribir(registros)
+        self.diario_escrito = True
+        
+        if self.diario.registros >= self.LIMITE_DIARIO:
+            self.compactar_diario(app)
+
+# Almacenamiento en una base de datos SQLite (data/biblioteca.db). Las
+# búsquedas y consultas se resuelven con columnas indexadas y cada
+# operación se confirma en su propia transacción.
+class AlmacenamientoSQLite:
+    # Filas que se conservan en la tabla "cambios"
+    LIMITE_CAMBIOS = 10000
+    
+    def __init__(self, directorio, historial_en_disco=False, formato="json", descripciones_en_disco=False):
+        # El historial y las descripciones siempre están en disco y no hay
+        # instantáneas: las opciones no tienen efecto
+        self.directorio = directorio
+        self.conexion = None
+        self.bloqueos = 0
+        self.version_datos = None
+        # Último cambio de la tabla "cambios" ya incorporado
+        self.secuencia = 0
+        self.procesos_carga = None
+        self.tiempos = {}
+    
+    @property
+    def bytes_escritos(self):
+        return self.usuarios.bytes_escritos + self.libros.bytes_escritos + self.prestamos.bytes_escritos
+    
+    def ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+    
+    def crear_repositorios(self):
+        if not os.path.exists(self.directorio):
+            os.makedirs(self.directorio)
+        
+        # Primera apertura con datos JSON existentes: migrarlos
+        archivos_json = ["usuarios.json", "libros.json", "prestamos.json", "prestamos.jsonl", "historial.jsonl", "diario.jsonl",
+                         "usuarios.bin", "libros.bin", "prestamos.bin"]
+        migrar = (not os.path.exists(self.ruta("biblioteca.db")) and
+                  any(os.path.exists(self.ruta(nombre)) for nombre in archivos_json))
+        
+        # Con varios procesos, una transacción puede esperar a que otra termine
+        self.conexion = sqlite3.connect(self.ruta("biblioteca.db"), timeout=30)
+        self.usuarios = RepositorioSQLite(
+            self.conexion, "usuarios", Usuario,
+            ["id", "nombre", "email", "telefono", "baja"],
+            booleanos=["baja"], buscable=True,
+            consultas={"email": "clave_email = ?", "bajas": "baja = ?"},
+            calculadas={"clave_email": Usuario.clave_email}
+        )
+        self.libros = RepositorioSQLite(
+            self.conexion, "libros", Libro,
+            ["id", "titulo", "autor", "isbn", "descripcion", "disponible", "baja"],
+            booleanos=["disponible", "baja"], buscable=True,
+            consultas={"isbn": "clave_isbn = ?", "bajas": "baja = ?"},
+            calculadas={"clave_isbn": Libro.clave_isbn}
+        )
+        self.prestamos = RepositorioSQLite(
+            self.conexion, "prestamos", Prestamo,
+            ["id", "usuario_id", "libro_id", "fecha_prestamo", "fecha_devolucion", "devuelto", "fecha_vencimiento"],
+            booleanos=["devuelto"],
+            consultas={
+                "activos_por_libro": "devuelto = 0 AND libro_id = ?",
+                "devueltos_por_libro": "devuelto = 1 AND libro_id = ?",
+                "activos_por_usuario": "devuelto = 0 AND usuario_id = ?",
+                "devueltos_por_usuario": "devuelto = 1 AND usuario_id = ?"
+            }
+        )
+        # Las claves normalizadas de email e ISBN se añaden en tablas ya
+        # existentes y se calculan para sus filas
+        for repositorio, indices in ((self.usuarios, ["email", "clave_email", "baja"]),
+                                     (self.libros, ["isbn", "clave_isbn", "baja"])):
+            nuevas = [columna for columna in repositorio.crear_tabla(indices) if columna in repositorio.calculadas]
+            if nuevas:
+                repositorio.actualizar_calculadas(nuevas)
+        # Índices compuestos: sin ellos SQLite elige el de "devuelto", que
+        # apenas filtra, para las consultas por usuario o libro
+        nuevas = self.prestamos.crear_tabla(["usuario_id, devuelto", "libro_id, devuelto", "devuelto",
+                                             "usuario_id, devuelto, fecha_vencimiento", "devuelto, fecha_vencimiento"])
+        if "fecha_vencimiento" in nuevas:
+            # Base de datos anterior a las fechas de vencimiento: se calculan con el plazo actual
+            self.conexion.execute("UPDATE prestamos SET fecha_vencimiento = date(fecha_prestamo, ?)",
+                                  (f"+{Prestamo.dias_prestamo} days",))
+        # user_version 1: textos de búsqueda de texto_busqueda(), sin
+        # diacríticos. Las bases de datos anteriores solo los tenían en minúsculas.
+        if self.conexion.execute("PRAGMA user_version").fetchone()[0] < 1:
+            self.usuarios.actualizar_textos()
+            self.libros.actualizar_textos()
+            self.conexion.execute("PRAGMA user_version = 1")
+        self.conexion.execute("CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER)")
+        # Registro de las entidades modificadas en cada transacción, para que
+        # los demás procesos sepan qué tienen que refrescar. tipo "*": cambios
+        # en bloque. Solo se conservan los LIMITE_CAMBIOS últimos.
+        self.conexion.execute("CREATE TABLE IF NOT EXISTS cambios "
+                              "(secuencia INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT, entidad_id INTEGER)")
+        self.conexion.commit()
+        
+        if migrar:
+            print("Migrando los datos JSON a SQLite...")
+            self.migrar_desde_json()
+        
+        return self.usuarios, self.libros, self.prestamos
+    
+    def migrar_desde_json(self):
+        # Se cargan los archivos JSON (y su diario) en repositorios sin
+        # índices y se vuelcan en bloque a las tablas
+        origen = AlmacenamientoJSON(self.directorio)
+        datos = types.SimpleNamespace(usuarios=Repositorio(), libros=Repositorio(), prestamos=Repositorio())
+        origen.cargar(datos)
+        origen.cargar_contadores(datos)
+        origen.cerrar()
+        
+        self.usuarios.reemplazar(datos.usuarios)
+        self.libros.reemplazar(datos.libros)
+        self.prestamos.reemplazar(datos.prestamos)
+        self.guardar_contadores()
+        self.conexion.commit()
+    
+    def cargar(self, app):
+        # No hay nada que materializar: las entidades se leen bajo demanda
+        self.version_datos = self.conexion.execute("PRAGMA data_version").fetchone()[0]
+        self.secuencia = self.ultima_secuencia()
+    
+    def ultima_secuencia(self):
+        return self.conexion.execute("SELECT COALESCE(MAX(secuencia), 0) FROM cambios").fetchone()[0]
+    
+    def anotar_cambios(self, cambios):
+        # Si este proceso ya había incorporado todos los cambios anteriores,
+        # los suyos no hace falta leerlos después
+        al_dia = self.ultima_secuencia() == self.secuencia
+        self.conexion.executemany("INSERT INTO cambios (tipo, entidad_id) VALUES (?, ?)", cambios)
+        ultima = self.ultima_secuencia()
+        self.conexion.execute("DELETE FROM cambios WHERE secuencia <= ?", (ultima - self.LIMITE_CAMBIOS,))
+        if al_dia:
+            self.secuencia = ultima
+    
+    def cargar_contadores(self, app):
+        contadores = dict(self.conexion.execute("SELECT nombre, valor FROM contadores"))
+        if contadores:
+            Usuario.ultimo_id = contadores.get("usuario_id", 0)
+            Libro.ultimo_id = contadores.get("libro_id", 0)
+            Prestamo.ultimo_id = contadores.get("prestamo_id", 0)
+        else:
+            Usuario.ultimo_id = self.conexion.execute("SELECT COALESCE(MAX(id), 0) FROM usuarios").fetchone()[0]
+            Libro.ultimo_id = self.conexion.execute("SELECT COALESCE(MAX(id), 0) FROM libros").fetchone()[0]
+            Prestamo.ultimo_id = self.conexion.execute("SELECT COALESCE(MAX(id), 0) FROM prestamos").fetchone()[0]
+    
+    def guardar_contadores(self):
+        self.conexion.executemany(
+            "INSERT OR REPLACE INTO contadores (nombre, valor) VALUES (?, ?)",
+            [("usuario_id", Usuario.ultimo_id), ("libro_id", Libro.ultimo_id), ("prestamo_id", Prestamo.ultimo_id)]
+        )
+    
+    def guardar(self, app):
+        self.guardar_contadores()
+        self.anotar_cambios([("*", None)])
+        self.conexion.commit()
+    
+    def registrar(self, app, cambios):
+        # Los repositorios ya escribieron las filas en la transacción abierta;
+        # se vuelven a escribir las entidades modificadas directamente (por
+        # ejemplo, la disponibilidad de un libro) y se confirma todo junto
+        try:
+            modificadas = []
+            for operacion, tipo, valor in cambios:
+                repositorio = getattr(self, tipo)
+                if operacion == "guardar":
+                    repositorio.escribir([valor])
+                    modificadas.append((tipo, valor.id))
+                else:
+                    if valor in repositorio:
+                        repositorio.eliminar(valor)
+                    modificadas.append((tipo, valor))
+            self.guardar_contadores()
+            self.anotar_cambios(modificadas)
+            self.conexion.commit()
+        except sqlite3.Error:
+            self.conexion.rollback()
+            raise
+    
+    # Acceso compartido: SQLite ya coordina a los procesos. Una transacción
+    # inmediata toma el cerrojo de escritura antes de leer nada, así que la
+    # comprobación y la escritura de cada operación no se intercalan con
+    # las de otro proceso.
+    def bloquear(self, exclusivo=True):
+        if not self.bloqueos and exclusivo and not self.conexion.in_transaction:
+            self.conexion.execute("BEGIN IMMEDIATE")
+        self.bloqueos += 1
+    
+    def desbloquear(self):
+        self.bloqueos -= 1
+        if not self.bloqueos and self.conexion.in_transaction:
+            self.conexion.commit()
+    
+    def ponerse_al_dia(self, app):
+        # Las entidades se leen siempre de la base de datos; si otra conexión
+        # confirmó cambios se avanzan los contadores y se devuelven los IDs
+        # modificados de cada colección, como en AlmacenamientoJSON (None:
+        # cambios en bloque o demasiado antiguos para seguir en la tabla)
+        version = self.conexion.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.version_datos:
+            return {}
+        self.version_datos = version
+        contadores = dict(self.conexion.execute("SELECT nombre, valor FROM contadores"))
+        Usuario.ultimo_id = max(Usuario.ultimo_id, contadores.get("usuario_id", 0))
+        Libro.ultimo_id = max(Libro.ultimo_id, contadores.get("libro_id", 0))
+        Prestamo.ultimo_id = max(Prestamo.ultimo_id, contadores.get("prestamo_id", 0))
+        
+        filas = self.conexion.execute("SELECT secuencia, tipo, entidad_id FROM cambios WHERE secuencia > ? "
+                                      "ORDER BY secuencia", (self.secuencia,)).fetchall()
+        if not filas:
+            return {}
+        cambios = {}
+        if filas[0][0] != self.secuencia + 1 or any(tipo == "*" for _, tipo, _ in filas):
+            cambios = {tipo: None for tipo in ("usuarios", "libros", "prestamos")}
+        else:
+            for _, tipo, id in filas:
+                cambios.setdefault(tipo, set()).add(id)
+        self.secuencia = filas[-1][0]
+        return cambios
+    
+    def filas_activas(self, app):
+        # Como en AlmacenamientoJSON, pero con una sola consulta que une cada
+        # préstamo activo con su usuario y su libro en lugar de dos
+        # consultas por préstamo. Los préstamos sin usuario o libro no se
+        # listan en la vista, así que basta con JOIN.
+        repositorios = (self.prestamos, self.usuarios, self.libros)
+        columnas = [f"{alias}.{columna}" for alias, repositorio in zip("pul", repositorios)
+                    for columna in repositorio.columnas]
+        cursor = self.conexion.execute(
+            f"SELECT {', '.join(columnas)} FROM prestamos p "
+            "JOIN usuarios u ON u.id = p.usuario_id JOIN libros l ON l.id = p.libro_id "
+            "WHERE p.devuelto = 0 ORDER BY p.id"
+        )
+        n, m = len(self.prestamos.columnas), len(self.prestamos.columnas) + len(self.usuarios.columnas)
+        # Un mismo usuario o libro se crea una sola vez aunque tenga varios préstamos
+        usuarios, libros = {}, {}
+        for fila in cursor:
+            usuario = usuarios.get(fila[n])
+            if usuario is None:
+                usuario = usuarios[fila[n]] = self.usuarios.entidad(fila[n:m])
+            libro = libros.get(fila[m])
+            if libro is None:
+                libro = libros[fila[m]] = self.libros.entidad(fila[m:])
+            yield self.prestamos.entidad(fila[:n]), usuario, libro
+    
+    def cerrar(self):
+        if self.conexion is not None:
+            self.conexion.commit()
+            self.conexion.close()
+            self.conexion = None
+
+def migrar_json_a_sqlite(directorio="data"):
+    # Migración explícita de los archivos JSON a data/biblioteca.db.
+    # Sobrescribe el contenido de la base de datos si ya existía.
+    almacenamiento = AlmacenamientoSQLite(directorio)
+    almacenamiento.crear_repositorios()
+    almacenamiento.migrar_desde_json()
+    almacenamiento.cerrar()
+
+def convertir_instantaneas(directorio="data", formato="binario", descripciones_en_disco=False):
+    # Reescribe las instantáneas de usuarios, libros y préstamos en el
+    # formato indicado ("json" o "binario"), con el diario ya integrado.
+    # Los préstamos de historial.jsonl también pasan a la instantánea.
+    # Las descripciones se escriben primero dentro de la instantánea y,
+    # con descripciones_en_disco, después en un descripciones.dat nuevo,
+    # sin las versiones antiguas de las descripciones editadas.
+    almacenamiento = AlmacenamientoJSON(directorio, formato=formato)
+    datos = types.SimpleNamespace(usuarios=Repositorio(), libros=Repositorio(), prestamos=Repositorio())
+    almacenamiento.cargar(datos)
+    almacenamiento.cargar_contadores(datos)
+    almacenamiento.compactar_diario(datos)
+    if descripciones_en_disco:
+        almacenamiento.descripciones_en_disco = True
+        almacenamiento.guardar(datos, {"libros"})
+    almacenamiento.cerrar()
+
+# Guardado agrupado (group commit): acumula los cambios registrados y los
+# entrega juntos al almacenamiento cuando se llega al número máximo de
+# operaciones o pasa la ventana de tiempo desde el primer cambio pendiente.
+# Con operaciones=1 (por defecto) cada cambio se guarda en el momento.
+class ProgramadorGuardado:
+    def __init__(self, almacenamiento, ventana=None, operaciones=1):
+        # ventana: segundos que puede esperar un cambio (None: sin límite)
+        self.almacenamiento = almacenamiento
+        self.ventana = ventana
+        self.operaciones = max(1, operaciones)
+        self.cambios = []
+        self.pendientes = 0
+        self.limite = None
+    
+    def anotar(self, app, cambios):
+        if not self.pendientes and self.ventana is not None:
+            self.limite = time.monotonic() + self.ventana
+        self.cambios.extend(cambios)
+        self.pendientes += 1
+        if self.vencido():
+            self.vaciar(app)
+    
+    def vencido(self):
+        if not self.pendientes:
+            return False
+        return (self.pendientes >= self.operaciones or
+                (self.limite is not None and time.monotonic() >= self.limite))
+    
+    def vaciar(self, app):
+        # Una sola escritura para todos los cambios pendientes. Si falla,
+        # los cambios siguen pendientes.
+        if self.pendientes:
+            self.almacenamiento.registrar(app, self.cambios)
+            self.descartar()
+    
+    def descartar(self):
+        self.cambios = []
+        self.pendientes = 0
+        self.limite = None
+
+# Métricas de rendimiento: llamadas, histograma de latencias y bytes
+# escritos por operación. Solo existen si se activan en BibliotecaApp.
+class Metricas:
+    # Límites superiores (en milisegundos) de los intervalos del histograma
+    LIMITES_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000]
+    
+    def __init__(self, ruta_volcado=None, intervalo=60):
+        self.operaciones = {}
+        # Funciones oyente(nombre, ms, bytes) llamadas tras cada operación
+        self.oyentes = []
+        self.ruta_volcado = ruta_volcado
+        self.intervalo = intervalo
+        self.proximo_volcado = time.monotonic() + intervalo
+    
+    def registrar(self, nombre, ms, bytes_escritos=0):
+        datos = self.operaciones.get(nombre)
+        if datos is None:
+            datos = self.operaciones[nombre] = {
+                "llamadas": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "bytes_escritos": 0,
+                "histograma": [0] * (len(self.LIMITES_MS) + 1)
+            }
+        datos["llamadas"] += 1
+        datos["total_ms"] += ms
+        datos["max_ms"] = max(datos["max_ms"], ms)
+        datos["bytes_escritos"] += bytes_escritos
+        datos["histograma"][bisect.bisect_left(self.LIMITES_MS, ms)] += 1
+        
+        for oyente in self.oyentes:
+            oyente(nombre, ms, bytes_escritos)
+        
+        # Volcado periódico a disco, comprobado al terminar cada operación
+        if self.ruta_volcado and time.monotonic() >= self.proximo_volcado:
+            self.volcar()
+    
+    def percentil(self, datos, p):
+        # Aproximación: límite superior del intervalo que contiene el percentil
+        objetivo = datos["llamadas"] * p / 100
+        acumulado = 0
+        for i, cantidad in enumerate(datos["histograma"]):
+            acumulado += cantidad
+            if acumulado >= objetivo and cantidad:
+                return self.LIMITES_MS[i] if i < len(self.LIMITES_MS) else datos["max_ms"]
+        return datos["max_ms"]
+    
+    def resumen(self):
+        etiquetas = [f"<={limite}ms" for limite in self.LIMITES_MS] + [f">{self.LIMITES_MS[-1]}ms"]
+        return {
+            nombre: {
+                "llamadas": datos["llamadas"],
+                "media_ms": datos["total_ms"] / datos["llamadas"],
+                "p50_ms": self.percentil(datos, 50),
+                "p95_ms": self.percentil(datos, 95),
+                "max_ms": datos["max_ms"],
+                "bytes_escritos": datos["bytes_escritos"],
+                "histograma": dict(zip(etiquetas, datos["histograma"]))
+            }
+            for nombre, datos in sorted(self.operaciones.items())
+        }
+    
+    def volcar(self, ruta=None):
+        ruta = ruta or self.ruta_volcado
+        with escritura_atomica(ruta, encoding="utf-8") as f:
+            json.dump({
+                "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+                "operaciones": self.resumen()
+            }, f, indent=4, ensure_ascii=False)
+        self.proximo_volcado = time.monotonic() + self.intervalo
+
+def instrumentar(funcion, nombre, metricas, almacenamiento):
+    # Envuelve una función para medir su duración y los bytes escritos por
+    # el almacenamiento mientras se ejecuta
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        bytes_antes = almacenamiento.bytes_escritos
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            metricas.registrar(
+                nombre,
+                (time.perf_counter() - inicio) * 1000,
+                almacenamiento.bytes_escritos - bytes_antes
+            )
+    return envoltura
+
+# Vista materializada de los préstamos activos: guarda cada fila
+# (prestamo, usuario, libro) ya resuelta junto con su texto de búsqueda en
+# minúsculas. BibliotecaApp la actualiza en cada préstamo, devolución,
+# edición o eliminación, así que consultarla no toca los repositorios.
+# Mantiene además los IDs ordenados para paginar sin ordenar la vista.
+class VistaPrestamosActivos:
+    def __init__(self):
+        self.filas = {}
+        self.textos = {}
+        self.ids = []
+    
+    def __len__(self):
+        return len(self.filas)
+    
+    def agregar(self, prestamo, usuario, libro):
+        # Los préstamos sin usuario o libro no se listan. Una fila que ya
+        # existe se sustituye sin cambiar su posición en el listado.
+        if usuario and libro:
+            if prestamo.id not in self.filas:
+                # Los préstamos nuevos suelen tener el mayor ID
+                if not self.ids or prestamo.id > self.ids[-1]:
+                    self.ids.append(prestamo.id)
+                else:
+                    bisect.insort(self.ids, prestamo.id)
+            self.filas[prestamo.id] = (prestamo, usuario, libro)
+            self.textos[prestamo.id] = texto_busqueda([usuario.nombre, libro.titulo, str(prestamo.id)])
+        else:
+            self.quitar(prestamo.id)
+    
+    def quitar(self, prestamo_id):
+        if self.filas.pop(prestamo_id, None) is not None:
+            del self.ids[bisect.bisect_left(self.ids, prestamo_id)]
+        self.textos.pop(prestamo_id, None)
+    
+    def vaciar(self):
+        self.filas = {}
+        self.textos = {}
+        self.ids = []
+    
+    def listar(self):
+        return list(self.filas.values())
+    
+    def iterar_desde(self, desde=1):
+        # Filas con ID >= desde por orden de ID (fuente para Paginador)
+        for i in range(bisect.bisect_left(self.ids, desde), len(self.ids)):
+            yield self.filas[self.ids[i]]
+    
+    def buscar(self, termino):
+        return [self.filas[id] for id, texto in self.textos.items() if termino in texto]
+
+# Estadísticas de circulación. Los préstamos se recorren una sola vez para
+# construir columnas (array de enteros: usuario, libro, día de préstamo y,
+# para los devueltos, días de préstamo y devolución); cada informe se
+# calcula después sobre esas columnas con funciones que recorren el array
+# en C (Counter, sum) y se guarda en caché. Registrar y devolver préstamos
+# amplía las columnas y descarta los informes calculados.
+class InformesCirculacion:
+    def __init__(self, usuarios, libros, prestamos):
+        self.usuarios = usuarios
+        self.libros = libros
+        self.prestamos = prestamos
+        self.columnas = None
+        self.cache = {}
+    
+    def invalidar(self):
+        # Los préstamos cambiaron en bloque (carga, importación, otro proceso)
+        self.columnas = None
+        self.cache = {}
+    
+    def descartar(self):
+        # Cambió algo que afecta a los informes pero no a las columnas
+        self.cache = {}
+    
+    def construir(self):
+        # Una sola lectura de los préstamos (con historial_en_disco, los
+        # devueltos se leen del archivo) y una pasada en C por columna
+        prestamos = list(self.prestamos)
+        devueltos = [prestamo for prestamo in prestamos if prestamo.devuelto]
+        try:
+            self.columnas = {
+                "usuario": array.array("q", map(operator.attrgetter("usuario_id"), prestamos)),
+                "libro": array.array("q", map(operator.attrgetter("libro_id"), prestamos)),
+                "dia": array.array("l", map(operator.attrgetter("dia_prestamo"), prestamos)),
+                "inicio": array.array("l", map(operator.attrgetter("dia_prestamo"), devueltos)),
+                "fin": array.array("l", map(operator.attrgetter("dia_devolucion"), devueltos))
+            }
+        except TypeError:
+            # Datos antiguos con IDs vacíos o fechas que no son ordinales:
+            # cuentan como 0 y no entran en los informes por fecha
+            self.columnas = {nombre: array.array(tipo) for nombre, tipo in
+                             (("usuario", "q"), ("libro", "q"), ("dia", "l"), ("inicio", "l"), ("fin", "l"))}
+            for prestamo in prestamos:
+                self.prestamo_registrado(prestamo)
+                if prestamo.devuelto:
+                    self.prestamo_devuelto(prestamo)
+    
+    def columna(self, nombre):
+        if self.columnas is None:
+            self.construir()
+        return self.columnas[nombre]
+    
+    def prestamo_registrado(self, prestamo):
+        if self.columnas is not None:
+            self.columnas["usuario"].append(prestamo.usuario_id or 0)
+            self.columnas["libro"].append(prestamo.libro_id or 0)
+            self.columnas["dia"].append(prestamo.dia_prestamo if isinstance(prestamo.dia_prestamo, int) else 0)
+        self.cache = {}
+    
+    def prestamo_devuelto(self, prestamo):
+        if self.columnas is not None and isinstance(prestamo.dia_prestamo, int) and isinstance(prestamo.dia_devolucion, int):
+            self.columnas["inicio"].append(prestamo.dia_prestamo)
+            self.columnas["fin"].append(prestamo.dia_devolucion)
+        self.cache = {}
+    
+    def calculado(self, clave, calcular):
+        if clave not in self.cache:
+            self.cache[clave] = calcular()
+        return self.cache[clave]
+    
+    def conteo(self, nombre):
+        # Número de préstamos por valor de la columna
+        return self.calculado(("conteo", nombre), lambda: collections.Counter(self.columna(nombre)))
+    
+    def por_mes(self):
+        # [("YYYY-MM", préstamos)] en orden cronológico. Se cuenta por día y
+        # después se agrupan los pocos días distintos en meses.
+        def calcular():
+            meses = collections.Counter()
+            for dia, n in self.conteo("dia").items():
+                if dia > 0:
+                    meses[fecha_de_ordinal(dia)[:7]] += n
+            return sorted(meses.items())
+        return self.calculado("por_mes", calcular)
+    
+    def duracion_media(self):
+        # Días entre préstamo y devolución de los préstamos devueltos
+        def calcular():
+            inicio, fin = self.columna("inicio"), self.columna("fin")
+            return (sum(fin) - sum(inicio)) / len(inicio) if inicio else None
+        return self.calculado("duracion_media", calcular)
+    
+    def mas_frecuentes(self, nombre, repositorio, limite):
+        # [(entidad, préstamos)] de más a menos préstamos; las entidades
+        # eliminadas no aparecen
+        def calcular():
+            # Se piden más candidatos mientras falten por entidades eliminadas
+            conteo = self.conteo(nombre)
+            candidatos = limite
+            while True:
+                mas_frecuentes = conteo.most_common(candidatos)
+                filas = [(repositorio.obtener(id), n) for id, n in mas_frecuentes]
+                filas = [(entidad, n) for entidad, n in filas if entidad]
+                if len(filas) >= limite or len(mas_frecuentes) < candidatos:
+                    return filas[:limite]
+                candidatos *= 2
+        return self.calculado((nombre, limite), calcular)
+    
+    def libros_mas_prestados(self, limite=10):
+        return self.mas_frecuentes("libro", self.libros, limite)
+    
+    def usuarios_mas_activos(self, limite=10):
+        return self.mas_frecuentes("usuario", self.usuarios, limite)
+    
+    def autores_mas_prestados(self, limite=10):
+        # [(autor, préstamos)]: suma los préstamos de los libros de cada autor
+        def calcular():
+            por_libro = self.conteo("libro")
+            autores = collections.Counter()
+            for libro in self.libros:
+                n = por_libro.get(libro.id)
+                if n:
+                    autores[libro.autor] += n
+            return autores.most_common(limite)
+        return self.calculado(("autores", limite), calcular)
+
+# Ejecuta un método de BibliotecaApp dentro de app.acceso()
+def con_acceso(metodo):
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with self.acceso():
+            return metodo(self, *args, **kwargs)
+    return envoltura
+
+# Clase principal de la aplicación
+class BibliotecaApp:
+    # Modos de almacenamiento disponibles
+    ALMACENAMIENTOS = {
+        "json": AlmacenamientoJSON,
+        "diario": AlmacenamientoDiario,
+        "sqlite": AlmacenamientoSQLite
+    }
+    
+    # Qué hacer al eliminar un usuario o un libro que tiene préstamos:
+    # "bloquear" no lo elimina, "cascada" elimina también sus préstamos y
+    # "baja" lo conserva marcado como dado de baja (no aparece en las
+    # búsquedas ni puede recibir préstamos nuevos)
+    POLITICAS_ELIMINACION = ("bloquear", "cascada", "baja")
+    
+    # Campo de valores únicos de cada colección (también es el nombre de su
+    # índice) y la función que lo normaliza
+    CLAVES_UNICAS = {"usuarios": ("email", normalizar_email), "libros": ("isbn", normalizar_isbn)}
+    
+    # Métodos que no se miden al activar las métricas
+    NO_INSTRUMENTAR = {"activar_metricas", "desactivar_metricas", "leer_registros", "acceso"}
+    
+    def __init__(self, directorio="data", almacenamiento="json", historial_en_disco=False, metricas=False,
+                 ventana_guardado=None, operaciones_guardado=1, compartido=False, formato="json", dias_prestamo=None,
+                 descripciones_en_disco=False, procesos_carga=None, eliminacion="bloquear", claves_unicas=True):
+        # almacenamiento: "json" reescribe los archivos en cada cambio,
+        # "diario" añade cada cambio a diario.jsonl y compacta periódicamente,
+        # "sqlite" guarda los datos en data/biblioteca.db.
+        # historial_en_disco: los préstamos devueltos no se cargan en memoria.
+        # formato: "json" o "binario" para las instantáneas de los modos
+        # "json" y "diario" (al cargar se acepta cualquiera de los dos).
+        # descripciones_en_disco: las descripciones de los libros se leen de
+        # descripciones.dat al consultarlas en lugar de cargarse en memoria.
+        # metricas: activa la medición de operaciones desde el arranque; si
+        # es una ruta, las métricas se vuelcan periódicamente a ese archivo.
+        # ventana_guardado/operaciones_guardado: agrupar los cambios y
+        # guardarlos como mucho tras esos segundos o ese número de operaciones
+        # compartido: otros procesos usan el mismo directorio de datos. Cada
+        # operación se hace bajo un cerrojo, empieza incorporando los cambios
+        # de los demás y se guarda al terminar (sin guardado agrupado). Con
+        # el almacenamiento "json" incorporar un cambio ajeno supone recargar
+        # la colección entera: para muchos datos conviene "diario" o "sqlite".
+        # dias_prestamo: plazo de los préstamos nuevos (por defecto, Prestamo.dias_prestamo)
+        # procesos_carga: procesos para decodificar las instantáneas JSON al
+        # arrancar (por defecto, uno por núcleo si hay varios y los archivos son grandes)
+        # eliminacion: política por defecto de eliminar_usuario y eliminar_libro
+        # claves_unicas: rechazar un usuario cuyo email, o un libro cuyo
+        # ISBN, ya tiene otro (al agregar, actualizar e importar)
+        if eliminacion not in self.POLITICAS_ELIMINACION:
+            raise ValueError(f"Política de eliminación desconocida: {eliminacion}")
+        self.eliminacion = eliminacion
+        self.claves_unicas = claves_unicas
+        self.directorio = directorio
+        if dias_prestamo:
+            Prestamo.dias_prestamo = dias_prestamo
+        self.compartido = compartido
+        if compartido:
+            ventana_guardado, operaciones_guardado = None, 1
+        self.almacenamiento = self.ALMACENAMIENTOS[almacenamiento](directorio, historial_en_disco, formato,
+                                                                   descripciones_en_disco)
+        self.almacenamiento.procesos_carga = procesos_carga
+        # Desglose en segundos del arranque, por fase (lo muestra --profile-startup)
+        self.tiempos_arranque = self.almacenamiento.tiempos
+        self.programador = ProgramadorGuardado(self.almacenamiento, ventana_guardado, operaciones_guardado)
+        self.metricas = None
+        if metricas:
+            self.activar_metricas(metricas if isinstance(metricas, str) else None)
+        with cronometro(self.tiempos_arranque, "crear repositorios"):
+            self.usuarios, self.libros, self.prestamos = self.almacenamiento.crear_repositorios()
+        
+        # Índices de búsqueda por subcadena. El segundo argumento de cada
+        # índice son los campos de los que depende: cambiar otros (como la
+        # disponibilidad de un libro) no lo actualiza
+        self.usuarios.agregar_indice("texto", IndiceTrigramas(Usuario.campos_busqueda,
+                                                              {"nombre", "email", "telefono", "baja"}))
+        self.libros.agregar_indice("texto", IndiceTrigramas(Libro.campos_busqueda,
+                                                            {"titulo", "autor", "isbn", "baja"}))
+        
+        # Emails e ISBN normalizados: detectan duplicados y permiten buscar
+        # por valor exacto (un ISBN leído con un lector de códigos de barras)
+        self.usuarios.agregar_indice("email", IndiceClave(Usuario.clave_email, {"email", "baja"}))
+        self.libros.agregar_indice("isbn", IndiceClave(Libro.clave_isbn, {"isbn", "baja"}))
+        
+        # Usuarios y libros dados de baja: no salen en sus búsquedas, pero
+        # sus préstamos sí se buscan por nombre y título (ver buscar_prestamo)
+        self.usuarios.agregar_indice("bajas", IndiceHash(lambda u: True if u.baja else None, {"baja"}))
+        self.libros.agregar_indice("bajas", IndiceHash(lambda l: True if l.baja else None, {"baja"}))
+        
+        # Préstamos sin devolver agrupados por libro: permite saber si un
+        # libro está disponible sin recorrer todo el historial
+        self.prestamos.agregar_indice("activos_por_libro", IndiceHash(lambda p: None if p.devuelto else p.libro_id,
+                                                                      {"devuelto", "libro_id"}))
+        
+        # Préstamos de cada usuario y de cada libro, separados en activos y
+        # devueltos, para consultar su historial sin recorrer todos los préstamos
+        self.prestamos.agregar_indice("devueltos_por_libro", IndiceHash(lambda p: p.libro_id if p.devuelto else None,
+                                                                        {"devuelto", "libro_id"}))
+        self.prestamos.agregar_indice("activos_por_usuario", IndiceHash(lambda p: None if p.devuelto else p.usuario_id,
+                                                                        {"devuelto", "usuario_id"}))
+        self.prestamos.agregar_indice("devueltos_por_usuario", IndiceHash(lambda p: p.usuario_id if p.devuelto else None,
+                                                                          {"devuelto", "usuario_id"}))
+        
+        # Préstamos activos ordenados por fecha de vencimiento
+        self.prestamos.agregar_indice("vencimientos", IndiceVencimientos())
+        
+        # Préstamos activos ya unidos con su usuario y su libro
+        self.vista_activos = VistaPrestamosActivos()
+        
+        # Estadísticas de circulación, calculadas al consultarlas
+        self.informes = InformesCirculacion(self.usuarios, self.libros, self.prestamos)
+        
+        if compartido:
+            self.almacenamiento.bloquear()
+        try:
+            self.cargar_datos()
+            with cronometro(self.tiempos_arranque, "contadores"):
+                self.cargar_contadores()
+        finally:
+            if compartido:
+                self.almacenamiento.desbloquear()
+    
+    # Métodos para cargar y guardar datos
+    def cargar_datos(self):
+        self.almacenamiento.cargar(self)
+        with cronometro(self.tiempos_arranque, "vista activos"):
+            self.reconstruir_vista_activos()
+        self.informes.invalidar()
+    
+    def cargar_contadores(self):
+        self.almacenamiento.cargar_contadores(self)
+    
+    @con_acceso
+    def guardar_datos(self):
+        self.sincronizar()
+        self.almacenamiento.guardar(self)
+    
+    def registrar_cambios(self, *cambios):
+        # Cada cambio es una tupla (operación, tipo, valor): para "guardar"
+        # el valor es la entidad y para "eliminar" su ID
+        self.programador.anotar(self, cambios)
+    
+    def sincronizar(self):
+        # Escribe ya los cambios pendientes del guardado agrupado
+        self.programador.vaciar(self)
+    
+    def cerrar(self):
+        self.sincronizar()
+        self.almacenamiento.cerrar()
+        if self.metricas and self.metricas.ruta_volcado:
+            self.metricas.volcar()
+    
+    # Métodos para compartir el directorio de datos entre procesos
+    @contextlib.contextmanager
+    def acceso(self, exclusivo=True):
+        # Sin datos compartidos no hace nada. Con ellos, toma el cerrojo
+        # (exclusivo para modificar, compartido para leer), incorpora lo que
+        # otros procesos hayan guardado y, al salir, guarda los cambios
+        # antes de soltar el cerrojo. Se puede anidar.
+        if not self.compartido:
+            yield
+            return
+        self.almacenamiento.bloquear(exclusivo)
+        try:
+            ultimo_prestamo = Prestamo.ultimo_id
+            cambios = self.almacenamiento.ponerse_al_dia(self)
+            if cambios:
+                self.incorporar_cambios(cambios, ultimo_prestamo)
+            yield
+            if exclusivo:
+                self.sincronizar()
+        finally:
+            self.almacenamiento.desbloquear()
+    
+    def refrescar(self):
+        # Incorpora los cambios guardados por otros procesos (por ejemplo,
+        # antes de mostrar un menú)
+        with self.acceso(exclusivo=False):
+            pass
+    
+    def incorporar_cambios(self, cambios, ultimo_prestamo):
+        # Cambios de otros procesos (ver ponerse_al_dia). Solo se resuelven
+        # de nuevo las filas de la vista de activos que dependen de ellos,
+        # y las columnas de los informes se amplían con los préstamos nuevos
+        # o devueltos; se rehacen únicamente si un préstamo se eliminó o
+        # cambió de otra forma. ultimo_prestamo: mayor ID de préstamo que se
+        # conocía antes de los cambios.
+        prestamos = cambios.get("prestamos", set())
+        if prestamos is None:
+            self.informes.invalidar()
+        else:
+            rehacer = False
+            for id in sorted(prestamos):
+                prestamo = self.obtener_prestamo_por_id(id)
+                fila = self.vista_activos.filas.get(id)
+                if prestamo is None:
+                    rehacer = True
+                elif id > ultimo_prestamo:
+                    self.informes.prestamo_registrado(prestamo)
+                    if prestamo.devuelto:
+                        self.informes.prestamo_devuelto(prestamo)
+                elif fila is None or (fila[0].usuario_id, fila[0].libro_id, fila[0].dia_prestamo) != (
+                        prestamo.usuario_id, prestamo.libro_id, prestamo.dia_prestamo):
+                    # No estaba en la vista (ya devuelto) o cambió lo que cuentan las columnas
+                    rehacer = True
+                elif prestamo.devuelto:
+                    self.informes.prestamo_devuelto(prestamo)
+            if rehacer:
+                self.informes.invalidar()
+        # Los informes muestran nombres y títulos
+        self.informes.descartar()
+        
+        if None in cambios.values():
+            self.reconstruir_vista_activos()
+            return
+        for id in cambios.get("prestamos", ()):
+            prestamo = self.obtener_prestamo_por_id(id)
+            if prestamo is None:
+                self.vista_activos.quitar(id)
+            else:
+                self.refrescar_vista_activos([prestamo])
+        for id in cambios.get("usuarios", ()):
+            self.refrescar_vista_activos(self.prestamos.indice("activos_por_usuario").obtener(id))
+        for id in cambios.get("libros", ()):
+            self.refrescar_vista_activos(self.prestamos.indice("activos_por_libro").obtener(id))
+    
+    # Métodos para métricas de rendimiento
+    def activar_metricas(self, ruta_volcado=None, intervalo=60):
+        # Sustituye en esta instancia los métodos públicos y los del
+        # almacenamiento por versiones medidas. Con las métricas
+        # desactivadas no hay envoltura alguna, así que no cuestan nada.
+        if self.metricas:
+            return self.metricas
+        self.metricas = Metricas(ruta_volcado, intervalo)
+        for nombre, funcion in inspect.getmembers(BibliotecaApp, inspect.isfunction):
+            if not nombre.startswith("_") and nombre not in self.NO_INSTRUMENTAR:
+                setattr(self, nombre, instrumentar(getattr(self, nombre), nombre, self.metricas, self.almacenamiento))
+        for nombre in ("cargar", "cargar_contadores", "guardar", "registrar"):
+            funcion = getattr(self.almacenamiento, nombre)
+            setattr(self.almacenamiento, nombre,
+                    instrumentar(funcion, f"almacenamiento.{nombre}", self.metricas, self.almacenamiento))
+        return self.metricas
+    
+    def desactivar_metricas(self):
+        # Elimina las envolturas de la instancia: vuelven a usarse los métodos de la clase
+        for nombre in list(vars(self)):
+            if callable(getattr(self, nombre)) and hasattr(getattr(self, nombre), "__wrapped__"):
+                delattr(self, nombre)
+        for nombre in ("cargar", "cargar_contadores", "guardar", "registrar"):
+            if nombre in vars(self.almacenamiento):
+                delattr(self.almacenamiento, nombre)
+        metricas, self.metricas = self.metricas, None
+        return metricas
+    
+    # Métodos para mantener la vista de préstamos activos
+    def reconstruir_vista_activos(self):
+        self.vista_activos.vaciar()
+        for prestamo, usuario, libro in self.almacenamiento.filas_activas(self):
+            self.vista_activos.agregar(prestamo, usuario, libro)
+    
+    def refrescar_vista_activos(self, prestamos):
+        # Vuelve a resolver las filas de los préstamos indicados; los que ya
+        # están devueltos salen de la vista
+        for prestamo in prestamos:
+            if prestamo.devuelto:
+                self.vista_activos.quitar(prestamo.id)
+            else:
+                self.vista_activos.agregar(prestamo,
+                                           self.obtener_usuario_por_id(prestamo.usuario_id),
+                                           self.obtener_libro_por_id(prestamo.libro_id))
     
     # Métodos para actualizar disponibilidad de libros
+    def actualizar_disponibilidad_libro(self, libro_id):
+        # Actualización incremental: solo consulta el índice de préstamos activos
+        libro = self.obtener_libro_por_id(libro_id)
+        if libro:
+            self.libros.actualizar(libro, disponible=not self.prestamos.indice("activos_por_libro").contiene(libro_id))
+        return libro
+    
+    @con_acceso
     def actualizar_disponibilidad_libros(self):
-        # Primero marcar todos como disponibles
-        for libro in self.libros:
-            libro.disponible = True
-        
-        # Luego marcar como no disponibles los que están prestados
-        for prestamo in self.prestamos:
-            if not prestamo.devuelto:
-                for libro in self.libros:
-                    if libro.id == prestamo.libro_id:
-                        libro.disponible = False
+        # Recalcula la disponibilidad de todos los libros a partir de los
+        # préstamos. Es una comprobación de consistencia explícita; las
+        # operaciones normales usan actualizar_disponibilidad_libro.
+        # Devuelve el número de libros que estaban desincronizados.
+        activos = self.prestamos.indice("activos_por_libro")
+        # Primero se recorren todos los libros y después se corrigen, para
+        # no modificar la tabla de SQLite mientras se está leyendo
+        desincronizados = [libro for libro in self.libros
+                           if libro.disponible == activos.contiene(libro.id)]
+        for libro in desincronizados:
+            self.libros.actualizar(libro, disponible=not libro.disponible)
+        if desincronizados:
+            self.registrar_cambios(*(("guardar", "libros", libro) for libro in desincronizados))
+        return len(desincronizados)
+    
+    # Comprobación de emails e ISBN repetidos
+    def duplicado(self, tipo, valor, id=None):
+        # Entidad distinta de id que ya tiene ese email o ISBN. None si no
+        # hay, si el valor está vacío o si se permiten duplicados.
+        campo, normalizar = self.CLAVES_UNICAS[tipo]
+        clave = normalizar(valor)
+        if not self.claves_unicas or clave is None:
+            return None
+        return next((entidad for entidad in getattr(self, tipo).indice(campo).obtener(clave) if entidad.id != id), None)
+    
+    def rechazar_duplicado(self, tipo, valor, id=None):
+        # Muestra el error y devuelve True si el valor ya es de otra entidad
+        existente = self.duplicado(tipo, valor, id)
+        if existente is None:
+            return False
+        if tipo == "usuarios":
+            print(f"Error: El email {valor} ya es del usuario {existente.id}.")
+        else:
+            print(f"Error: El ISBN {valor} ya es del libro {existente.id}.")
+        return True
     
     # Métodos para gestión de usuarios
+    @con_acceso
     def agregar_usuario(self, nombre, email, telefono):
+        if self.rechazar_duplicado("usuarios", email):
+            return None
         usuario = Usuario(nombre=nombre, email=email, telefono=telefono)
-        self.usuarios.append(usuario)
-        self.guardar_datos()
+        self.usuarios.agregar(usuario)
+        self.registrar_cambios(("guardar", "usuarios", usuario))
         return usuario
     
-    def buscar_usuario(self, termino):
-        resultados = []
-        termino = termino.lower()
-        for usuario in self.usuarios:
-            if (termino in usuario.nombre.lower() or 
-                termino in usuario.email.lower() or 
-                termino in str(usuario.id).lower() or
-                termino in usuario.telefono.lower()):
-                resultados.append(usuario)
-        return resultados
+    def preparar_busquedas(self):
+        # Construye ya los índices de trigramas en lugar de esperar a la
+        # primera búsqueda (el servidor lo hace al arrancar)
+        for repositorio in (self.usuarios, self.libros):
+            indice = repositorio.indice("texto")
+            if isinstance(indice, IndiceTrigramas) and indice.trigramas is None:
+                indice.construir()
+    
+    def buscar_usuario(self, termino, limite=None):
+        # Resultados de más a menos relevantes; limite: solo los mejores
+        return self.usuarios.buscar(termino, limite)
     
     def obtener_usuario_por_id(self, id):
-        for usuario in self.usuarios:
-            if usuario.id == id:
-                return usuario
-        return None
+        return self.usuarios.obtener(id)
+    
+    def obtener_usuario_por_email(self, email):
+        # Búsqueda exacta en el índice de emails (sin mayúsculas ni espacios
+        # alrededor). Con duplicados permitidos, el de menor ID.
+        return min(self.usuarios.indice("email").obtener(normalizar_email(email)), key=lambda u: u.id, default=None)
     
+    @con_acceso
     def actualizar_usuario(self, id, nombre, email, telefono):
         usuario = self.obtener_usuario_por_id(id)
+        if usuario and self.rechazar_duplicado("usuarios", email, usuario.id):
+            return False
         if usuario:
-            usuario.nombre = nombre
-            usuario.email = email
-            usuario.telefono = telefono
-            self.guardar_datos()
+            self.usuarios.actualizar(usuario, nombre=nombre, email=email, telefono=telefono)
+            self.refrescar_vista_activos(self.prestamos.indice("activos_por_usuario").obtener(usuario.id))
+            self.informes.descartar()
+            self.registrar_cambios(("guardar", "usuarios", usuario))
             return True
         return False
     
-    def eliminar_usuario(self, id):
+    @con_acceso
+    def eliminar_usuario(self, id, politica=None):
+        # politica: una de POLITICAS_ELIMINACION (por defecto, self.eliminacion)
         usuario = self.obtener_usuario_por_id(id)
         if usuario:
-            self.usuarios.remove(usuario)
-            self.guardar_datos()
-            return True
+            return self.eliminar_referenciado("usuarios", usuario, "usuario", politica)
         return False
     
     # Métodos para gestión de libros
+    @con_acceso
     def agregar_libro(self, titulo, autor, isbn, descripcion):
+        if self.rechazar_duplicado("libros", isbn):
+            return None
         libro = Libro(titulo=titulo, autor=autor, isbn=isbn, descripcion=descripcion)
-        self.libros.append(libro)
-        self.guardar_datos()
+        self.libros.agregar(libro)
+        self.registrar_cambios(("guardar", "libros", libro))
         return libro
     
-    def buscar_libro(self, termino):
-        resultados = []
-        termino = termino.lower()
-        for libro in self.libros:
-            if (termino in libro.titulo.lower() or 
-                termino in libro.autor.lower() or 
-                termino in str(libro.id).lower() or
-                termino in libro.isbn.lower()):
-                resultados.append(libro)
-        return resultados
+    def buscar_libro(self, termino, limite=None):
+        # Resultados de más a menos relevantes; limite: solo los mejores
+        return self.libros.buscar(termino, limite)
     
     def obtener_libro_por_id(self, id):
-        for libro in self.libros:
-            if libro.id == id:
-                return libro
-        return None
+        return self.libros.obtener(id)
     
+    def obtener_libro_por_isbn(self, isbn):
+        # Búsqueda exacta en el índice de ISBN (sin guiones ni espacios).
+        # Con duplicados permitidos, el de menor ID.
+        return min(self.libros.indice("isbn").obtener(normalizar_isbn(isbn)), key=lambda l: l.id, default=None)
+    
+    @con_acceso
     def actualizar_libro(self, id, titulo, autor, isbn, descripcion):
         libro = self.obtener_libro_por_id(id)
+        if libro and self.rechazar_duplicado("libros", isbn, libro.id):
+            return False
         if libro:
-            libro.titulo = titulo
-            libro.autor = autor
-            libro.isbn = isbn
-            libro.descripcion = descripcion
-            self.guardar_datos()
+            self.libros.actualizar(libro, titulo=titulo, autor=autor, isbn=isbn, descripcion=descripcion)
+            self.refrescar_vista_activos(self.prestamos.indice("activos_por_libro").obtener(libro.id))
+            self.informes.descartar()
+            self.registrar_cambios(("guardar", "libros", libro))
             return True
         return False
     
-    def eliminar_libro(self, id):
+    @con_acceso
+    def eliminar_libro(self, id, politica=None):
+        # politica: una de POLITICAS_ELIMINACION (por defecto, self.eliminacion)
         libro = self.obtener_libro_por_id(id)
         if libro:
-            self.libros.remove(libro)
-            self.guardar_datos()
-            return True
+            return self.eliminar_referenciado("libros", libro, "libro", politica)
         return False
     
+    # Métodos para mantener la integridad entre préstamos, usuarios y libros
+    def eliminar_referenciado(self, tipo, entidad, clave, politica):
+        # Elimina un usuario o un libro aplicando la política a sus
+        # préstamos. clave: "usuario" o "libro", para los índices de
+        # préstamos, que dicen en O(1) si la entidad tiene alguno.
+        politica = politica or self.eliminacion
+        if politica not in self.POLITICAS_ELIMINACION:
+            raise ValueError(f"Política de eliminación desconocida: {politica}")
+        activos = self.prestamos.indice(f"activos_por_{clave}")
+        devueltos = self.prestamos.indice(f"devueltos_por_{clave}")
+        repositorio = getattr(self, tipo)
+        
+        if politica == "baja":
+            if not entidad.baja:
+                repositorio.actualizar(entidad, baja=True)
+                self.informes.descartar()
+                self.registrar_cambios(("guardar", tipo, entidad))
+            return True
+        
+        if politica == "bloquear":
+            if activos.contiene(entidad.id):
+                print(f"Error: El {clave} tiene préstamos sin devolver.")
+                return False
+            if devueltos.contiene(entidad.id):
+                print(f"Error: El {clave} tiene historial de préstamos. Puede darse de baja en su lugar.")
+                return False
+            prestamos = []
+        else:
+            prestamos = activos.obtener(entidad.id) + devueltos.obtener(entidad.id)
+        
+        # El libro eliminado ya no está cuando eliminar_prestamos actualiza
+        # la disponibilidad de los libros de sus préstamos activos
+        repositorio.eliminar(entidad.id)
+        self.informes.descartar()
+        cambios = [("eliminar", tipo, entidad.id)]
+        cambios.extend(self.eliminar_prestamos(prestamos))
+        self.registrar_cambios(*cambios)
+        return True
+    
+    def eliminar_prestamos(self, prestamos):
+        # Elimina los préstamos y devuelve los cambios a registrar. Los
+        # libros de los que seguían activos vuelven a estar disponibles.
+        cambios = []
+        libros = set()
+        for prestamo in prestamos:
+            self.prestamos.eliminar(prestamo.id)
+            self.vista_activos.quitar(prestamo.id)
+            cambios.append(("eliminar", "prestamos", prestamo.id))
+            if not prestamo.devuelto:
+                libros.add(prestamo.libro_id)
+        for libro_id in sorted(libros):
+            libro = self.actualizar_disponibilidad_libro(libro_id)
+            if libro:
+                cambios.append(("guardar", "libros", libro))
+        if prestamos:
+            self.informes.invalidar()
+        return cambios
+    
+    @con_acceso
+    def verificar_integridad(self, reparar=True):
+        # Busca préstamos cuyo usuario o libro ya no existe (por ejemplo,
+        # eliminados por versiones anteriores, que no comprobaban los
+        # préstamos) con una sola pasada por cada colección: los IDs de
+        # usuarios y libros se reúnen en conjuntos y los préstamos se
+        # recorren una vez. Con reparar, los huérfanos se eliminan.
+        # Devuelve el número de préstamos huérfanos encontrados.
+        usuarios = set(self.usuarios.ids())
+        libros = set(self.libros.ids())
+        huerfanos = [prestamo for prestamo in self.prestamos
+                     if prestamo.usuario_id not in usuarios or prestamo.libro_id not in libros]
+        if reparar and huerfanos:
+            self.registrar_cambios(*self.eliminar_prestamos(huerfanos))
+        return len(huerfanos)
+    
     # Métodos para gestión de préstamos
-    def registrar_prestamo(self, usuario_id, libro_id, fecha_prestamo=None):
+    @con_acceso
+    def registrar_prestamo(self, usuario_id, libro_id, fecha_prestamo=None, fecha_vencimiento=None):
+        # fecha_vencimiento: por defecto, fecha de préstamo más Prestamo.dias_prestamo
+        # Las fechas indicadas deben ser válidas (ValueError si no)
+        for fecha in (fecha_prestamo, fecha_vencimiento):
+            if fecha:
+                convertir_fecha(fecha, estricta=True)
+        
         # Verificar que el usuario existe
         usuario = self.obtener_usuario_por_id(usuario_id)
         if not usuario:
@@ -325,71 +3113,354 @@ class BibliotecaApp:
             print("Error: Libro no encontrado.")
             return None
         
+        if usuario.baja:
+            print("Error: El usuario está dado de baja.")
+            return None
+        
+        if libro.baja:
+            print("Error: El libro está dado de baja.")
+            return None
+        
         if not libro.disponible:
             print("Error: El libro no está disponible.")
             return None
         
+        # Un usuario con préstamos vencidos no puede llevarse más libros
+        if self.tiene_vencidos(usuario_id):
+            print("Error: El usuario tiene préstamos vencidos sin devolver.")
+            return None
+        
         # Crear el préstamo
         prestamo = Prestamo(
             usuario_id=usuario_id,
             libro_id=libro_id,
-            fecha_prestamo=fecha_prestamo
+            fecha_prestamo=fecha_prestamo,
+            fecha_vencimiento=fecha_vencimiento
         )
         
-        self.prestamos.append(prestamo)
+        self.prestamos.agregar(prestamo)
         
-        # Actualizar disponibilidad del libro
-        libro.disponible = False
+        # Actualizar disponibilidad del libro. Se hace a través del
+        # repositorio para que SQLite lo vea aunque el guardado se agrupe.
+        self.libros.actualizar(libro, disponible=False)
+        self.vista_activos.agregar(prestamo, usuario, libro)
+        self.informes.prestamo_registrado(prestamo)
         
-        self.guardar_datos()
+        self.registrar_cambios(("guardar", "prestamos", prestamo), ("guardar", "libros", libro))
         return prestamo
     
+    @con_acceso
     def devolver_libro(self, prestamo_id):
-        for prestamo in self.prestamos:
-            if prestamo.id == prestamo_id and not prestamo.devuelto:
-                prestamo.devuelto = True
-                prestamo.fecha_devolucion = datetime.datetime.now().strftime("%Y-%m-%d")
-                self.actualizar_disponibilidad_libros()
-                self.guardar_datos()
-                return True
+        prestamo = self.obtener_prestamo_por_id(prestamo_id)
+        if prestamo and not prestamo.devuelto:
+            self.prestamos.actualizar(
+                prestamo,
+                devuelto=True,
+                fecha_devolucion=datetime.datetime.now().strftime("%Y-%m-%d")
+            )
+            self.vista_activos.quitar(prestamo.id)
+            self.informes.prestamo_devuelto(prestamo)
+            
+            cambios = [("guardar", "prestamos", prestamo)]
+            libro = self.actualizar_disponibilidad_libro(prestamo.libro_id)
+            if libro:
+                cambios.append(("guardar", "libros", libro))
+            self.registrar_cambios(*cambios)
+            return True
         return False
     
-    def buscar_prestamo(self, termino):
-        resultados = []
-        termino = termino.lower()
+    def buscar_prestamo(self, termino, limite=None):
+        # Coincide con el nombre del usuario, el título del libro o el ID.
+        # Los préstamos activos se buscan en la vista; los devueltos, a
+        # partir de los usuarios y libros que coinciden y de sus índices.
+        # Filas (prestamo, usuario, libro) de más a menos relevantes.
+        termino = normalizar_texto(termino)
+        activos = {fila[0].id: fila for fila in self.vista_activos.buscar(termino)}
         
-        for prestamo in self.prestamos:
-            usuario = self.obtener_usuario_por_id(prestamo.usuario_id)
-            libro = self.obtener_libro_por_id(prestamo.libro_id)
-            
-            if usuario and libro:
-                if (termino in usuario.nombre.lower() or 
-                    termino in libro.titulo.lower() or
-                    termino in str(prestamo.id).lower()):
-                    resultados.append((prestamo, usuario, libro))
+        # Usuarios y libros cuyo nombre o título normalizado contiene el
+        # término. Los dados de baja no salen en sus búsquedas, pero sus
+        # préstamos sí se encuentran, como los activos en la vista.
+        usuarios = {u.id: u for u in itertools.chain(self.usuarios.buscar(termino),
+                                                     self.usuarios.indice("bajas").obtener(True))}
+        nombres = {id: normalizar_texto(u.nombre) for id, u in usuarios.items()}
+        nombres = {id: nombre for id, nombre in nombres.items() if termino in nombre}
+        libros = {l.id: l for l in itertools.chain(self.libros.buscar(termino),
+                                                   self.libros.indice("bajas").obtener(True))}
+        titulos = {id: normalizar_texto(l.titulo) for id, l in libros.items()}
+        titulos = {id: titulo for id, titulo in titulos.items() if termino in titulo}
+        
+        devueltos = {}
+        for usuario_id in nombres:
+            for prestamo in self.prestamos.indice("devueltos_por_usuario").obtener(usuario_id):
+                devueltos[prestamo.id] = prestamo
+        for libro_id in titulos:
+            for prestamo in self.prestamos.indice("devueltos_por_libro").obtener(libro_id):
+                devueltos[prestamo.id] = prestamo
+        # Los IDs solo contienen dígitos. Los préstamos cuyo ID contiene el
+        # término y no se encontraron ya son devueltos (o activos sin
+        # usuario o libro, que no se listan): solo se leen los que llegan
+        # a los resultados.
+        por_id = set()
+        if termino.isdigit():
+            por_id = {id for id in self.prestamos.ids()
+                      if termino in str(id) and id not in activos and id not in devueltos}
+        
+        # Textos para clasificar cada préstamo: los de la vista para los
+        # activos. Para los devueltos basta con el nombre y el título que
+        # coincidieron (los demás no contienen el término), así que solo se
+        # leen el usuario y el libro de los resultados que se devuelven.
+        def texto(id):
+            if id in activos:
+                return self.vista_activos.textos[id]
+            if id in por_id:
+                return f"\n\n\n{id}\n"
+            prestamo = devueltos[id]
+            return f"\n{nombres.get(prestamo.usuario_id, '')}\n{titulos.get(prestamo.libro_id, '')}\n{id}\n"
         
+        ids = clasificar(((id, texto(id)) for id in itertools.chain(activos, devueltos, por_id)), termino, limite)
+        
+        resultados = []
+        for id in ids:
+            if id in activos:
+                resultados.append(activos[id])
+                continue
+            if id in por_id:
+                prestamo = self.obtener_prestamo_por_id(id)
+                if prestamo is None or not prestamo.devuelto:
+                    continue
+            else:
+                prestamo = devueltos[id]
+            usuario = usuarios.get(prestamo.usuario_id) or self.obtener_usuario_por_id(prestamo.usuario_id)
+            libro = libros.get(prestamo.libro_id) or self.obtener_libro_por_id(prestamo.libro_id)
+            if usuario and libro:
+                resultados.append((prestamo, usuario, libro))
         return resultados
     
     def obtener_prestamo_por_id(self, id):
-        for prestamo in self.prestamos:
-            if prestamo.id == id:
-                return prestamo
-        return None
+        return self.prestamos.obtener(id)
+    
+    def prestamos_por_indice(self, nombre, clave):
+        return sorted(self.prestamos.indice(nombre).obtener(clave), key=lambda p: p.id)
+    
+    def prestamos_de_usuario(self, usuario_id):
+        # Devuelve (activos, devueltos) del usuario, ordenados por ID
+        return (self.prestamos_por_indice("activos_por_usuario", usuario_id),
+                self.prestamos_por_indice("devueltos_por_usuario", usuario_id))
+    
+    def historial_de_libro(self, libro_id):
+        # Devuelve (activos, devueltos) del libro, ordenados por ID
+        return (self.prestamos_por_indice("activos_por_libro", libro_id),
+                self.prestamos_por_indice("devueltos_por_libro", libro_id))
     
     def listar_prestamos_activos(self):
-        activos = []
-        for prestamo in self.prestamos:
-            if not prestamo.devuelto:
-                usuario = self.obtener_usuario_por_id(prestamo.usuario_id)
-                libro = self.obtener_libro_por_id(prestamo.libro_id)
-                if usuario and libro:
-                    activos.append((prestamo, usuario, libro))
-        return activos
+        return self.vista_activos.listar()
+    
+    def iterar_prestamos_activos(self, desde=1):
+        # Préstamos activos con ID >= desde, por orden de ID y sin ordenar
+        # la vista: para listados por páginas
+        return self.vista_activos.iterar_desde(desde)
+    
+    def tiene_vencidos(self, usuario_id, hoy=None):
+        # Consulta el préstamo del usuario que vence antes: O(log n)
+        hoy = hoy or datetime.date.today().toordinal()
+        dia = self.prestamos.indice("vencimientos").primer_vencimiento(usuario_id)
+        return dia is not None and dia < hoy
+    
+    def prestamos_vencidos(self, hoy=None):
+        # Filas (prestamo, usuario, libro) de los préstamos vencidos, de la
+        # fecha de vencimiento más antigua a la más reciente
+        hoy = hoy or datetime.date.today().toordinal()
+        filas = []
+        for prestamo in self.prestamos.indice("vencimientos").vencidos(hoy):
+            fila = self.vista_activos.filas.get(prestamo.id)
+            if fila is None:
+                fila = (prestamo, self.obtener_usuario_por_id(prestamo.usuario_id), self.obtener_libro_por_id(prestamo.libro_id))
+            filas.append(fila)
+        return filas
+    
+    # Informes de circulación. Se calculan la primera vez que se consultan
+    # y se reutilizan hasta el siguiente préstamo o devolución.
+    def prestamos_por_mes(self):
+        # [("YYYY-MM", préstamos)] en orden cronológico
+        return self.informes.por_mes()
+    
+    def libros_mas_prestados(self, limite=10):
+        # [(libro, préstamos)] de más a menos préstamos
+        return self.informes.libros_mas_prestados(limite)
+    
+    def autores_mas_prestados(self, limite=10):
+        # [(autor, préstamos)] de más a menos préstamos
+        return self.informes.autores_mas_prestados(limite)
+    
+    def usuarios_mas_activos(self, limite=10):
+        # [(usuario, préstamos)] de más a menos préstamos
+        return self.informes.usuarios_mas_activos(limite)
+    
+    def duracion_media_prestamos(self):
+        # Días de media entre préstamo y devolución (None sin devoluciones)
+        return self.informes.duracion_media()
+    
+    # Métodos para importación masiva
+    # Número de entidades que se añaden juntas a los repositorios
+    TAMANO_LOTE_IMPORTACION = 10000
+    
+    def leer_registros(self, ruta):
+        # Recorre el archivo registro a registro (CSV con cabecera o JSONL)
+        # sin cargarlo completo en memoria. Devuelve (línea, datos).
+        if ruta.lower().endswith(".csv"):
+            with open(ruta, "r", newline="", encoding="utf-8") as f:
+                for numero, fila in enumerate(csv.DictReader(f), 2):
+                    yield numero, fila
+        else:
+            with open(ruta, "r", encoding="utf-8") as f:
+                for numero, linea in enumerate(f, 1):
+                    if not linea.strip():
+                        continue
+                    try:
+                        yield numero, json.loads(linea)
+                    except ValueError:
+                        yield numero, None
+    
+    def validar_importacion(self, tipo, datos, prestados, claves):
+        # Devuelve el diccionario normalizado para from_dict o lanza
+        # ValueError con el motivo del rechazo. claves: emails o ISBN
+        # normalizados de los registros anteriores del archivo.
+        if not isinstance(datos, dict):
+            raise ValueError("registro con formato no válido")
+        
+        valor = datos.get("id")
+        id = int(valor) if valor not in (None, "") else None
+        if id is not None and id in getattr(self, tipo):
+            raise ValueError(f"el ID {id} ya existe")
+        
+        if tipo == "usuarios":
+            if not datos.get("nombre") or not datos.get("email"):
+                raise ValueError("nombre y email son obligatorios")
+            self.validar_clave_unica(tipo, datos["email"], claves)
+            return {
+                "id": id,
+                "nombre": datos["nombre"],
+                "email": datos["email"],
+                "telefono": datos.get("telefono") or ""
+            }
+        
+        if tipo == "libros":
+            if not datos.get("titulo") or not datos.get("autor"):
+                raise ValueError("título y autor son obligatorios")
+            self.validar_clave_unica(tipo, datos.get("isbn"), claves)
+            return {
+                "id": id,
+                "titulo": datos["titulo"],
+                "autor": datos["autor"],
+                "isbn": datos.get("isbn") or "",
+                "descripcion": datos.get("descripcion") or ""
+            }
+        
+        # Préstamos: usuario y libro deben existir y el libro estar disponible
+        usuario_id = int(datos.get("usuario_id") or 0)
+        libro_id = int(datos.get("libro_id") or 0)
+        usuario = self.obtener_usuario_por_id(usuario_id)
+        if not usuario:
+            raise ValueError(f"usuario {usuario_id} no encontrado")
+        libro = self.obtener_libro_por_id(libro_id)
+        if not libro:
+            raise ValueError(f"libro {libro_id} no encontrado")
+        
+        devuelto = str(datos.get("devuelto", False)).lower() in ("true", "1", "si", "sí")
+        for campo in ("fecha_prestamo", "fecha_devolucion", "fecha_vencimiento"):
+            if datos.get(campo):
+                datetime.datetime.strptime(datos[campo], "%Y-%m-%d")
+        # Los préstamos activos no pueden ser de usuarios o libros dados de baja
+        if not devuelto and (usuario.baja or libro.baja):
+            raise ValueError(f"el {'usuario' if usuario.baja else 'libro'} está dado de baja")
+        if not devuelto and (not libro.disponible or libro_id in prestados):
+            raise ValueError(f"el libro {libro_id} no está disponible")
+        return {
+            "id": id,
+            "usuario_id": usuario_id,
+            "libro_id": libro_id,
+            "fecha_prestamo": datos.get("fecha_prestamo") or None,
+            "fecha_devolucion": datos.get("fecha_devolucion") or None,
+            "devuelto": devuelto,
+            "fecha_vencimiento": datos.get("fecha_vencimiento") or None
+        }
+    
+    def validar_clave_unica(self, tipo, valor, claves):
+        # El email o ISBN no puede estar registrado ni repetido en el archivo
+        campo, normalizar = self.CLAVES_UNICAS[tipo]
+        clave = normalizar(valor)
+        if not self.claves_unicas or clave is None:
+            return
+        if clave in claves:
+            raise ValueError(f"el {campo} {valor} está repetido en el archivo")
+        existente = self.duplicado(tipo, valor)
+        if existente is not None:
+            raise ValueError(f"el {campo} {valor} ya es del {'usuario' if tipo == 'usuarios' else 'libro'} {existente.id}")
+        claves.add(clave)
+    
+    @con_acceso
+    def importar(self, tipo, ruta):
+        # Importa usuarios, libros o préstamos desde un archivo CSV o JSONL.
+        # Los registros se validan en una sola pasada, los IDs que faltan se
+        # asignan con los contadores de cada clase y los datos se guardan una
+        # única vez al final. Devuelve un resumen con los errores por línea.
+        clase = AlmacenamientoJSON.ENTIDADES[tipo]
+        repositorio = getattr(self, tipo)
+        inicio = time.perf_counter()
+        importados = 0
+        errores = []
+        lote = []
+        ids = set()
+        prestados = set()
+        claves = set()
+        
+        for numero, datos in self.leer_registros(ruta):
+            try:
+                datos = self.validar_importacion(tipo, datos, prestados, claves)
+                if datos["id"] in ids:
+                    raise ValueError(f"el ID {datos['id']} está repetido en el archivo")
+            except ValueError as e:
+                errores.append((numero, str(e)))
+                continue
+            
+            entidad = clase.from_dict(datos)
+            ids.add(entidad.id)
+            lote.append(entidad)
+            if tipo == "prestamos" and not entidad.devuelto:
+                prestados.add(entidad.libro_id)
+            
+            if len(lote) >= self.TAMANO_LOTE_IMPORTACION:
+                repositorio.agregar_lote(lote)
+                importados += len(lote)
+                lote = []
+        
+        repositorio.agregar_lote(lote)
+        importados += len(lote)
+        
+        # Los libros con préstamos activos importados dejan de estar disponibles
+        for libro_id in prestados:
+            self.libros.actualizar(self.obtener_libro_por_id(libro_id), disponible=False)
+        
+        self.reconstruir_vista_activos()
+        self.informes.invalidar()
+        self.guardar_datos()
+        
+        segundos = time.perf_counter() - inicio
+        return {
+            "importados": importados,
+            "errores": errores,
+            "segundos": segundos,
+            "registros_por_segundo": importados / segundos if segundos > 0 else 0
+        }
     
 
 # Funciones de utilidad para la interfaz de consola
 def limpiar_pantalla():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    # Secuencia ANSI en lugar de lanzar "clear" en un proceso aparte
+    if os.name == 'nt':
+        os.system('cls')
+    elif sys.stdout.isatty():
+        print("\033[H\033[2J\033[3J", end="", flush=True)
 
 def pausar():
     input("\nPresiona Enter para continuar...")
@@ -416,14 +3487,181 @@ def mostrar_menu(opciones, titulo):
                 print("Opción no válida. Intenta de nuevo.")
         except ValueError:
             print("Por favor, ingresa un número.")
-            
+
+# Tamaño de página por defecto de los listados
+TAMANO_PAGINA = 20
+
+# Número máximo de resultados de una búsqueda desde los menús
+LIMITE_BUSQUEDA = 200
+
+# Recorre un listado por páginas. fuente(desde) debe devolver un iterador de
+# filas con ID >= desde en orden de ID; solo se leen las filas de la página
+# actual, así que abrir un listado cuesta lo mismo sea cual sea su tamaño.
+class Paginador:
+    def __init__(self, fuente, clave=lambda fila: fila.id, tamano=TAMANO_PAGINA):
+        self.fuente = fuente
+        self.clave = clave
+        self.tamano = tamano
+        # ID de la primera fila de cada página visitada, para volver atrás
+        self.inicios = [1]
+        self.cargar()
+    
+    def cargar(self):
+        filas = list(itertools.islice(self.fuente(self.inicios[-1]), self.tamano + 1))
+        self.filas = filas[:self.tamano]
+        self.hay_siguiente = len(filas) > self.tamano
+        self.inicio_siguiente = self.clave(filas[-1]) if self.hay_siguiente else None
+    
+    def siguiente(self):
+        if self.hay_siguiente:
+            self.inicios.append(self.inicio_siguiente)
+            self.cargar()
+    
+    def anterior(self):
+        if len(self.inicios) > 1:
+            self.inicios.pop()
+            self.cargar()
+    
+    def saltar(self, id):
+        self.inicios.append(id)
+        self.cargar()
+    
+    def cambiar_tamano(self, tamano):
+        self.tamano = max(1, tamano)
+        self.cargar()
+    
+    def vacio(self):
+        return not self.filas and len(self.inicios) == 1
+
+def fuente_lista(filas, clave=lambda fila: fila.id):
+    # Fuente para Paginador a partir de una lista ya calculada (por
+    # ejemplo, los resultados de una búsqueda)
+    filas = sorted(filas, key=clave)
+    claves = [clave(fila) for fila in filas]
+    def fuente(desde):
+        return (filas[i] for i in range(bisect.bisect_left(claves, desde), len(filas)))
+    return fuente
+
+def mostrar_paginado(titulo, paginador, formatear, mensaje_vacio, encabezado=None):
+    while True:
+        mostrar_titulo(titulo)
+        if paginador.vacio():
+            print(mensaje_vacio)
+            pausar()
+            return
+        
+        if encabezado:
+            print(encabezado)
+        for fila in paginador.filas:
+            print(formatear(fila))
+        if not paginador.filas:
+            print("No hay registros a partir de ese ID.")
+        
+        print(f"\nPágina {len(paginador.inicios)} ({paginador.tamano} por página)")
+        opcion = input("[s] Siguiente  [a] Anterior  [i] Ir a ID  [t] Tamaño de página  [Enter] Volver: ").lower()
+        if opcion == "s":
+            paginador.siguiente()
+        elif opcion == "a":
+            paginador.anterior()
+        elif opcion in ("i", "t"):
+            try:
+                numero = int(input("ID: " if opcion == "i" else "Filas por página: "))
+                if opcion == "i":
+                    paginador.saltar(numero)
+                else:
+                    paginador.cambiar_tamano(numero)
+            except ValueError:
+                pass
+        elif opcion == "":
+            return
+
+def mostrar_resultados(titulo, resultados, formatear, nombre):
+    # Resultados de una búsqueda, ya ordenados por relevancia: se paginan
+    # por posición ("Ir a ID" salta a una posición)
+    if len(resultados) < LIMITE_BUSQUEDA:
+        encabezado = f"Se encontraron {len(resultados)} {nombre}:\n"
+    else:
+        encabezado = f"Los {LIMITE_BUSQUEDA} {nombre} más relevantes:\n"
+    paginador = Paginador(fuente_lista(list(enumerate(resultados, 1)), clave=lambda fila: fila[0]),
+                          clave=lambda fila: fila[0])
+    mostrar_paginado(titulo, paginador, lambda fila: f"{fila[0]}. {formatear(fila[1])}", "", encabezado=encabezado)
+
+def pedir_id(titulo, paginador, formatear, pregunta, encabezado, convertir=int):
+    # Muestra el listado por páginas y pide un ID. "s" y "a" cambian de
+    # página; cualquier otra respuesta se pasa a convertir (por defecto se
+    # convierte a número: ValueError si no lo es, igual que int(input(...)))
+    while True:
+        mostrar_titulo(titulo)
+        print(encabezado)
+        for fila in paginador.filas:
+            print(formatear(fila))
+        navegacion = []
+        if len(paginador.inicios) > 1:
+            navegacion.append("a = anterior")
+        if paginador.hay_siguiente:
+            navegacion.append("s = siguiente")
+        if navegacion:
+            print(f"\nPágina {len(paginador.inicios)} ({', '.join(navegacion)})")
+        
+        respuesta = input(f"\n{pregunta} (0 para cancelar): ").strip().lower()
+        if respuesta == "s" and paginador.hay_siguiente:
+            paginador.siguiente()
+        elif respuesta == "a" and len(paginador.inicios) > 1:
+            paginador.anterior()
+        else:
+            return convertir(respuesta)
+
+def libro_por_id_o_isbn(app, respuesta):
+    # Los IDs son cortos; un ISBN tiene 10 o 13 caracteres sin contar
+    # guiones. ValueError si no es ni un ISBN registrado ni un número.
+    if len(normalizar_isbn(respuesta) or "") in (10, 13):
+        libro = app.obtener_libro_por_isbn(respuesta)
+        if libro:
+            return libro
+    return app.obtener_libro_por_id(int(respuesta))
+
+# Formatos de una línea usados en los listados
+def resumen_usuario(usuario):
+    return f"ID: {usuario.id} | Nombre: {usuario.nombre} | Email: {usuario.email}"
+
+def resumen_libro(libro):
+    return f"ID: {libro.id} | Título: {libro.titulo} | Autor: {libro.autor}"
+
+def resumen_prestamo_activo(fila):
+    prestamo, usuario, libro = fila
+    return f"ID: {prestamo.id} | Usuario: {usuario.nombre} | Libro: {libro.titulo} | Fecha préstamo: {prestamo.fecha_prestamo} | Vence: {prestamo.fecha_vencimiento}"
+
+def resumen_prestamo_vencido(fila, hoy):
+    prestamo, usuario, libro = fila
+    usuario_nombre = usuario.nombre if usuario else "Usuario desconocido"
+    libro_titulo = libro.titulo if libro else "Libro desconocido"
+    return (f"ID: {prestamo.id} | Usuario: {usuario_nombre} | Libro: {libro_titulo} | "
+            f"Vence: {prestamo.fecha_vencimiento} | Días de retraso: {hoy - prestamo.dia_vencimiento}")
+
+def detalle_prestamo(prestamo, usuario, libro):
+    usuario_nombre = usuario.nombre if usuario else "Usuario desconocido"
+    libro_titulo = libro.titulo if libro else "Libro desconocido"
+    
+    estado = "Devuelto" if prestamo.devuelto else "Prestado"
+    fecha_dev = prestamo.fecha_devolucion if prestamo.fecha_devolucion else "Pendiente"
+    
+    return f"ID: {prestamo.id} | Usuario: {usuario_nombre} | Libro: {libro_titulo} | Fecha préstamo: {prestamo.fecha_prestamo} | Fecha devolución: {fecha_dev} | Estado: {estado}"
+
 # Funciones para los menús de la aplicación
 def menu_principal(app):
     while True:
+        app.refrescar()
+        # Cambios agrupados cuya ventana venció mientras se usaba un submenú
+        if app.programador.vencido():
+            app.sincronizar()
+        
         opcion = mostrar_menu([
             "Gestión de Usuarios",
             "Gestión de Libros",
             "Gestión de Préstamos",
+            "Importar datos",
+            "Informes",
+            "Estadísticas",
             "Salir"
         ], "SISTEMA DE GESTIÓN DE BIBLIOTECA")
         
@@ -433,13 +3671,21 @@ def menu_principal(app):
             menu_libros(app)
         elif opcion == 3:
             menu_prestamos(app)
-        elif opcion == 4 or opcion == 0:
+        elif opcion == 4:
+            menu_importar(app)
+        elif opcion == 5:
+            menu_informes(app)
+        elif opcion == 6:
+            menu_estadisticas(app)
+        elif opcion == 7 or opcion == 0:
+            app.sincronizar()
             limpiar_pantalla()
             print("¡Gracias por usar el Sistema de Gestión de Biblioteca!")
             break
 
 def menu_usuarios(app):
     while True:
+        app.refrescar()
         opcion = mostrar_menu([
             "Ver todos los usuarios",
             "Buscar usuario",
@@ -449,26 +3695,19 @@ def menu_usuarios(app):
         ], "GESTIÓN DE USUARIOS")
         
         if opcion == 1:
-            mostrar_titulo("LISTA DE USUARIOS")
-            if not app.usuarios:
-                print("No hay usuarios registrados.")
-            else:
-                for usuario in app.usuarios:
-                    print(f"{usuario}")
-            pausar()
+            paginador = Paginador(app.usuarios.iterar_desde)
+            mostrar_paginado("LISTA DE USUARIOS", paginador, str, "No hay usuarios registrados.")
         
         elif opcion == 2:
             mostrar_titulo("BUSCAR USUARIO")
             termino = input("Ingresa término de búsqueda: ")
-            resultados = app.buscar_usuario(termino)
+            resultados = app.buscar_usuario(termino, LIMITE_BUSQUEDA)
             
             if not resultados:
                 print("No se encontraron usuarios.")
+                pausar()
             else:
-                print(f"\nSe encontraron {len(resultados)} usuarios:")
-                for usuario in resultados:
-                    print(f"{usuario}")
-            pausar()
+                mostrar_resultados("BUSCAR USUARIO", resultados, str, "usuarios")
         
         elif opcion == 3:
             mostrar_titulo("AGREGAR USUARIO")
@@ -478,7 +3717,8 @@ def menu_usuarios(app):
             
             if nombre and email:
                 usuario = app.agregar_usuario(nombre, email, telefono)
-                print(f"\nUsuario agregado correctamente:\n{usuario}")
+                if usuario:
+                    print(f"\nUsuario agregado correctamente:\n{usuario}")
             else:
                 print("\nError: Nombre y email son obligatorios.")
             pausar()
@@ -490,12 +3730,9 @@ def menu_usuarios(app):
                 pausar()
                 continue
             
-            print("Usuarios disponibles:")
-            for usuario in app.usuarios:
-                print(f"ID: {usuario.id} | Nombre: {usuario.nombre} | Email: {usuario.email}")
-            
             try:
-                id_usuario = int(input("\nIngresa el ID del usuario a editar (0 para cancelar): "))
+                id_usuario = pedir_id("EDITAR USUARIO", Paginador(app.usuarios.iterar_desde), resumen_usuario,
+                                      "Ingresa el ID del usuario a editar", "Usuarios disponibles:")
                 if id_usuario == 0:
                     continue
                 
@@ -524,12 +3761,9 @@ def menu_usuarios(app):
                 pausar()
                 continue
             
-            print("Usuarios disponibles:")
-            for usuario in app.usuarios:
-                print(f"ID: {usuario.id} | Nombre: {usuario.nombre} | Email: {usuario.email}")
-            
             try:
-                id_usuario = int(input("\nIngresa el ID del usuario a eliminar (0 para cancelar): "))
+                id_usuario = pedir_id("ELIMINAR USUARIO", Paginador(app.usuarios.iterar_desde), resumen_usuario,
+                                      "Ingresa el ID del usuario a eliminar", "Usuarios disponibles:")
                 if id_usuario == 0:
                     continue
                 
@@ -539,8 +3773,9 @@ def menu_usuarios(app):
                     if confirmacion.lower() == 's':
                         if app.eliminar_usuario(usuario.id):
                             print("\nUsuario eliminado correctamente.")
-                        else:
-                            print("\nError al eliminar el usuario.")
+                        elif input("¿Darlo de baja en su lugar? (s/n): ").lower() == 's':
+                            app.eliminar_usuario(usuario.id, "baja")
+                            print("\nUsuario dado de baja.")
                 else:
                     print("\nUsuario no encontrado.")
             except ValueError:
@@ -552,6 +3787,7 @@ def menu_usuarios(app):
 
 def menu_libros(app):
     while True:
+        app.refrescar()
         opcion = mostrar_menu([
             "Ver todos los libros",
             "Buscar libro",
@@ -561,26 +3797,19 @@ def menu_libros(app):
         ], "GESTIÓN DE LIBROS")
         
         if opcion == 1:
-            mostrar_titulo("LISTA DE LIBROS")
-            if not app.libros:
-                print("No hay libros registrados.")
-            else:
-                for libro in app.libros:
-                    print(f"{libro}")
-            pausar()
+            paginador = Paginador(app.libros.iterar_desde)
+            mostrar_paginado("LISTA DE LIBROS", paginador, str, "No hay libros registrados.")
         
         elif opcion == 2:
             mostrar_titulo("BUSCAR LIBRO")
             termino = input("Ingresa término de búsqueda: ")
-            resultados = app.buscar_libro(termino)
+            resultados = app.buscar_libro(termino, LIMITE_BUSQUEDA)
             
             if not resultados:
                 print("No se encontraron libros.")
+                pausar()
             else:
-                print(f"\nSe encontraron {len(resultados)} libros:")
-                for libro in resultados:
-                    print(f"{libro}")
-            pausar()
+                mostrar_resultados("BUSCAR LIBRO", resultados, str, "libros")
         
         elif opcion == 3:
             mostrar_titulo("AGREGAR LIBRO")
@@ -591,7 +3820,8 @@ def menu_libros(app):
             
             if titulo and autor:
                 libro = app.agregar_libro(titulo, autor, isbn, descripcion)
-                print(f"\nLibro agregado correctamente:\n{libro}")
+                if libro:
+                    print(f"\nLibro agregado correctamente:\n{libro}")
             else:
                 print("\nError: Título y autor son obligatorios.")
             pausar()
@@ -603,12 +3833,9 @@ def menu_libros(app):
                 pausar()
                 continue
             
-            print("Libros disponibles:")
-            for libro in app.libros:
-                print(f"ID: {libro.id} | Título: {libro.titulo} | Autor: {libro.autor}")
-            
             try:
-                id_libro = int(input("\nIngresa el ID del libro a editar (0 para cancelar): "))
+                id_libro = pedir_id("EDITAR LIBRO", Paginador(app.libros.iterar_desde), resumen_libro,
+                                    "Ingresa el ID del libro a editar", "Libros disponibles:")
                 if id_libro == 0:
                     continue
                 
@@ -638,12 +3865,9 @@ def menu_libros(app):
                 pausar()
                 continue
             
-            print("Libros disponibles:")
-            for libro in app.libros:
-                print(f"ID: {libro.id} | Título: {libro.titulo} | Autor: {libro.autor}")
-            
             try:
-                id_libro = int(input("\nIngresa el ID del libro a eliminar (0 para cancelar): "))
+                id_libro = pedir_id("ELIMINAR LIBRO", Paginador(app.libros.iterar_desde), resumen_libro,
+                                    "Ingresa el ID del libro a eliminar", "Libros disponibles:")
                 if id_libro == 0:
                     continue
                 
@@ -653,8 +3877,9 @@ def menu_libros(app):
                     if confirmacion.lower() == 's':
                         if app.eliminar_libro(libro.id):
                             print("\nLibro eliminado correctamente.")
-                        else:
-                            print("\nError al eliminar el libro.")
+                        elif input("¿Darlo de baja en su lugar? (s/n): ").lower() == 's':
+                            app.eliminar_libro(libro.id, "baja")
+                            print("\nLibro dado de baja.")
                 else:
                     print("\nLibro no encontrado.")
             except ValueError:
@@ -666,58 +3891,42 @@ def menu_libros(app):
 
 def menu_prestamos(app):
     while True:
+        app.refrescar()
         opcion = mostrar_menu([
             "Ver todos los préstamos",
             "Ver préstamos activos",
             "Buscar préstamo",
             "Registrar préstamo",
-            "Devolver libro"
+            "Devolver libro",
+            "Préstamos de un usuario",
+            "Historial de un libro",
+            "Préstamos vencidos",
+            "Verificar integridad"
         ], "GESTIÓN DE PRÉSTAMOS")
         
         if opcion == 1:
-            mostrar_titulo("LISTA DE PRÉSTAMOS")
-            if not app.prestamos:
-                print("No hay préstamos registrados.")
-            else:
-                for prestamo in app.prestamos:
-                    usuario = app.obtener_usuario_por_id(prestamo.usuario_id)
-                    libro = app.obtener_libro_por_id(prestamo.libro_id)
-                    
-                    usuario_nombre = usuario.nombre if usuario else "Usuario desconocido"
-                    libro_titulo = libro.titulo if libro else "Libro desconocido"
-                    
-                    estado = "Devuelto" if prestamo.devuelto else "Prestado"
-                    fecha_dev = prestamo.fecha_devolucion if prestamo.fecha_devolucion else "Pendiente"
-                    
-                    print(f"ID: {prestamo.id} | Usuario: {usuario_nombre} | Libro: {libro_titulo} | Fecha préstamo: {prestamo.fecha_prestamo} | Fecha devolución: {fecha_dev} | Estado: {estado}")
-            pausar()
+            # Usuario y libro solo se resuelven para las filas de la página mostrada
+            paginador = Paginador(app.prestamos.iterar_desde)
+            mostrar_paginado("LISTA DE PRÉSTAMOS", paginador, lambda prestamo: detalle_prestamo(
+                prestamo,
+                app.obtener_usuario_por_id(prestamo.usuario_id),
+                app.obtener_libro_por_id(prestamo.libro_id)
+            ), "No hay préstamos registrados.")
         
         elif opcion == 2:
-            mostrar_titulo("PRÉSTAMOS ACTIVOS")
-            activos = app.listar_prestamos_activos()
-            
-            if not activos:
-                print("No hay préstamos activos.")
-            else:
-                for prestamo, usuario, libro in activos:
-                    print(f"ID: {prestamo.id} | Usuario: {usuario.nombre} | Libro: {libro.titulo} | Fecha préstamo: {prestamo.fecha_prestamo}")
-            pausar()
+            paginador = Paginador(app.iterar_prestamos_activos, clave=lambda fila: fila[0].id)
+            mostrar_paginado("PRÉSTAMOS ACTIVOS", paginador, resumen_prestamo_activo, "No hay préstamos activos.")
         
         elif opcion == 3:
             mostrar_titulo("BUSCAR PRÉSTAMO")
             termino = input("Ingresa término de búsqueda (nombre de usuario, título de libro o ID): ")
-            resultados = app.buscar_prestamo(termino)
+            resultados = app.buscar_prestamo(termino, LIMITE_BUSQUEDA)
             
             if not resultados:
                 print("No se encontraron préstamos.")
+                pausar()
             else:
-                print(f"\nSe encontraron {len(resultados)} préstamos:")
-                for prestamo, usuario, libro in resultados:
-                    estado = "Devuelto" if prestamo.devuelto else "Prestado"
-                    fecha_dev = prestamo.fecha_devolucion if prestamo.fecha_devolucion else "Pendiente"
-                    
-                    print(f"ID: {prestamo.id} | Usuario: {usuario.nombre} | Libro: {libro.titulo} | Fecha préstamo: {prestamo.fecha_prestamo} | Fecha devolución: {fecha_dev} | Estado: {estado}")
-            pausar()
+                mostrar_resultados("BUSCAR PRÉSTAMO", resultados, lambda fila: detalle_prestamo(*fila), "préstamos")
         
         elif opcion == 4:
             mostrar_titulo("REGISTRAR PRÉSTAMO")
@@ -728,19 +3937,18 @@ def menu_prestamos(app):
                 pausar()
                 continue
             
-            libros_disponibles = [l for l in app.libros if l.disponible]
-            if not libros_disponibles:
+            # Los libros disponibles se recorren bajo demanda, página a página
+            def libros_disponibles(desde):
+                return (libro for libro in app.libros.iterar_desde(desde) if libro.disponible)
+            
+            if next(libros_disponibles(1), None) is None:
                 print("No hay libros disponibles para préstamo.")
                 pausar()
                 continue
             
-            # Mostrar usuarios
-            print("Usuarios disponibles:")
-            for usuario in app.usuarios:
-                print(f"ID: {usuario.id} | Nombre: {usuario.nombre} | Email: {usuario.email}")
-            
             try:
-                id_usuario = int(input("\nIngresa el ID del usuario (0 para cancelar): "))
+                id_usuario = pedir_id("REGISTRAR PRÉSTAMO", Paginador(app.usuarios.iterar_desde), resumen_usuario,
+                                      "Ingresa el ID del usuario", "Usuarios disponibles:")
                 if id_usuario == 0:
                     continue
                 
@@ -750,16 +3958,14 @@ def menu_prestamos(app):
                     pausar()
                     continue
                 
-                # Mostrar libros disponibles
-                print("\nLibros disponibles:")
-                for libro in libros_disponibles:
-                    print(f"ID: {libro.id} | Título: {libro.titulo} | Autor: {libro.autor}")
-                
-                id_libro = int(input("\nIngresa el ID del libro (0 para cancelar): "))
-                if id_libro == 0:
+                # Se acepta también el ISBN, por ejemplo leído con un lector de códigos de barras
+                respuesta = pedir_id("REGISTRAR PRÉSTAMO", Paginador(libros_disponibles), resumen_libro,
+                                     f"Ingresa el ID o el ISBN del libro para {usuario.nombre}", "Libros disponibles:",
+                                     convertir=str)
+                if respuesta == "0":
                     continue
                 
-                libro = app.obtener_libro_por_id(id_libro)
+                libro = libro_por_id_o_isbn(app, respuesta)
                 if not libro:
                     print("\nLibro no encontrado.")
                     pausar()
@@ -774,6 +3980,10 @@ def menu_prestamos(app):
                 fecha_prestamo = input("\nFecha de préstamo (YYYY-MM-DD) [hoy]: ")
                 if not fecha_prestamo:
                     fecha_prestamo = None
+                elif not isinstance(convertir_fecha(fecha_prestamo), int):
+                    print(f"\nFecha no válida: {fecha_prestamo} (usa el formato YYYY-MM-DD).")
+                    pausar()
+                    continue
                 
                 # Registrar préstamo
                 prestamo = app.registrar_prestamo(usuario.id, libro.id, fecha_prestamo)
@@ -789,19 +3999,15 @@ def menu_prestamos(app):
             mostrar_titulo("DEVOLVER LIBRO")
             
             # Listar préstamos activos
-            activos = app.listar_prestamos_activos()
-            
-            if not activos:
+            paginador = Paginador(app.iterar_prestamos_activos, clave=lambda fila: fila[0].id)
+            if paginador.vacio():
                 print("No hay préstamos activos para devolver.")
                 pausar()
                 continue
             
-            print("Préstamos activos:")
-            for prestamo, usuario, libro in activos:
-                print(f"ID: {prestamo.id} | Usuario: {usuario.nombre} | Libro: {libro.titulo} | Fecha préstamo: {prestamo.fecha_prestamo}")
-            
             try:
-                id_prestamo = int(input("\nIngresa el ID del préstamo a devolver (0 para cancelar): "))
+                id_prestamo = pedir_id("DEVOLVER LIBRO", paginador, resumen_prestamo_activo,
+                                       "Ingresa el ID del préstamo a devolver", "Préstamos activos:")
                 if id_prestamo == 0:
                     continue
                 
@@ -819,13 +4025,496 @@ def menu_prestamos(app):
                 print("\nPor favor, ingresa un número válido.")
             pausar()
         
+        elif opcion == 6:
+            try:
+                id_usuario = pedir_id("PRÉSTAMOS DE UN USUARIO", Paginador(app.usuarios.iterar_desde), resumen_usuario,
+                                      "Ingresa el ID del usuario", "Usuarios:")
+                if id_usuario == 0:
+                    continue
+                
+                usuario = app.obtener_usuario_por_id(id_usuario)
+                if not usuario:
+                    print("\nUsuario no encontrado.")
+                    pausar()
+                    continue
+                
+                activos, devueltos = app.prestamos_de_usuario(usuario.id)
+                mostrar_historial(app, f"PRÉSTAMOS DE {usuario.nombre.upper()}", activos, devueltos)
+            except ValueError:
+                print("\nPor favor, ingresa un número válido.")
+                pausar()
+        
+        elif opcion == 7:
+            try:
+                id_libro = pedir_id("HISTORIAL DE UN LIBRO", Paginador(app.libros.iterar_desde), resumen_libro,
+                                    "Ingresa el ID del libro", "Libros:")
+                if id_libro == 0:
+                    continue
+                
+                libro = app.obtener_libro_por_id(id_libro)
+                if not libro:
+                    print("\nLibro no encontrado.")
+                    pausar()
+                    continue
+                
+                activos, devueltos = app.historial_de_libro(libro.id)
+                mostrar_historial(app, f"HISTORIAL DE {libro.titulo.upper()}", activos, devueltos)
+            except ValueError:
+                print("\nPor favor, ingresa un número válido.")
+                pausar()
+        
+        elif opcion == 8:
+            # Del vencimiento más antiguo al más reciente; "Ir a ID" salta a
+            # una posición del informe
+            hoy = datetime.date.today().toordinal()
+            vencidos = app.prestamos_vencidos(hoy)
+            paginador = Paginador(fuente_lista(list(enumerate(vencidos, 1)), clave=lambda fila: fila[0]),
+                                  clave=lambda fila: fila[0])
+            mostrar_paginado("PRÉSTAMOS VENCIDOS", paginador,
+                             lambda fila: f"{fila[0]}. {resumen_prestamo_vencido(fila[1], hoy)}",
+                             "No hay préstamos vencidos.",
+                             encabezado=f"{len(vencidos)} préstamos vencidos a {fecha_de_ordinal(hoy)}:\n")
+        
+        elif opcion == 9:
+            mostrar_titulo("VERIFICAR INTEGRIDAD")
+            huerfanos = app.verificar_integridad(reparar=False)
+            if not huerfanos:
+                print("Todos los préstamos tienen su usuario y su libro.")
+            elif input(f"{huerfanos} préstamos son de usuarios o libros que ya no existen. "
+                       "¿Eliminarlos? (s/n): ").lower() == 's':
+                print(f"\nSe eliminaron {app.verificar_integridad()} préstamos huérfanos.")
+            pausar()
+        
         elif opcion == 0:
             break
         
+def mostrar_historial(app, titulo, activos, devueltos):
+    # Los préstamos activos se muestran siempre; los devueltos, por páginas
+    def formatear(prestamo):
+        return detalle_prestamo(prestamo,
+                                app.obtener_usuario_por_id(prestamo.usuario_id),
+                                app.obtener_libro_por_id(prestamo.libro_id))
+    
+    lineas = [f"Préstamos activos: {len(activos)}"]
+    lineas += [formatear(prestamo) for prestamo in activos]
+    lineas.append(f"\nPréstamos devueltos: {len(devueltos)}")
+    if not devueltos:
+        mostrar_titulo(titulo)
+        print("\n".join(lineas))
+        pausar()
+        return
+    mostrar_paginado(titulo, Paginador(fuente_lista(devueltos)), formatear, "", encabezado="\n".join(lineas))
+
+def mostrar_resultado_importacion(resultado):
+    print(f"\nRegistros importados: {resultado['importados']}")
+    print(f"Tiempo: {resultado['segundos']:.2f} s ({resultado['registros_por_segundo']:.0f} registros/segundo)")
+    if resultado["errores"]:
+        print(f"\nSe rechazaron {len(resultado['errores'])} registros:")
+        for numero, mensaje in resultado["errores"][:20]:
+            print(f"Línea {numero}: {mensaje}")
+        if len(resultado["errores"]) > 20:
+            print(f"... y {len(resultado['errores']) - 20} más.")
+
+def menu_importar(app):
+    while True:
+        opcion = mostrar_menu([
+            "Importar usuarios",
+            "Importar libros",
+            "Importar préstamos"
+        ], "IMPORTAR DATOS")
+        
+        if opcion == 0:
+            break
+        
+        tipo = ["usuarios", "libros", "prestamos"][opcion - 1]
+        mostrar_titulo(f"IMPORTAR {tipo.upper()}")
+        ruta = input("Ruta del archivo (.csv o .jsonl): ")
+        if not os.path.exists(ruta):
+            print("\nEl archivo no existe.")
+        else:
+            mostrar_resultado_importacion(app.importar(tipo, ruta))
+        pausar()
+
+# Número de filas de los informes de "más prestados"
+LIMITE_INFORMES = 10
+
+def mostrar_ranking(titulo, encabezado, filas, mensaje_vacio):
+    # filas: [(texto, préstamos)] ya ordenadas
+    mostrar_titulo(titulo)
+    if not filas:
+        print(mensaje_vacio)
+    else:
+        print(f"{'#':>3}  {encabezado:<44}{'Préstamos':>10}")
+        print("-" * 59)
+        for posicion, (texto, n) in enumerate(filas, 1):
+            print(f"{posicion:>3}  {texto[:44]:<44}{n:>10}")
+    pausar()
+
+def menu_informes(app):
+    while True:
+        app.refrescar()
+        opcion = mostrar_menu([
+            "Préstamos por mes",
+            "Libros más prestados",
+            "Autores más prestados",
+            "Usuarios más activos",
+            "Duración media de los préstamos"
+        ], "INFORMES DE CIRCULACIÓN")
+        
+        if opcion == 1:
+            mostrar_titulo("PRÉSTAMOS POR MES")
+            meses = app.prestamos_por_mes()
+            if not meses:
+                print("No hay préstamos registrados.")
+            else:
+                # Barras proporcionales al mes con más préstamos
+                maximo = max(n for _, n in meses)
+                for mes, n in meses:
+                    print(f"{mes}  {n:>8}  {'#' * max(1, round(n * 40 / maximo))}")
+                print(f"\nTotal: {sum(n for _, n in meses)} préstamos en {len(meses)} meses")
+            pausar()
+        
+        elif opcion == 2:
+            mostrar_ranking("LIBROS MÁS PRESTADOS", "Libro",
+                            [(f"{libro.titulo} ({libro.autor})", n) for libro, n in app.libros_mas_prestados(LIMITE_INFORMES)],
+                            "No hay préstamos registrados.")
+        
+        elif opcion == 3:
+            mostrar_ranking("AUTORES MÁS PRESTADOS", "Autor", app.autores_mas_prestados(LIMITE_INFORMES),
+                            "No hay préstamos registrados.")
+        
+        elif opcion == 4:
+            mostrar_ranking("USUARIOS MÁS ACTIVOS", "Usuario",
+                            [(f"{usuario.nombre} (ID {usuario.id})", n) for usuario, n in app.usuarios_mas_activos(LIMITE_INFORMES)],
+                            "No hay préstamos registrados.")
+        
+        elif opcion == 5:
+            mostrar_titulo("DURACIÓN MEDIA DE LOS PRÉSTAMOS")
+            media = app.duracion_media_prestamos()
+            if media is None:
+                print("Todavía no se ha devuelto ningún préstamo.")
+            else:
+                print(f"Los préstamos devueltos duraron de media {media:.1f} días.")
+            pausar()
+        
+        elif opcion == 0:
+            break
+
+def menu_estadisticas(app):
+    mostrar_titulo("ESTADÍSTICAS")
+    if not app.metricas:
+        print("Las métricas de rendimiento están desactivadas.")
+        if input("¿Activarlas ahora? (s/n): ").lower() == 's':
+            app.activar_metricas()
+            print("\nMétricas activadas. Los datos aparecerán al usar la aplicación.")
+        pausar()
+        return
+    
+    resumen = app.metricas.resumen()
+    if not resumen:
+        print("Todavía no se ha medido ninguna operación.")
+    else:
+        print(f"{'Operación':<32}{'Llamadas':>9}{'Media ms':>10}{'p95 ms':>9}{'Máx ms':>10}{'Bytes':>12}")
+        print("-" * 82)
+        for nombre, datos in resumen.items():
+            print(f"{nombre:<32}{datos['llamadas']:>9}{datos['media_ms']:>10.2f}{datos['p95_ms']:>9.1f}"
+                  f"{datos['max_ms']:>10.2f}{datos['bytes_escritos']:>12}")
+    
+    ruta = input("\nGuardar en un archivo JSON (vacío para no guardar): ")
+    if ruta:
+        app.metricas.volcar(ruta)
+        print(f"Métricas guardadas en {ruta}.")
+    pausar()
+
 # Función principal
+# Interfaz de línea de comandos sin menús. Cada comando escribe una línea
+# JSON en la salida estándar; con --script se ejecutan muchos comandos
+# sobre la misma BibliotecaApp cargada una sola vez.
+def agregar_comandos(subparsers):
+    importar = subparsers.add_parser("importar", help="importación masiva desde CSV o JSONL")
+    importar.add_argument("tipo", choices=["usuarios", "libros", "prestamos"])
+    importar.add_argument("archivo")
+    
+    agregar = subparsers.add_parser("agregar", help="agregar un usuario o un libro")
+    tipos = agregar.add_subparsers(dest="tipo", required=True)
+    usuario = tipos.add_parser("usuario")
+    usuario.add_argument("--nombre", required=True)
+    usuario.add_argument("--email", default="")
+    usuario.add_argument("--telefono", default="")
+    libro = tipos.add_parser("libro")
+    libro.add_argument("--titulo", required=True)
+    libro.add_argument("--autor", required=True)
+    libro.add_argument("--isbn", default="")
+    libro.add_argument("--descripcion", default="")
+    
+    buscar = subparsers.add_parser("buscar", help="buscar usuarios, libros o préstamos")
+    buscar.add_argument("tipo", choices=["usuarios", "libros", "prestamos"])
+    buscar.add_argument("termino")
+    buscar.add_argument("--limite", type=int, help="número máximo de resultados (los más relevantes)")
+    
+    prestar = subparsers.add_parser("prestar", help="registrar un préstamo")
+    prestar.add_argument("usuario_id", type=int)
+    prestar.add_argument("libro_id", type=int, nargs="?", help="ID del libro (o --isbn)")
+    prestar.add_argument("--isbn", help="ISBN del libro en lugar de su ID")
+    prestar.add_argument("--fecha", help="fecha del préstamo (YYYY-MM-DD, por defecto hoy)")
+    prestar.add_argument("--vence", help="fecha de vencimiento (YYYY-MM-DD, por defecto según el plazo de préstamo)")
+    
+    devolver = subparsers.add_parser("devolver", help="devolver un préstamo")
+    devolver.add_argument("prestamo_id", type=int)
+    
+    listar = subparsers.add_parser("listar", help="listar usuarios, libros, préstamos, préstamos activos o vencidos")
+    listar.add_argument("tipo", choices=["usuarios", "libros", "prestamos", "activos", "vencidos"])
+    listar.add_argument("--desde", type=int, default=1, help="primer ID a listar")
+    listar.add_argument("--limite", type=int, help="número máximo de resultados")
+    
+    obtener = subparsers.add_parser("obtener", help="obtener un usuario por su email o un libro por su ISBN")
+    obtener.add_argument("tipo", choices=["usuario", "libro"])
+    obtener.add_argument("valor", help="email del usuario o ISBN del libro")
+    
+    eliminar = subparsers.add_parser("eliminar", help="eliminar un usuario o un libro")
+    eliminar.add_argument("tipo", choices=["usuario", "libro"])
+    eliminar.add_argument("id", type=int)
+    eliminar.add_argument("--politica", choices=BibliotecaApp.POLITICAS_ELIMINACION,
+                          help="qué hacer si tiene préstamos (por defecto, la de --eliminacion)")
+    
+    verificar = subparsers.add_parser("verificar", help="buscar y eliminar préstamos de usuarios o libros que no existen")
+    verificar.add_argument("--sin-reparar", action="store_true", help="solo contar los préstamos huérfanos")
+    
+    informe = subparsers.add_parser("informe", help="informes de circulación")
+    informe.add_argument("tipo", choices=["meses", "libros", "autores", "usuarios", "duracion"])
+    informe.add_argument("--limite", type=int, default=10, help="filas de los informes de más prestados")
+
+def serializar(valor):
+    # Entidades, filas (prestamo, usuario, libro) y listas a tipos JSON
+    if isinstance(valor, list):
+        return [serializar(elemento) for elemento in valor]
+    if isinstance(valor, tuple) and len(valor) == 3 and isinstance(valor[0], Prestamo):
+        prestamo, usuario, libro = valor
+        return {"prestamo": prestamo.to_dict(), "usuario": serializar(usuario), "libro": serializar(libro)}
+    if hasattr(valor, "to_dict"):
+        return valor.to_dict()
+    return valor
+
+def informe_serializable(app, tipo, limite=10):
+    # Informes de circulación como tipos JSON
+    if tipo == "meses":
+        return [{"mes": mes, "prestamos": n} for mes, n in app.prestamos_por_mes()]
+    if tipo == "libros":
+        return [{"libro": libro.to_dict(), "prestamos": n} for libro, n in app.libros_mas_prestados(limite)]
+    if tipo == "autores":
+        return [{"autor": autor, "prestamos": n} for autor, n in app.autores_mas_prestados(limite)]
+    if tipo == "usuarios":
+        return [{"usuario": usuario.to_dict(), "prestamos": n} for usuario, n in app.usuarios_mas_activos(limite)]
+    return {"dias": app.duracion_media_prestamos()}
+
+def ejecutar_comando(app, args):
+    # Devuelve {"ok": ..., "comando": ..., "resultado"/"error": ...}. Los
+    # mensajes que la aplicación imprime (por ejemplo "Error: Libro no
+    # encontrado.") se recogen como texto del error en lugar de mezclarse
+    # con la salida JSON.
+    mensajes = io.StringIO()
+    try:
+        app.refrescar()
+        with contextlib.redirect_stdout(mensajes):
+            if args.comando == "importar":
+                resultado = app.importar(args.tipo, args.archivo)
+            elif args.comando == "agregar" and args.tipo == "usuario":
+                resultado = app.agregar_usuario(args.nombre, args.email, args.telefono)
+            elif args.comando == "agregar":
+                resultado = app.agregar_libro(args.titulo, args.autor, args.isbn, args.descripcion)
+            elif args.comando == "buscar" and args.tipo == "usuarios":
+                resultado = app.buscar_usuario(args.termino, args.limite)
+            elif args.comando == "buscar" and args.tipo == "libros":
+                resultado = app.buscar_libro(args.termino, args.limite)
+            elif args.comando == "buscar":
+                resultado = app.buscar_prestamo(args.termino, args.limite)
+            elif args.comando == "prestar":
+                libro = app.obtener_libro_por_isbn(args.isbn) if args.isbn else app.obtener_libro_por_id(args.libro_id)
+                if libro is None:
+                    print("Error: Libro no encontrado.")
+                    resultado = None
+                else:
+                    resultado = app.registrar_prestamo(args.usuario_id, libro.id, args.fecha, args.vence)
+            elif args.comando == "devolver":
+                resultado = app.obtener_prestamo_por_id(args.prestamo_id) if app.devolver_libro(args.prestamo_id) else None
+                if resultado is None:
+                    print("Préstamo no encontrado o ya devuelto.")
+            elif args.comando == "obtener":
+                if args.tipo == "usuario":
+                    resultado = app.obtener_usuario_por_email(args.valor)
+                else:
+                    resultado = app.obtener_libro_por_isbn(args.valor)
+                if resultado is None:
+                    print(f"{args.tipo.capitalize()} no encontrado.")
+            elif args.comando == "eliminar":
+                metodo = app.eliminar_usuario if args.tipo == "usuario" else app.eliminar_libro
+                resultado = {"id": args.id} if metodo(args.id, args.politica) else None
+            elif args.comando == "verificar":
+                resultado = {"huerfanos": app.verificar_integridad(reparar=not args.sin_reparar)}
+            elif args.comando == "informe":
+                resultado = informe_serializable(app, args.tipo, args.limite)
+            elif args.tipo == "activos":
+                resultado = list(itertools.islice(app.iterar_prestamos_activos(args.desde), args.limite))
+            elif args.tipo == "vencidos":
+                resultado = [fila for fila in app.prestamos_vencidos() if fila[0].id >= args.desde]
+                resultado = resultado[:args.limite] if args.limite is not None else resultado
+            else:
+                resultado = list(itertools.islice(getattr(app, args.tipo).iterar_desde(args.desde), args.limite))
+    except Exception as e:
+        return {"ok": False, "comando": args.comando, "error": str(e)}
+    
+    if resultado is None:
+        return {"ok": False, "comando": args.comando, "error": mensajes.getvalue().strip() or "Operación fallida."}
+    # Una importación con registros rechazados falla, aunque los demás se
+    # hayan importado; el resumen acompaña al error
+    if args.comando == "importar" and resultado["errores"]:
+        return {"ok": False, "comando": args.comando,
+                "error": f"Se rechazaron {len(resultado['errores'])} registros.", "resultado": resultado}
+    return {"ok": True, "comando": args.comando, "resultado": serializar(resultado)}
+
+def ejecutar_script(app, ruta, parser):
+    # Una línea por comando, con la misma sintaxis que en la línea de
+    # comandos. Las líneas vacías y las que empiezan por "#" se ignoran.
+    # Devuelve el número de comandos que fallaron.
+    fallos = 0
+    archivo = sys.stdin if ruta == "-" else open(ruta, "r", encoding="utf-8")
+    try:
+        for numero, linea in enumerate(archivo, 1):
+            linea = linea.strip()
+            if not linea or linea.startswith("#"):
+                continue
+            try:
+                respuesta = ejecutar_comando(app, parser.parse_args(shlex.split(linea)))
+            except (SystemExit, ValueError):
+                # argparse ya explicó el error en la salida de errores
+                respuesta = {"ok": False, "comando": linea.split()[0], "error": "Comando no válido."}
+            respuesta["linea"] = numero
+            if not respuesta["ok"]:
+                fallos += 1
+            print(json.dumps(respuesta, ensure_ascii=False))
+    finally:
+        if archivo is not sys.stdin:
+            archivo.close()
+    return fallos
+
+def parametros_guardado(ventana, operaciones, interactivo):
+    # (ventana, operaciones) del guardado agrupado. En el menú cada cambio
+    # se guarda en el momento, salvo que se pida agruparlos: con solo
+    # --ventana-guardado los cambios esperan a que venza la ventana (nada
+    # vacía los pendientes mientras se espera una respuesta). Con comandos
+    # y --script se guarda al terminar.
+    if operaciones:
+        return ventana, operaciones
+    if interactivo and ventana is None:
+        return None, 1
+    return ventana, sys.maxsize
+
+def mostrar_tiempos_arranque(tiempos, total):
+    # Las fases se muestran en el orden en que se midieron. Las decodificadas
+    # en otro proceso se solapan con el resto, así que no suman al total.
+    print("Arranque:", file=sys.stderr)
+    for fase, segundos in tiempos.items():
+        print(f"  {fase:<40} {segundos * 1000:10.1f} ms", file=sys.stderr)
+    medido = sum(segundos for fase, segundos in tiempos.items() if not fase.endswith("(otro proceso)"))
+    print(f"  {'otros':<40} {(total - medido) * 1000:10.1f} ms", file=sys.stderr)
+    print(f"  {'total':<40} {total * 1000:10.1f} ms", file=sys.stderr)
+
 def main():
-    app = BibliotecaApp()
-    menu_principal(app)
+    parser = argparse.ArgumentParser(description="Sistema de Gestión de Biblioteca")
+    parser.add_argument("--almacenamiento", choices=BibliotecaApp.ALMACENAMIENTOS,
+                        default=os.environ.get("BIBLIOTECA_ALMACENAMIENTO", "json"),
+                        help="modo de almacenamiento (también BIBLIOTECA_ALMACENAMIENTO)")
+    parser.add_argument("--datos", default="data", help="directorio de datos")
+    parser.add_argument("--historial-en-disco", action="store_true",
+                        help="mantener en memoria solo los préstamos activos")
+    parser.add_argument("--descripciones-en-disco", action="store_true",
+                        help="leer las descripciones de los libros de disco solo al consultarlas")
+    parser.add_argument("--formato", choices=["json", "binario"],
+                        default=os.environ.get("BIBLIOTECA_FORMATO", "json"),
+                        help="formato de las instantáneas que se escriben (también BIBLIOTECA_FORMATO)")
+    parser.add_argument("--dias-prestamo", type=int, metavar="DIAS",
+                        help=f"plazo de los préstamos en días (por defecto {Prestamo.dias_prestamo})")
+    parser.add_argument("--eliminacion", choices=BibliotecaApp.POLITICAS_ELIMINACION, default="bloquear",
+                        help="qué hacer al eliminar un usuario o libro con préstamos: no eliminarlo, "
+                             "eliminar también sus préstamos o darlo de baja (por defecto bloquear)")
+    parser.add_argument("--permitir-duplicados", action="store_true",
+                        help="aceptar usuarios con un email ya registrado y libros con un ISBN ya registrado")
+    parser.add_argument("--convertir", choices=["json", "binario"], metavar="FORMATO",
+                        help="convertir las instantáneas del directorio de datos a FORMATO (json o binario) y salir")
+    parser.add_argument("--metricas", metavar="ARCHIVO",
+                        help="medir las operaciones y volcar las métricas en ARCHIVO")
+    parser.add_argument("--intervalo-metricas", type=int, default=60,
+                        help="segundos entre volcados de métricas")
+    parser.add_argument("--ventana-guardado", type=float, metavar="SEGUNDOS",
+                        help="tiempo máximo que un cambio espera a guardarse junto con otros "
+                             "(por defecto sin límite; en el menú solo se usa si se indica)")
+    parser.add_argument("--operaciones-guardado", type=int, metavar="N",
+                        help="guardar en cuanto haya N operaciones pendientes, 1 = guardar cada cambio "
+                             "(por defecto 1 en el menú sin --ventana-guardado; con comandos y --script "
+                             "se guarda al terminar)")
+    parser.add_argument("--compartido", action="store_true",
+                        help="el directorio de datos lo usan a la vez otros procesos de la aplicación "
+                             "(con --almacenamiento json, cada cambio de otro proceso recarga la colección "
+                             "entera; con muchos datos conviene diario o sqlite)")
+    parser.add_argument("--procesos-carga", type=int, metavar="N",
+                        help="procesos que decodifican las instantáneas JSON al arrancar, 1 = ninguno aparte "
+                             "(por defecto uno por núcleo si hay varios y los archivos son grandes)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="mostrar en la salida de errores cuánto tarda cada fase del arranque")
+    parser.add_argument("--script", metavar="ARCHIVO",
+                        help="ejecutar los comandos del archivo, uno por línea (\"-\" para la entrada estándar)")
+    agregar_comandos(parser.add_subparsers(dest="comando"))
+    
+    # Parser para las líneas de un script: solo los comandos
+    parser_script = argparse.ArgumentParser(prog="script", add_help=False)
+    agregar_comandos(parser_script.add_subparsers(dest="comando", required=True))
+    
+    args = parser.parse_args()
+    if args.script and args.comando:
+        parser.error("--script no se puede combinar con un comando")
+    
+    if args.dias_prestamo:
+        Prestamo.dias_prestamo = args.dias_prestamo
+    if args.convertir:
+        convertir_instantaneas(args.datos, args.convertir, args.descripciones_en_disco)
+        print(f"Instantáneas de {args.datos} convertidas a {args.convertir}.")
+        sys.exit(0)
+    
+    interactivo = not args.script and not args.comando
+    ventana, operaciones = parametros_guardado(args.ventana_guardado, args.operaciones_guardado, interactivo)
+    
+    inicio = time.perf_counter()
+    app = BibliotecaApp(directorio=args.datos, almacenamiento=args.almacenamiento,
+                        historial_en_disco=args.historial_en_disco, metricas=args.metricas,
+                        ventana_guardado=ventana, operaciones_guardado=operaciones,
+                        compartido=args.compartido, formato=args.formato, dias_prestamo=args.dias_prestamo,
+                        descripciones_en_disco=args.descripciones_en_disco, procesos_carga=args.procesos_carga,
+                        eliminacion=args.eliminacion, claves_unicas=not args.permitir_duplicados)
+    if args.profile_startup:
+        mostrar_tiempos_arranque(app.tiempos_arranque, time.perf_counter() - inicio)
+    if app.metricas:
+        app.metricas.intervalo = args.intervalo_metricas
+    
+    codigo = 0
+    # Los cambios pendientes se guardan aunque la sesión termine por fin de
+    # la entrada, Ctrl+C o un error
+    try:
+        if args.script:
+            codigo = 1 if ejecutar_script(app, args.script, parser_script) else 0
+        elif args.comando:
+            respuesta = ejecutar_comando(app, args)
+            print(json.dumps(respuesta, ensure_ascii=False))
+            codigo = 0 if respuesta["ok"] else 1
+        else:
+            menu_principal(app)
+    except EOFError:
+        print()
+    except KeyboardInterrupt:
+        print()
+        codigo = 130
+    finally:
+        app.cerrar()
+    sys.exit(codigo)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,344 @@
+import io
+import sys
+import json
+import signal
+import asyncio
+import argparse
+import itertools
+import contextlib
+import urllib.parse
+import concurrent.futures
+
+from main import BibliotecaApp, serializar, informe_serializable
+
+# Servicio HTTP/JSON que permite a varios puestos de préstamo trabajar a la
+# vez sobre una única BibliotecaApp en memoria. Solo usa la biblioteca
+# estándar (asyncio).
+#
+# Uso:
+#   python servidor.py --datos data --puerto 8080
+#
+# Rutas:
+#   GET  /estado
+#   GET  /usuarios?desde=1&limite=100     GET  /usuarios?q=garcía     GET  /usuarios?email=...
+#   GET  /usuarios/ID                     POST /usuarios {"nombre", "email", "telefono"}
+#   GET  /usuarios/ID/prestamos          DELETE /usuarios/ID?politica=bloquear|cascada|baja
+#   GET  /libros?desde=1&limite=100       GET  /libros?q=sombra       GET  /libros?isbn=...
+#   GET  /libros/ID                       POST /libros {"titulo", "autor", "isbn", "descripcion"}
+#   GET  /libros/ID/prestamos            DELETE /libros/ID?politica=bloquear|cascada|baja
+#   GET  /prestamos?activos=1             GET  /prestamos?q=...
+#   GET  /prestamos?vencidos=1
+#   GET  /prestamos/ID                    POST /prestamos {"usuario_id", "libro_id", "fecha_prestamo", "fecha_vencimiento"}
+#                                         ("isbn" en lugar de "libro_id")
+#   POST /prestamos/ID/devolucion
+#   GET  /informes/TIPO?limite=10         TIPO: meses, libros, autores, usuarios o duracion
+#
+# BibliotecaApp no está pensada para usarse desde varios hilos, así que el
+# servicio sigue un modelo de actor: la aplicación se crea y se usa siempre
+# desde un único hilo propio, que ejecuta las peticiones de una en una y en
+# orden de llegada. El bucle de eventos sigue atendiendo conexiones mientras
+# ese hilo trabaja (por ejemplo, durante una escritura lenta), y como cada
+# petición se ejecuta completa antes de la siguiente, dos préstamos
+# simultáneos del mismo libro no pueden aceptarse los dos. Un solo hilo
+# también cumple el requisito de sqlite3 de usar la conexión en el hilo que
+# la creó.
+#
+# Los cambios se guardan de forma agrupada (--ventana-guardado, por defecto
+# 1 segundo, y --operaciones-guardado): la respuesta 201 o 200 de una
+# modificación se envía cuando el cambio ya está en memoria, pero puede
+# llegar al disco hasta esos segundos después. Si el proceso muere en ese
+# intervalo, el cambio se pierde aunque se haya confirmado. Con
+# --operaciones-guardado 1 cada cambio se guarda antes de responder.
+
+RAZONES = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 500: "Internal Server Error"}
+
+LIMITE_POR_DEFECTO = 100
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+class ServicioBiblioteca:
+    def __init__(self, app, hilo):
+        # hilo: ejecutor de un solo hilo en el que se creó la aplicación
+        self.app = app
+        self.hilo = hilo
+        self.peticiones = 0
+    
+    async def ejecutar(self, funcion, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.hilo, funcion, *args)
+    
+    # Lógica de cada ruta (se ejecuta en el hilo de la aplicación)
+    def despachar(self, metodo, ruta, cuerpo):
+        url = urllib.parse.urlsplit(ruta)
+        partes = [parte for parte in url.path.split("/") if parte]
+        consulta = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            datos = json.loads(cuerpo) if cuerpo else {}
+        except ValueError:
+            raise ErrorHTTP(400, "El cuerpo no es JSON válido.")
+        
+        if partes == ["estado"] and metodo == "GET":
+            return 200, self.estado()
+        if len(partes) == 2 and partes[0] == "informes" and metodo == "GET":
+            if partes[1] not in ("meses", "libros", "autores", "usuarios", "duracion"):
+                raise ErrorHTTP(404, "Informe no encontrado.")
+            return 200, informe_serializable(self.app, partes[1], self.entero(consulta.get("limite", 10), "limite"))
+        if not partes or partes[0] not in ("usuarios", "libros", "prestamos"):
+            raise ErrorHTTP(404, "Ruta no encontrada.")
+        coleccion = partes[0]
+        
+        if len(partes) == 1:
+            if metodo == "GET":
+                return 200, self.listar(coleccion, consulta)
+            if metodo == "POST":
+                return 201, self.crear(coleccion, datos)
+            raise ErrorHTTP(405, "Método no permitido.")
+        
+        id = self.entero(partes[1], "ID")
+        entidad = getattr(self.app, coleccion).obtener(id)
+        if entidad is None:
+            raise ErrorHTTP(404, "No encontrado.")
+        
+        if len(partes) == 2 and metodo == "GET":
+            return 200, serializar(entidad)
+        if len(partes) == 2 and metodo == "DELETE" and coleccion != "prestamos":
+            return 200, self.eliminar(coleccion, id, consulta.get("politica"))
+        if len(partes) == 3 and partes[2] == "prestamos" and coleccion != "prestamos" and metodo == "GET":
+            if coleccion == "usuarios":
+                activos, devueltos = self.app.prestamos_de_usuario(id)
+            else:
+                activos, devueltos = self.app.historial_de_libro(id)
+            return 200, {"activos": serializar(activos), "devueltos": serializar(devueltos)}
+        if len(partes) == 3 and partes[2] == "devolucion" and coleccion == "prestamos" and metodo == "POST":
+            if entidad.devuelto:
+                raise ErrorHTTP(409, "El préstamo ya está devuelto.")
+            self.app.devolver_libro(id)
+            return 200, serializar(self.app.obtener_prestamo_por_id(id))
+        raise ErrorHTTP(404, "Ruta no encontrada.")
+    
+    def estado(self):
+        return {
+            "usuarios": len(self.app.usuarios),
+            "libros": len(self.app.libros),
+            "prestamos": len(self.app.prestamos),
+            "prestamos_activos": len(self.app.vista_activos),
+            "peticiones": self.peticiones
+        }
+    
+    def entero(self, valor, nombre):
+        try:
+            return int(valor)
+        except (TypeError, ValueError):
+            raise ErrorHTTP(400, f"{nombre} debe ser un número entero.")
+    
+    def listar(self, coleccion, consulta):
+        desde = self.entero(consulta.get("desde", 1), "desde")
+        limite = self.entero(consulta.get("limite", LIMITE_POR_DEFECTO), "limite")
+        if "q" in consulta:
+            buscar = {"usuarios": self.app.buscar_usuario, "libros": self.app.buscar_libro,
+                      "prestamos": self.app.buscar_prestamo}[coleccion]
+            return serializar(buscar(consulta["q"], limite))
+        # Búsquedas exactas por email o ISBN: como mucho un resultado
+        if coleccion == "usuarios" and "email" in consulta:
+            usuario = self.app.obtener_usuario_por_email(consulta["email"])
+            return serializar([usuario] if usuario else [])
+        if coleccion == "libros" and "isbn" in consulta:
+            libro = self.app.obtener_libro_por_isbn(consulta["isbn"])
+            return serializar([libro] if libro else [])
+        if coleccion == "prestamos" and consulta.get("activos") in ("1", "true"):
+            return serializar(list(itertools.islice(self.app.iterar_prestamos_activos(desde), limite)))
+        if coleccion == "prestamos" and consulta.get("vencidos") in ("1", "true"):
+            return serializar(self.app.prestamos_vencidos()[:limite])
+        return serializar(list(itertools.islice(getattr(self.app, coleccion).iterar_desde(desde), limite)))
+    
+    def eliminar(self, coleccion, id, politica):
+        if politica is not None and politica not in BibliotecaApp.POLITICAS_ELIMINACION:
+            raise ErrorHTTP(400, f"politica debe ser una de: {', '.join(BibliotecaApp.POLITICAS_ELIMINACION)}.")
+        eliminar = self.app.eliminar_usuario if coleccion == "usuarios" else self.app.eliminar_libro
+        # El motivo de un rechazo (préstamos pendientes o historial) es el
+        # mensaje que imprime la aplicación
+        mensajes = io.StringIO()
+        with contextlib.redirect_stdout(mensajes):
+            eliminado = eliminar(id, politica)
+        if not eliminado:
+            raise ErrorHTTP(409, mensajes.getvalue().strip().removeprefix("Error: "))
+        return {"id": id}
+    
+    def crear(self, coleccion, datos):
+        if coleccion == "usuarios":
+            # Como en el menú y en la importación, nombre y email son obligatorios
+            if not datos.get("nombre") or not datos.get("email"):
+                raise ErrorHTTP(400, "Faltan el nombre o el email.")
+            existente = self.app.duplicado("usuarios", datos["email"])
+            if existente:
+                raise ErrorHTTP(409, f"El email ya es del usuario {existente.id}.")
+            return serializar(self.app.agregar_usuario(datos["nombre"], datos["email"], datos.get("telefono", "")))
+        
+        if coleccion == "libros":
+            if not datos.get("titulo") or not datos.get("autor"):
+                raise ErrorHTTP(400, "Faltan el título o el autor.")
+            existente = self.app.duplicado("libros", datos.get("isbn"))
+            if existente:
+                raise ErrorHTTP(409, f"El ISBN ya es del libro {existente.id}.")
+            return serializar(self.app.agregar_libro(datos["titulo"], datos["autor"],
+                                                     datos.get("isbn", ""), datos.get("descripcion", "")))
+        
+        # Las comprobaciones y el préstamo forman parte de la misma petición:
+        # ninguna otra puede ejecutarse entre ellas
+        usuario = self.app.obtener_usuario_por_id(self.entero(datos.get("usuario_id"), "usuario_id"))
+        if usuario is None:
+            raise ErrorHTTP(404, "Usuario no encontrado.")
+        if datos.get("isbn"):
+            libro = self.app.obtener_libro_por_isbn(datos["isbn"])
+        else:
+            libro = self.app.obtener_libro_por_id(self.entero(datos.get("libro_id"), "libro_id"))
+        if libro is None:
+            raise ErrorHTTP(404, "Libro no encontrado.")
+        if usuario.baja or libro.baja:
+            raise ErrorHTTP(409, f"El {'usuario' if usuario.baja else 'libro'} está dado de baja.")
+        if not libro.disponible:
+            raise ErrorHTTP(409, "El libro no está disponible.")
+        if self.app.tiene_vencidos(usuario.id):
+            raise ErrorHTTP(409, "El usuario tiene préstamos vencidos sin devolver.")
+        try:
+            prestamo = self.app.registrar_prestamo(usuario.id, libro.id, datos.get("fecha_prestamo"),
+                                                   datos.get("fecha_vencimiento"))
+        except ValueError as e:
+            raise ErrorHTTP(400, str(e))
+        return serializar(prestamo)
+    
+    async def procesar(self, metodo, ruta, cuerpo):
+        self.peticiones += 1
+        try:
+            return await self.ejecutar(self.despachar, metodo, ruta, cuerpo)
+        except ErrorHTTP as e:
+            return e.estado, {"error": str(e)}
+        except Exception as e:
+            print(f"Error al atender {metodo} {ruta}: {e}", file=sys.stderr)
+            return 500, {"error": "Error interno."}
+    
+    def sincronizar_si_vencido(self):
+        # Guardado agrupado: los cambios pendientes se escriben en cuanto
+        # vence su ventana aunque no lleguen más peticiones
+        if self.app.programador.vencido():
+            self.app.sincronizar()
+    
+    async def cerrar(self):
+        await self.ejecutar(self.app.cerrar)
+        self.hilo.shutdown()
+    
+    # Protocolo HTTP/1.1 mínimo, con conexiones persistentes
+    async def atender(self, lector, escritor):
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                try:
+                    metodo, ruta, version = linea.decode("latin-1").split()
+                except ValueError:
+                    await self.responder(escritor, 400, {"error": "Petición mal formada."}, True)
+                    break
+                
+                cabeceras = {}
+                while True:
+                    linea = await lector.readline()
+                    if linea in (b"\r\n", b"\n", b""):
+                        break
+                    nombre, _, valor = linea.decode("latin-1").partition(":")
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+                
+                longitud = int(cabeceras.get("content-length", 0) or 0)
+                cuerpo = await lector.readexactly(longitud) if longitud else b""
+                
+                estado, respuesta = await self.procesar(metodo.upper(), ruta, cuerpo)
+                cerrar = cabeceras.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                await self.responder(escritor, estado, respuesta, cerrar)
+                if cerrar:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            escritor.close()
+    
+    async def responder(self, escritor, estado, respuesta, cerrar):
+        cuerpo = json.dumps(respuesta, ensure_ascii=False).encode("utf-8")
+        escritor.write(
+            f"HTTP/1.1 {estado} {RAZONES[estado]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'close' if cerrar else 'keep-alive'}\r\n\r\n".encode("latin-1") + cuerpo
+        )
+        await escritor.drain()
+
+async def servir(servicio, host, puerto, ventana):
+    servidor = await asyncio.start_server(servicio.atender, host, puerto)
+    
+    parar = asyncio.Event()
+    bucle = asyncio.get_running_loop()
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            bucle.add_signal_handler(senal, parar.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C interrumpe asyncio.run directamente
+            pass
+    
+    direccion = servidor.sockets[0].getsockname()
+    print(f"Sirviendo en http://{direccion[0]}:{direccion[1]}", flush=True)
+    async with servidor:
+        while not parar.is_set():
+            try:
+                await asyncio.wait_for(parar.wait(), timeout=ventana)
+            except asyncio.TimeoutError:
+                await servicio.ejecutar(servicio.sincronizar_si_vencido)
+    await servicio.cerrar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP/JSON del Sistema de Gestión de Biblioteca")
+    parser.add_argument("--datos", default="data", help="directorio de datos")
+    parser.add_argument("--almacenamiento", choices=BibliotecaApp.ALMACENAMIENTOS, default="json")
+    parser.add_argument("--historial-en-disco", action="store_true")
+    parser.add_argument("--descripciones-en-disco", action="store_true")
+    parser.add_argument("--formato", choices=["json", "binario"], default="json",
+                        help="formato de las instantáneas que se escriben")
+    parser.add_argument("--dias-prestamo", type=int, metavar="DIAS", help="plazo de los préstamos en días")
+    parser.add_argument("--eliminacion", choices=BibliotecaApp.POLITICAS_ELIMINACION, default="bloquear",
+                        help="qué hacer al eliminar un usuario o libro con préstamos")
+    parser.add_argument("--permitir-duplicados", action="store_true",
+                        help="aceptar emails e ISBN ya registrados")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--ventana-guardado", type=float, default=1.0, metavar="SEGUNDOS",
+                        help="tiempo máximo que un cambio espera a guardarse junto con otros; las "
+                             "modificaciones se confirman antes de llegar al disco (por defecto 1)")
+    parser.add_argument("--operaciones-guardado", type=int, default=500, metavar="N",
+                        help="guardar en cuanto haya N operaciones pendientes; con 1 cada cambio "
+                             "se guarda antes de responder (por defecto 500)")
+    parser.add_argument("--metricas", metavar="ARCHIVO", help="medir las operaciones y volcarlas en ARCHIVO")
+    parser.add_argument("--procesos-carga", type=int, metavar="N",
+                        help="procesos que decodifican las instantáneas JSON al arrancar")
+    args = parser.parse_args()
+    
+    hilo = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="biblioteca")
+    app = hilo.submit(BibliotecaApp, directorio=args.datos, almacenamiento=args.almacenamiento,
+                      historial_en_disco=args.historial_en_disco, metricas=args.metricas, formato=args.formato,
+                      dias_prestamo=args.dias_prestamo, descripciones_en_disco=args.descripciones_en_disco,
+                      ventana_guardado=args.ventana_guardado,
+                      operaciones_guardado=args.operaciones_guardado,
+                      procesos_carga=args.procesos_carga, eliminacion=args.eliminacion,
+                      claves_unicas=not args.permitir_duplicados).result()
+    # Los índices de búsqueda se construyen antes de atender peticiones
+    # (las peticiones esperan en el hilo de la biblioteca hasta que acaba)
+    hilo.submit(app.preparar_busquedas)
+    servicio = ServicioBiblioteca(app, hilo)
+    try:
+        asyncio.run(servir(servicio, args.host, args.puerto, args.ventana_guardado))
+    except KeyboardInterrupt:
+        hilo.submit(app.cerrar).result()
+        hilo.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+from main import BibliotecaApp, serializar
+
+# Ida y vuelta por cada modo de almacenamiento: lo que se guarda en una
+# sesión es exactamente lo que carga la siguiente
+CONFIGURACIONES = [
+    {"almacenamiento": "json"},
+    {"almacenamiento": "json", "formato": "binario"},
+    {"almacenamiento": "json", "historial_en_disco": True, "descripciones_en_disco": True},
+    {"almacenamiento": "diario"},
+    {"almacenamiento": "diario", "historial_en_disco": True},
+    {"almacenamiento": "sqlite"},
+]
+
+def contenido(app):
+    return {tipo: serializar(list(getattr(app, tipo).iterar_desde(1)))
+            for tipo in ("usuarios", "libros", "prestamos")}
+
+class PruebasAlmacenamiento(unittest.TestCase):
+    def poblar(self, app):
+        ana = app.agregar_usuario("Ana García", "ana@example.com", "600000001")
+        luis = app.agregar_usuario("Luis Pérez", "luis@example.com", "")
+        borrado = app.agregar_usuario("Temporal", "temporal@example.com", "")
+        sombra = app.agregar_libro("La sombra del viento", "Carlos Ruiz Zafón", "978-84-08-04364-5",
+                                   "Barcelona, 1945.")
+        isla = app.agregar_libro("La isla del tesoro", "R. L. Stevenson", "", "")
+        app.agregar_libro("Rayuela", "Julio Cortázar", "978-84-376-0494-7", "Novela.")
+        
+        devuelto = app.registrar_prestamo(ana.id, sombra.id, "2024-01-10")
+        app.devolver_libro(devuelto.id)
+        app.registrar_prestamo(luis.id, sombra.id, "2024-02-01", "2024-02-20")
+        app.registrar_prestamo(ana.id, isla.id)
+        
+        app.actualizar_usuario(luis.id, "Luis Pérez Gil", "luis@example.com", "600000002")
+        app.eliminar_usuario(borrado.id)
+    
+    def test_ida_y_vuelta(self):
+        for opciones in CONFIGURACIONES:
+            with self.subTest(**opciones), tempfile.TemporaryDirectory() as directorio:
+                app = BibliotecaApp(directorio=directorio, **opciones)
+                self.poblar(app)
+                esperado = contenido(app)
+                app.cerrar()
+                
+                app = BibliotecaApp(directorio=directorio, **opciones)
+                try:
+                    self.assertEqual(contenido(app), esperado)
+                    self.assertEqual(len(app.listar_prestamos_activos()), 2)
+                    # Los IDs siguen por donde iban
+                    self.assertEqual(app.agregar_usuario("Nueva", "nueva@example.com", "").id, 4)
+                finally:
+                    app.cerrar()
+
+# Con historial_en_disco, un corte a mitad de escritura deja la última línea
+# de historial.jsonl incompleta; los préstamos archivados después deben
+# poder leerse
+class PruebasHistorial(unittest.TestCase):
+    def test_linea_incompleta(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            app = BibliotecaApp(directorio=directorio, historial_en_disco=True)
+            usuario = app.agregar_usuario("Ana", "ana@example.com", "")
+            libros = [app.agregar_libro(f"Libro {n}", "Autor", "", "").id for n in range(3)]
+            prestamos = [app.registrar_prestamo(usuario.id, libro_id).id for libro_id in libros]
+            app.devolver_libro(prestamos[0])
+            app.cerrar()
+            
+            # Simula el corte: el préstamo archivado queda a medias
+            ruta = os.path.join(directorio, "historial.jsonl")
+            with open(ruta, "r+b") as f:
+                f.truncate(os.path.getsize(ruta) - 10)
+            
+            app = BibliotecaApp(directorio=directorio, historial_en_disco=True)
+            app.devolver_libro(prestamos[1])
+            app.devolver_libro(prestamos[2])
+            app.cerrar()
+            
+            app = BibliotecaApp(directorio=directorio, historial_en_disco=True)
+            try:
+                for id in prestamos[1:]:
+                    prestamo = app.obtener_prestamo_por_id(id)
+                    self.assertIsNotNone(prestamo, id)
+                    self.assertTrue(prestamo.devuelto)
+                self.assertEqual(app.listar_prestamos_activos(), [])
+            finally:
+                app.cerrar()
+
+if __name__ == "__main__":
+    unittest.main()
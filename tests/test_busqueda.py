@@ -0,0 +1,61 @@
+import io
+import tempfile
+import unittest
+import contextlib
+
+from main import BibliotecaApp
+
+CONFIGURACIONES = [
+    {"almacenamiento": "json"},
+    {"almacenamiento": "json", "historial_en_disco": True},
+    {"almacenamiento": "sqlite"},
+]
+
+# Búsqueda de préstamos: los devueltos se encuentran igual que los activos
+class PruebasBusquedaPrestamos(unittest.TestCase):
+    def test_id_como_subcadena(self):
+        # Un número encuentra los préstamos cuyo ID lo contiene, también
+        # los devueltos (que no están en la vista de activos)
+        for opciones in CONFIGURACIONES:
+            with self.subTest(**opciones), tempfile.TemporaryDirectory() as directorio:
+                app = BibliotecaApp(directorio=directorio, **opciones)
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        usuario = app.agregar_usuario("Ana", "ana@example.com", "")
+                        for letra in "ABCDEFGHIJKL":
+                            libro = app.agregar_libro(f"Libro {letra}", "Autor", "", "")
+                            prestamo = app.registrar_prestamo(usuario.id, libro.id)
+                            if prestamo.id in (2, 12):
+                                app.devolver_libro(prestamo.id)
+                    self.assertEqual([fila[0].id for fila in app.buscar_prestamo("2")], [2, 12])
+                    self.assertEqual([fila[0].id for fila in app.buscar_prestamo("1")], [1, 10, 11, 12])
+                finally:
+                    app.cerrar()
+    
+    def test_dados_de_baja(self):
+        # Los préstamos de un usuario o un libro dado de baja se encuentran
+        # por su nombre o su título, tanto los activos como los devueltos
+        for opciones in CONFIGURACIONES:
+            with self.subTest(**opciones), tempfile.TemporaryDirectory() as directorio:
+                app = BibliotecaApp(directorio=directorio, **opciones)
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        ana = app.agregar_usuario("Ana", "ana@example.com", "")
+                        luis = app.agregar_usuario("Luis", "luis@example.com", "")
+                        sombra = app.agregar_libro("La sombra", "Autor", "", "")
+                        isla = app.agregar_libro("La isla", "Autor", "", "")
+                        devuelto = app.registrar_prestamo(ana.id, sombra.id)
+                        app.devolver_libro(devuelto.id)
+                        app.registrar_prestamo(ana.id, isla.id)
+                        app.registrar_prestamo(luis.id, sombra.id)
+                        app.eliminar_usuario(ana.id, "baja")
+                        app.eliminar_libro(sombra.id, "baja")
+                    self.assertEqual(app.buscar_usuario("ana"), [])
+                    self.assertEqual(app.buscar_libro("sombra"), [])
+                    self.assertEqual([fila[0].id for fila in app.buscar_prestamo("ana")], [1, 2])
+                    self.assertEqual([fila[0].id for fila in app.buscar_prestamo("sombra")], [1, 3])
+                finally:
+                    app.cerrar()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import io
+import tempfile
+import unittest
+import contextlib
+import multiprocessing
+
+from main import BibliotecaApp
+
+LIBROS = 20
+
+def prestar_todos(directorio, almacenamiento, usuario_id, barrera, resultados):
+    # Se ejecuta en otro proceso: intenta prestar todos los libros al usuario
+    app = BibliotecaApp(directorio=directorio, almacenamiento=almacenamiento, compartido=True)
+    prestados = []
+    barrera.wait()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for libro_id in range(1, LIBROS + 1):
+            if app.registrar_prestamo(usuario_id, libro_id):
+                prestados.append(libro_id)
+    app.cerrar()
+    resultados.put(prestados)
+
+def modificar(directorio, almacenamiento):
+    # Se ejecuta en otro proceso: una devolución, un préstamo nuevo y
+    # cambios en un usuario y un libro con préstamos activos
+    app = BibliotecaApp(directorio=directorio, almacenamiento=almacenamiento, compartido=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.devolver_libro(1)
+        app.registrar_prestamo(1, 3, "2024-03-01")
+        app.actualizar_usuario(2, "Bea Gil", "usuario2@example.com", "")
+        app.actualizar_libro(2, "Otro título", "Autor", "", "")
+    app.cerrar()
+
+def resumen(app):
+    activos = [(prestamo.id, usuario.nombre, libro.titulo) for prestamo, usuario, libro in app.listar_prestamos_activos()]
+    informes = (app.prestamos_por_mes(), app.duracion_media_prestamos(),
+                [(usuario.nombre, n) for usuario, n in app.usuarios_mas_activos()],
+                [(libro.titulo, n) for libro, n in app.libros_mas_prestados()])
+    return activos, informes
+
+# Dos procesos con --compartido sobre el mismo directorio de datos no
+# pueden prestar dos veces el mismo ejemplar
+class PruebasCompartido(unittest.TestCase):
+    def test_prestamos_simultaneos(self):
+        for almacenamiento in ("json", "diario", "sqlite"):
+            with self.subTest(almacenamiento=almacenamiento), tempfile.TemporaryDirectory() as directorio:
+                app = BibliotecaApp(directorio=directorio, almacenamiento=almacenamiento)
+                usuarios = [app.agregar_usuario(f"Usuario {n}", f"usuario{n}@example.com", "").id for n in (1, 2)]
+                for n in range(LIBROS):
+                    app.agregar_libro(f"Libro {n}", "Autor", "", "")
+                app.cerrar()
+                
+                barrera = multiprocessing.Barrier(len(usuarios))
+                resultados = multiprocessing.Queue()
+                procesos = [multiprocessing.Process(target=prestar_todos,
+                                                    args=(directorio, almacenamiento, usuario_id, barrera, resultados))
+                            for usuario_id in usuarios]
+                for proceso in procesos:
+                    proceso.start()
+                prestados = [resultados.get(timeout=60) for _ in procesos]
+                for proceso in procesos:
+                    proceso.join(60)
+                    self.assertEqual(proceso.exitcode, 0)
+                
+                # Cada libro se prestó exactamente una vez entre los dos procesos
+                self.assertEqual(sorted(prestados[0] + prestados[1]), list(range(1, LIBROS + 1)))
+                
+                app = BibliotecaApp(directorio=directorio, almacenamiento=almacenamiento)
+                try:
+                    activos = app.listar_prestamos_activos()
+                    self.assertEqual(sorted(fila[0].libro_id for fila in activos), list(range(1, LIBROS + 1)))
+                    self.assertFalse(any(libro.disponible for libro in app.libros.iterar_desde(1)))
+                finally:
+                    app.cerrar()
+    
+    def test_cambios_de_otro_proceso(self):
+        # La vista de préstamos activos y los informes de un proceso reflejan
+        # lo que otro proceso cambió, igual que si se cargaran de cero
+        for almacenamiento in ("json", "diario", "sqlite"):
+            with self.subTest(almacenamiento=almacenamiento), tempfile.TemporaryDirectory() as directorio:
+                app = BibliotecaApp(directorio=directorio, almacenamiento=almacenamiento, compartido=True)
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        for n in (1, 2):
+                            app.agregar_usuario(f"Usuario {n}", f"usuario{n}@example.com", "")
+                        for n in (1, 2, 3):
+                            app.agregar_libro(f"Libro {n}", "Autor", "", "")
+                        app.registrar_prestamo(1, 1, "2024-01-10")
+                        app.registrar_prestamo(2, 2, "2024-02-01")
+                    resumen(app)
+                    
+                    proceso = multiprocessing.Process(target=modificar, args=(directorio, almacenamiento))
+                    proceso.start()
+                    proceso.join(60)
+                    self.assertEqual(proceso.exitcode, 0)
+                    
+                    app.refrescar()
+                    nueva = BibliotecaApp(directorio=directorio, almacenamiento=almacenamiento)
+                    try:
+                        esperado = resumen(nueva)
+                    finally:
+                        nueva.cerrar()
+                    self.assertEqual(resumen(app), esperado)
+                    self.assertEqual(esperado[0], [(2, "Bea Gil", "Otro título"), (3, "Usuario 1", "Libro 3")])
+                finally:
+                    app.cerrar()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+
+from main import BibliotecaApp
+
+# Un corte a mitad de escritura deja la última línea del diario incompleta.
+# Los registros que se añadan después no pueden quedar pegados a ella.
+class PruebasDiario(unittest.TestCase):
+    def test_linea_incompleta(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            app = BibliotecaApp(directorio=directorio, almacenamiento="diario")
+            app.agregar_usuario("Ana", "a@example.com", "")
+            app.agregar_usuario("Bea", "b@example.com", "")
+            app.almacenamiento.diario.cerrar()
+            
+            # Simula el corte: el último registro queda a medias
+            ruta = os.path.join(directorio, "diario.jsonl")
+            with open(ruta, "r+b") as f:
+                f.truncate(os.path.getsize(ruta) - 10)
+            
+            app = BibliotecaApp(directorio=directorio, almacenamiento="diario")
+            self.assertEqual([u.nombre for u in app.usuarios.iterar_desde(1)], ["Ana"])
+            app.agregar_usuario("Carlos", "c@example.com", "")
+            app.agregar_usuario("Dora", "d@example.com", "")
+            app.almacenamiento.diario.cerrar()
+            
+            app = BibliotecaApp(directorio=directorio, almacenamiento="diario")
+            try:
+                self.assertEqual([u.nombre for u in app.usuarios.iterar_desde(1)], ["Ana", "Carlos", "Dora"])
+            finally:
+                app.cerrar()
+
+if __name__ == "__main__":
+    unittest.main()
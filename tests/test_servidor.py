@@ -0,0 +1,61 @@
+import json
+import asyncio
+import tempfile
+import unittest
+import concurrent.futures
+
+from main import BibliotecaApp
+from servidor import ServicioBiblioteca
+
+# Pruebas de las rutas del servicio HTTP, sin abrir ningún puerto: las
+# peticiones se pasan directamente a ServicioBiblioteca.procesar
+class PruebasServidor(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.hilo = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.app = self.hilo.submit(BibliotecaApp, directorio=self.directorio.name).result()
+        self.servicio = ServicioBiblioteca(self.app, self.hilo)
+        self.usuario = self.app.agregar_usuario("Ana", "ana@example.com", "")
+        self.libro = self.app.agregar_libro("La sombra", "García", "", "")
+    
+    def tearDown(self):
+        asyncio.run(self.servicio.cerrar())
+        self.directorio.cleanup()
+    
+    def pedir(self, metodo, ruta, datos=None):
+        cuerpo = json.dumps(datos).encode("utf-8") if datos is not None else b""
+        return asyncio.run(self.servicio.procesar(metodo, ruta, cuerpo))
+    
+    def test_prestamo_con_fecha_no_valida(self):
+        for fecha in ("2024-13-45", "ayer", 20240101):
+            estado, respuesta = self.pedir("POST", "/prestamos", {
+                "usuario_id": self.usuario.id, "libro_id": self.libro.id, "fecha_prestamo": fecha})
+            self.assertEqual(estado, 400, fecha)
+            self.assertIn("Fecha no válida", respuesta["error"])
+        self.assertTrue(self.libro.disponible)
+        self.assertEqual(self.app.listar_prestamos_activos(), [])
+    
+    def test_prestamo_con_fecha_valida(self):
+        estado, respuesta = self.pedir("POST", "/prestamos", {
+            "usuario_id": self.usuario.id, "libro_id": self.libro.id,
+            "fecha_prestamo": "2024-02-01", "fecha_vencimiento": "2024-02-20"})
+        self.assertEqual(estado, 201)
+        self.assertEqual(respuesta["fecha_vencimiento"], "2024-02-20")
+        
+        estado, respuesta = self.pedir("POST", "/prestamos", {
+            "usuario_id": self.usuario.id, "libro_id": self.libro.id})
+        self.assertEqual(estado, 409)
+    
+    def test_usuario_sin_email(self):
+        for datos in ({"nombre": "Luis"}, {"nombre": "Luis", "email": ""}, {"email": "luis@example.com"}):
+            estado, respuesta = self.pedir("POST", "/usuarios", datos)
+            self.assertEqual(estado, 400, datos)
+            self.assertIn("Faltan el nombre o el email", respuesta["error"])
+        self.assertEqual(len(self.app.usuarios), 1)
+        
+        estado, respuesta = self.pedir("POST", "/usuarios", {"nombre": "Luis", "email": "luis@example.com"})
+        self.assertEqual(estado, 201)
+        self.assertEqual(respuesta["email"], "luis@example.com")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import time
+import signal
+import tempfile
+import unittest
+import threading
+import subprocess
+
+from main import parametros_guardado
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+# Menú: Gestión de Usuarios > Agregar usuario, sin volver al menú principal
+AGREGAR_USUARIO = "1\n3\nAna\nana@example.com\n600000001\n"
+
+# Una sesión del menú que termina sin pasar por "Salir" (fin de la entrada
+# o Ctrl+C) guarda igualmente los cambios, también los agrupados
+class PruebasSesion(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.directorio.cleanup()
+    
+    def iniciar(self, datos, *opciones):
+        entorno = dict(os.environ, PYTHONIOENCODING="utf-8")
+        return subprocess.Popen([sys.executable, "-u", MAIN, "--datos", datos, *opciones],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=entorno)
+    
+    def usuarios_guardados(self, datos):
+        with open(os.path.join(datos, "usuarios.json"), encoding="utf-8") as f:
+            return [usuario["email"] for usuario in json.load(f)]
+    
+    def test_fin_de_la_entrada(self):
+        for numero, opciones in enumerate(([], ["--operaciones-guardado", "50"])):
+            with self.subTest(opciones=opciones):
+                datos = os.path.join(self.directorio.name, f"data{numero}")
+                proceso = self.iniciar(datos, *opciones)
+                salida, errores = proceso.communicate(AGREGAR_USUARIO.encode("utf-8"), timeout=60)
+                self.assertEqual(proceso.returncode, 0, errores.decode("utf-8"))
+                self.assertEqual(self.usuarios_guardados(datos), ["ana@example.com"])
+    
+    @unittest.skipUnless(os.name == "posix", "requiere señales POSIX")
+    def test_ctrl_c(self):
+        datos = os.path.join(self.directorio.name, "data")
+        proceso = self.iniciar(datos, "--operaciones-guardado", "50")
+        salida = bytearray()
+        
+        def leer():
+            for bloque in iter(lambda: proceso.stdout.read1(4096), b""):
+                salida.extend(bloque)
+        
+        lector = threading.Thread(target=leer)
+        lector.start()
+        try:
+            proceso.stdin.write(AGREGAR_USUARIO.encode("utf-8"))
+            proceso.stdin.flush()
+            # Esperar a que el usuario esté agregado (en memoria) antes de interrumpir
+            limite = time.monotonic() + 60
+            while b"Usuario agregado" not in salida and time.monotonic() < limite:
+                time.sleep(0.05)
+            proceso.send_signal(signal.SIGINT)
+            self.assertEqual(proceso.wait(timeout=60), 130)
+        finally:
+            if proceso.poll() is None:
+                proceso.kill()
+            lector.join()
+            proceso.stdin.close()
+            proceso.stdout.close()
+            proceso.stderr.close()
+        self.assertEqual(self.usuarios_guardados(datos), ["ana@example.com"])
+
+# Opciones de guardado agrupado del menú y de los comandos
+class PruebasParametrosGuardado(unittest.TestCase):
+    def test_menu(self):
+        self.assertEqual(parametros_guardado(None, None, True), (None, 1))
+        self.assertEqual(parametros_guardado(None, 50, True), (None, 50))
+        # Solo la ventana: los cambios no se guardan uno a uno
+        self.assertEqual(parametros_guardado(5.0, None, True), (5.0, sys.maxsize))
+        self.assertEqual(parametros_guardado(5.0, 50, True), (5.0, 50))
+    
+    def test_comandos(self):
+        self.assertEqual(parametros_guardado(None, None, False), (None, sys.maxsize))
+        self.assertEqual(parametros_guardado(5.0, None, False), (5.0, sys.maxsize))
+
+if __name__ == "__main__":
+    unittest.main()